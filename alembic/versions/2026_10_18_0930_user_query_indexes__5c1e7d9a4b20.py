@@ -0,0 +1,44 @@
+"""user query indexes
+
+Revision ID: 5c1e7d9a4b20
+Revises: 2fa604e791f3
+Create Date: 2026-10-18 09:30:12.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7d9a4b20'
+down_revision = '2fa604e791f3'
+branch_labels = None
+depends_on = None
+
+# name, columns or expressions, partial index predicate; see `User.__table_args__`
+INDEXES = [
+    ('ix_user_session_at', ['session_at'], None),
+    ('ix_user_created_at_id', ['created_at', 'id'], None),
+    ('ix_user_signup_by_created_at_id', ['signup_by', 'created_at', 'id'], None),
+    ('ix_user_unverified_created_at_id', ['created_at', 'id'], 'activated IS false'),
+    ('ix_user_lower_full_name', [sa.text('lower(full_name) text_pattern_ops')], None),
+    ('ix_user_lower_email', [sa.text('lower(email) text_pattern_ops')], None),
+]
+
+
+def upgrade():
+    # built concurrently, so that the logins and sign-ups are not blocked meanwhile;
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(
+                name, 'user', columns, unique=False,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='user', postgresql_concurrently=True)
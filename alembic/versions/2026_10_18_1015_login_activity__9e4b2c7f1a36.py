@@ -0,0 +1,40 @@
+"""login activity
+
+Revision ID: 9e4b2c7f1a36
+Revises: 5c1e7d9a4b20
+Create Date: 2026-10-18 10:15:47.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b2c7f1a36'
+down_revision = '5c1e7d9a4b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_events',
+                    sa.Column('id', sa.BigInteger(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('logged_at', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_login_events_logged_at_user_id', 'login_events', ['logged_at', 'user_id'], unique=False)
+    op.create_table('daily_activity',
+                    sa.Column('day', sa.Date(), nullable=False),
+                    sa.Column('active_users', sa.Integer(), nullable=False),
+                    sa.Column('logins', sa.Integer(), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('day')
+                    )
+
+
+def downgrade():
+    op.drop_table('daily_activity')
+    op.drop_index('ix_login_events_logged_at_user_id', table_name='login_events')
+    op.drop_table('login_events')
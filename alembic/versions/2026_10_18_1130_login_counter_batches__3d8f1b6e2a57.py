@@ -0,0 +1,30 @@
+"""login counter batches
+
+Revision ID: 3d8f1b6e2a57
+Revises: 9e4b2c7f1a36
+Create Date: 2026-10-18 11:30:12.406215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8f1b6e2a57'
+down_revision = '9e4b2c7f1a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_counter_batches',
+                    sa.Column('id', sa.String(length=32), nullable=False),
+                    sa.Column('applied_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_login_counter_batches_applied_at', 'login_counter_batches', ['applied_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_login_counter_batches_applied_at', table_name='login_counter_batches')
+    op.drop_table('login_counter_batches')
@@ -1,21 +1,28 @@
+import time
 from typing import AsyncGenerator, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import schemas
 from app.core import security
 from app.core.config import settings
 from app.db.models.user import User
+from app.db.adapters.user.user import get_user_by_id
 from app.db.session import async_session
 from app.utils import RedisClient
+from app.utils.cache import LRUCache, CacheInvalidator
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="auth/access-token")
 
+# verified access token claims, keyed by `security.token_digest(token)`
+token_cache = CacheInvalidator.register(
+    LRUCache("tokens", max_size=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS)
+)
+
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session() as session:
@@ -32,6 +39,28 @@ async def get_current_token(
 async def get_current_user(
     session: AsyncSession = Depends(get_session), token: str = Depends(reusable_oauth2)
 ) -> User:
+    token_data = await get_token_payload(token)
+
+    user: Optional[User] = await get_user_by_id(session, token_data.sub)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+async def get_token_payload(token: str) -> schemas.TokenPayload:
+    """ Validate an access token, served from `token_cache` once it has been validated
+
+    A cached entry never outlives the token `exp`, and `revoke_tokens` evicts it in every worker.
+    """
+    digest = security.token_digest(token)
+    token_data: Optional[schemas.TokenPayload] = token_cache.get(digest)
+    if token_data is not None:
+        return token_data
+
+    # an eviction received while the token is checked may be this token's revocation: then it is not cached
+    invalidations = token_cache.invalidations
+
     # validate token first!
     if await token_revoked(token):
         raise HTTPException(
@@ -50,16 +79,18 @@ async def get_current_user(
             detail="Could not validate credentials",
         )
 
-    result = await session.execute(select(User).where(User.id == token_data.sub))
-    user: Optional[User] = result.scalars().first()
+    if "exp" in payload and token_cache.invalidations == invalidations:
+        token_cache.set(digest, token_data, ttl=payload["exp"] - time.time())
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return token_data
 
 
 async def token_revoked(access_token: str) -> bool:
-    if await RedisClient.get(access_token) is None:
-        return True
+    if await RedisClient.get(access_token, replica=True) is not None:
+        return False
+
+    # a replica may not have caught up with a login yet; only the master can tell the token is gone
+    if RedisClient.replica_client is not None and await RedisClient.get(access_token) is not None:
+        return False
 
-    return False
+    return True
@@ -4,7 +4,6 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt
 from pydantic import ValidationError
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import schemas
@@ -12,8 +11,9 @@ from app.api import deps
 from app.core import security
 from app.core.config import settings
 from app.db.models.user import User
+from app.db.adapters.user.user import get_user_by_id
 from app.api.v1.endpoints.auth.service import (
-    validate_user, update_login_counter, store_tokens, revoke_tokens, valid_refresh_token
+    validate_user, update_login_counter, store_tokens, revoke_tokens, store_refreshed_tokens
 )
 
 router = APIRouter()
@@ -75,13 +75,6 @@ async def refresh_token(
     """
     OAuth2 compatible token, get an access token for future requests using refresh token
     """
-    # validate if the refresh token valid or not
-    if not await valid_refresh_token(input.refresh_token):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Invalidated/Invalid refresh token",
-        )
-
     try:
         payload = jwt.decode(
             input.refresh_token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -97,14 +90,21 @@ async def refresh_token(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    result = await session.execute(select(User).where(User.id == token_data.sub))
-    user: Optional[User] = result.scalars().first()
+    user: Optional[User] = await get_user_by_id(session, token_data.sub)
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     access_token, expire_at = security.create_access_token(user.id)
     refresh_token, refresh_expire_at = security.create_refresh_token(user.id)
+
+    # validate if the refresh token valid or not, and store the new tokens in the same round-trip
+    if not await store_refreshed_tokens(input.refresh_token, access_token, refresh_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalidated/Invalid refresh token",
+        )
+
     return {
         "token_type": "bearer",
         "access_token": access_token,
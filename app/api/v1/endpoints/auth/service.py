@@ -1,4 +1,5 @@
 from typing import Optional
+from functools import partial
 import logging
 
 from fastapi import HTTPException
@@ -8,13 +9,35 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core import security
 from app.core.config import settings
+from app.db.adapters.user.user import save_rehashed_password, update_session_login
 from app.db.models.user import User
-from app.utils import RedisClient
-from datetime import datetime
+from app.utils import RedisClient, PasswordHasher
+from app.utils.cache import CacheInvalidator
+from app.api.deps import token_cache
 from app.api.v1.endpoints.auth.utils import AuthErrMessage
 
 L = logging.getLogger("uvicorn.error")
 
+# KEYS[1]: access token; deletes it and the refresh token it points to
+REVOKE_TOKENS_SCRIPT = """
+local refresh_token = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+if refresh_token then
+    redis.call('DEL', refresh_token)
+end
+return refresh_token
+"""
+
+# KEYS[1]: current refresh token, KEYS[2]/KEYS[3]: new access/refresh token; ARGV: their expiry in seconds
+STORE_REFRESHED_TOKENS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('SET', KEYS[2], KEYS[3], 'EX', ARGV[1])
+redis.call('SET', KEYS[3], KEYS[2], 'EX', ARGV[2])
+return 1
+"""
+
 
 async def validate_user(
     session: AsyncSession, form_data: OAuth2PasswordRequestForm
@@ -24,9 +47,15 @@ async def validate_user(
     if user is None:
         raise HTTPException(status_code=400, detail=AuthErrMessage.INCORRECT_EMAIL_PASSWORD.value)
 
-    if not security.verify_password(form_data.password, user.hashed_password):  # type: ignore
+    if not await PasswordHasher.verify(form_data.password, user.hashed_password):  # type: ignore
         raise HTTPException(status_code=400, detail=AuthErrMessage.INCORRECT_EMAIL_PASSWORD.value)
 
+    # move an outdated hash to the current cost, without delaying this login
+    if security.password_needs_rehash(user.hashed_password):
+        PasswordHasher.rehash_in_background(
+            form_data.password, user.hashed_password, partial(save_rehashed_password, user)
+        )
+
     # validate whether the account has been activated or inactive
     if not user.activated:
         raise HTTPException(status_code=400, detail=AuthErrMessage.INACTIVE_USER.value)
@@ -39,16 +68,8 @@ async def update_login_counter(
 ) -> User:
     """ Update login counter for each successful login """
 
-    # since login success, log the total number of logins (`total_login`)
-    if user.total_login is None:
-        user.total_login = 1
-    else:
-        user.total_login += 1
-        user.session_at = datetime.utcnow()
-
-    session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    # since login success, log the total number of logins (`total_login`) and the last session
+    await update_session_login(user, session)
 
     return user
 
@@ -57,33 +78,42 @@ async def store_tokens(
     access_token: str,
     refresh_token: str,
 ) -> None:
-    # store the information into redis storage
-    ac_exp_in_secs = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
-    await RedisClient.set(access_token, refresh_token, ac_exp_in_secs)
-    rc_exp_in_secs = settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60
-    await RedisClient.set(refresh_token, access_token, rc_exp_in_secs)
+    # store the information into redis storage, both keys in one round-trip
+    await RedisClient.set_many({
+        access_token: (refresh_token, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+        refresh_token: (access_token, settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60),
+    })
 
 
 async def revoke_tokens(
     access_token: str,
 ) -> None:
-    # first, get refresh token from the provided access_token
-    refresh_token = await RedisClient.get(access_token)
-
-    # revoke access_token -> Delete from redis
-    await RedisClient.delete(access_token)
+    # revoke access_token and the refresh_token it points to -> Delete from redis, in one round-trip
+    await RedisClient.run_script(REVOKE_TOKENS_SCRIPT, keys=[access_token])
 
-    # revoke refresh_token -> Delete from redis
-    await RedisClient.delete(refresh_token)
+    # finally, drop the verified claims cached by every worker
+    await CacheInvalidator.invalidate(token_cache.name, security.token_digest(access_token))
 
 
-async def valid_refresh_token(refresh_token: str) -> bool:
-    # # TODO: Fix unittest for RedisCache
-    # if settings.ENVIRONMENT != "PYTEST":
-    # 	if await RedisClient.get(refresh_token) is None:
-    # 		return False
-
-    if await RedisClient.get(refresh_token) is None:
-        return False
-
-    return True
+async def store_refreshed_tokens(
+    refresh_token: str,
+    new_access_token: str,
+    new_refresh_token: str,
+) -> bool:
+    """ Store a new pair of tokens, as long as the refresh token they are issued from is still valid
+
+    The validity check and both writes are done atomically in one round-trip.
+
+    :param refresh_token: refresh token sent by the client
+    :param new_access_token:
+    :param new_refresh_token:
+    :return: whether the refresh token is valid (i.e. stored, not revoked nor expired)
+    """
+    stored = await RedisClient.run_script(
+        STORE_REFRESHED_TOKENS_SCRIPT,
+        keys=[refresh_token, new_access_token, new_refresh_token],
+        args=[settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, settings.REFRESH_TOKEN_EXPIRE_MINUTES * 60],
+    )
+
+    # as before, an unreachable Redis does not invalidate the refresh token
+    return stored is False or stored == 1
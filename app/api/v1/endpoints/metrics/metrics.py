@@ -0,0 +1,36 @@
+from typing import Dict
+
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.db.models.user import User
+from app.db.adapters.activity.rollup import ActivityRollup
+from app.db.adapters.user.cache import UserCache
+from app.db.adapters.user.login_counter import LoginCounter
+from app.db.session import pool_stats
+from app.utils import PasswordHasher, RedisClient
+from app.utils.cache import CacheInvalidator
+from app.utils.email_queue import EmailQueue
+from app.utils.social_login.http_client import SocialLoginHTTP
+
+router = APIRouter()
+
+
+@router.get("", response_model=Dict)
+async def read_metrics(
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Live load, latency and hit ratio metrics of the shared pools and caches. Only for logged users.
+    """
+    return {
+        "password_hasher": PasswordHasher.stats(),
+        "redis_pool": RedisClient.pool_stats(),
+        "database_pool": pool_stats(),
+        "caches": CacheInvalidator.stats(),
+        "user_cache": UserCache.stats(),
+        "login_counter": LoginCounter.stats(),
+        "activity_rollup": ActivityRollup.stats(),
+        "email_queue": EmailQueue.stats(),
+        "social_login_http": SocialLoginHTTP.stats(),
+    }
@@ -1,24 +1,37 @@
-from typing import List, Mapping
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
 from fastapi import HTTPException, status
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.models.user import User
+from app.db.models.user import SignupBy, User
+from app.db.adapters.user.user import USER_LIST_COLUMNS, count_all_users
+from app.db.schemas import ExportParams, QueryParams
+from app.db.session import async_session
 from sqlalchemy.exc import IntegrityError
 from app.core.utils import get_pgsql_integrity_error_msg
 from app.exceptions import ErrorMessage
-from sqlalchemy.sql import text
+import base64
+import csv
+import io
+import json
 import logging
 
 L = logging.getLogger("uvicorn.error")
 
+# rows fetched per round trip of the export cursor, and written per chunk of the export response
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
 
 async def insert(
     user: User,
     session: AsyncSession,
 ) -> None:
     try:
+        # the primary key and the column defaults are set on `user` by the flush, and kept by the commit
+        # (`expire_on_commit=False`): no refresh needed
         session.add(user)
         await session.commit()
-        await session.refresh(user)
     except IntegrityError as err:
         await session.rollback()
         raise HTTPException(
@@ -34,25 +47,106 @@ async def insert(
         )
 
 
-async def build_where_by(activated: bool, signup_by: str) -> str:
-    where_by = "1 = 1"
+async def build_where_by(activated: Optional[bool], signup_by: Optional[SignupBy]) -> List:
+    """ Build the filters, as SQL expressions with bound parameters """
+    where_by = []
 
     if activated is not None:
-        opt = "NOT" if not activated else ""
-        where_by += f" and activated IS {opt} TRUE"
+        where_by.append(User.activated.is_(activated))
 
     if signup_by is not None:
-        where_by += f" and signup_by = '{signup_by}'"
+        where_by.append(User.signup_by == signup_by.value)
 
     return where_by
 
 
-async def get_all_users(
-    session: AsyncSession, activated: bool, signup_by: str
-) -> List[Mapping]:
-    # build where_by
-    where_by = await build_where_by(activated, signup_by)
+def encode_cursor(created_at: datetime, user_id: int) -> str:
+    """ Opaque cursor pointing right after the given (last) user of a page """
+    data = json.dumps([created_at.isoformat(), user_id]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, user_id = json.loads(data)
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ErrorMessage.INVALID_CURSOR.value,
+        )
+
+
+async def get_all_users(session: AsyncSession, params: QueryParams) -> Dict:
+    """ One page of users matching the filters, newest first
+
+    Keyset pagination on (`created_at`, `id`): a page costs the same whatever its depth, and rows inserted
+    meanwhile neither shift nor repeat the following pages.
+
+    :param session:
+    :param params:
+    :return: the fields of `UserAll`
+    """
+    where_by = await build_where_by(params.activated, params.signup_by)
+
+    query = select(*USER_LIST_COLUMNS).where(*where_by)
+    if params.cursor is not None:
+        created_at, user_id = decode_cursor(params.cursor)
+        query = query.where(tuple_(User.created_at, User.id) < tuple_(created_at, user_id))
+
+    # one extra row tells whether there is a next page
+    query = query.order_by(User.created_at.desc(), User.id.desc()).limit(params.limit + 1)
+    result = await session.execute(query)
+    users = result.mappings().all()
+
+    next_cursor = None
+    if len(users) > params.limit:
+        users = users[:params.limit]
+        next_cursor = encode_cursor(users[-1]["created_at"], users[-1]["id"])
+
+    total, total_estimated = await count_all_users(session, where_by, params.count)
+
+    return {
+        "total": total,
+        "total_estimated": total_estimated,
+        "next_cursor": next_cursor,
+        "data": users,
+    }
+
+
+async def export_users(params: ExportParams) -> AsyncIterator[str]:
+    """ Stream the users matching the filters, as NDJSON or CSV chunks
+
+    The rows come from a server-side cursor, one batch at a time, and each batch is only fetched once the previous
+    chunk has been sent: memory stays flat whatever the number of users, and a slow client slows the export down
+    rather than filling the buffers. Runs while the response is being sent, hence it opens its own session.
+
+    :param params:
+    :return:
+    """
+    where_by = await build_where_by(params.activated, params.signup_by)
+    query = select(*USER_LIST_COLUMNS).where(*where_by).order_by(User.id)
+    columns = [column.key for column in USER_LIST_COLUMNS]
+
+    async with async_session() as session:
+        result = await session.stream(query.execution_options(max_row_buffer=EXPORT_BATCH_SIZE))
+
+        if params.format == "csv":
+            yield _to_csv([columns])
+
+        async for rows in result.partitions(EXPORT_BATCH_SIZE):
+            if params.format == "csv":
+                yield _to_csv(rows)
+            else:
+                yield "".join(json.dumps(dict(zip(columns, row)), default=_to_json) + "\n" for row in rows)
+
+
+def _to_csv(rows: Iterable) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
 
-    result = await session.execute(text(f"SELECT * FROM public.user WHERE {where_by}"))
-    results_as_dict = result.mappings().all()
-    return results_as_dict
+def _to_json(value: datetime) -> str:
+    return value.isoformat()
@@ -1,13 +1,15 @@
 from fastapi import (
     APIRouter, Depends
 )
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db import schemas
 from app.db.models import user as models
 from app.api import deps
-from app.api.v1.endpoints.users.service import insert
-from app.core.security import get_password_hash
+from app.api.v1.endpoints.users.service import insert, get_all_users, export_users, EXPORT_MEDIA_TYPES
+from app.db.adapters.user.user import update_user
+from app.utils import PasswordHasher
 
 router = APIRouter()
 
@@ -20,7 +22,7 @@ async def create_user(
     """
     Create new user. Only for logged users.
     """
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await PasswordHasher.hash(user_create.password)
     new_user = models.User(
         email=user_create.email, hashed_password=hashed_password, full_name=user_create.full_name
     )
@@ -31,6 +33,33 @@ async def create_user(
     return new_user
 
 
+@router.get("", response_model=schemas.UserAll)
+async def read_users(
+    params: schemas.QueryParams = Depends(schemas.query_params),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: models.User = Depends(deps.get_current_user),
+):
+    """
+    List users, newest first, page by page: pass `next_cursor` as `cursor` to get the next page. Only for logged users.
+    """
+    return await get_all_users(session, params)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_all_users(
+    params: schemas.ExportParams = Depends(schemas.export_params),
+    current_user: models.User = Depends(deps.get_current_user),
+):
+    """
+    Export every user matching the filters, streamed as NDJSON or CSV. Only for logged users.
+    """
+    return StreamingResponse(
+        export_users(params),
+        media_type=EXPORT_MEDIA_TYPES[params.format],
+        headers={"Content-Disposition": f'attachment; filename="users.{params.format}"'},
+    )
+
+
 @router.put("/me", response_model=schemas.User)
 async def update_user_me(
     user_update: schemas.UserUpdate,
@@ -40,16 +69,15 @@ async def update_user_me(
     """
     Update current user.
     """
+    values = {}
     if user_update.password is not None:
-        current_user.hashed_password = get_password_hash(user_update.password)  # type: ignore
+        values["hashed_password"] = await PasswordHasher.hash(user_update.password)
     if user_update.full_name is not None:
-        current_user.full_name = user_update.full_name  # type: ignore
+        values["full_name"] = user_update.full_name
     if user_update.email is not None:
-        current_user.email = user_update.email  # type: ignore
+        values["email"] = user_update.email
 
-    session.add(current_user)
-    await session.commit()
-    await session.refresh(current_user)
+    await update_user(session, current_user, **values)
 
     return current_user
 
@@ -20,7 +20,7 @@ See https://pydantic-docs.helpmanual.io/usage/settings/
 """
 
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 import toml
 from pydantic import AnyHttpUrl, AnyUrl, BaseSettings, EmailStr, validator
@@ -49,6 +49,49 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_MINUTES: int
     BACKEND_CORS_ORIGINS: Union[str, List[AnyHttpUrl]]
 
+    # VERIFIED TOKEN CACHE
+    # Decoded access token claims are kept per worker for at most `TOKEN_CACHE_TTL_SECONDS`
+    # (never beyond the token `exp`); revocations are broadcast to every worker. Set 0 to disable.
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+    TOKEN_CACHE_TTL_SECONDS: int = 60
+
+    # USER CACHE
+    # Two tiers of user snapshots: in-process per worker, backed by Redis. Set the sizes/TTLs to 0 to disable.
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_REDIS_TTL_SECONDS: int = 300
+
+    # DASHBOARD STATISTICS
+    # The statistics snapshot is shared by all workers; once older than `DASHBOARD_STATS_TTL_SECONDS`, it is still
+    # served for `DASHBOARD_STATS_STALE_SECONDS` while being refreshed in the background. Set the TTL to 0 to disable.
+    DASHBOARD_STATS_TTL_SECONDS: int = 60
+    DASHBOARD_STATS_STALE_SECONDS: int = 300
+
+    # ACTIVITY ROLLUP
+    # The login events of today and yesterday are rolled up into `daily_activity` by one worker every
+    # `ACTIVITY_ROLLUP_INTERVAL_SECONDS`, for the dashboard session counts. Set it to 0 to leave it to a scheduled
+    # `python -m app.scripts.activity.rollup_daily_activity`.
+    ACTIVITY_ROLLUP_INTERVAL_SECONDS: int = 60
+
+    # LOGIN COUNTERS
+    # Logins are counted in Redis and written to the database by a background flush every
+    # `LOGIN_COUNTER_FLUSH_INTERVAL_SECONDS`, `LOGIN_COUNTER_FLUSH_BATCH_SIZE` users per statement.
+    # Set the interval to 0 to write each login to the database right away.
+    LOGIN_COUNTER_FLUSH_INTERVAL_SECONDS: int = 5
+    LOGIN_COUNTER_FLUSH_BATCH_SIZE: int = 500
+
+    # EMAIL QUEUE
+    # Emails are queued in Redis and sent by `python -m app.scripts.mails.email_worker`, up to
+    # `EMAIL_WORKER_CONCURRENCY` at a time. A failed email is tried again after an exponential backoff (from
+    # `EMAIL_QUEUE_BACKOFF_SECONDS` up to `EMAIL_QUEUE_MAX_BACKOFF_SECONDS`), `EMAIL_QUEUE_MAX_ATTEMPTS` times at most.
+    # An email held by a worker for longer than `EMAIL_QUEUE_LEASE_SECONDS` (e.g. it crashed) is queued again.
+    EMAIL_QUEUE_MAX_ATTEMPTS: int = 5
+    EMAIL_QUEUE_BACKOFF_SECONDS: int = 30
+    EMAIL_QUEUE_MAX_BACKOFF_SECONDS: int = 3600
+    EMAIL_QUEUE_LEASE_SECONDS: int = 300
+    EMAIL_WORKER_CONCURRENCY: int = 4
+    EMAIL_WORKER_POLL_SECONDS: float = 1
+
     # PROJECT NAME, VERSION AND DESCRIPTION
     PROJECT_NAME: str = pyproject_content["name"]
     VERSION: str = pyproject_content["version"]
@@ -74,13 +117,58 @@ class Settings(BaseSettings):
     TEST_DATABASE_PATH: str
     TEST_SQLALCHEMY_DATABASE_URI: str = ""
 
+    # DATABASE CONNECTION POOL
+    # Per worker. Left empty, each value comes from the engine profile of `ENVIRONMENT` (see `app/db/session.py`).
+    # `DATABASE_POOL_PRE_PING`: `always` pings on every checkout, `idle` only connections idle for longer than
+    # `DATABASE_POOL_PRE_PING_IDLE_SECONDS`, `never` relies on `DATABASE_POOL_RECYCLE` alone.
+    DATABASE_POOL_SIZE: Optional[int] = None
+    DATABASE_MAX_OVERFLOW: Optional[int] = None
+    DATABASE_POOL_TIMEOUT: Optional[float] = None
+    DATABASE_POOL_RECYCLE: Optional[int] = None
+    DATABASE_POOL_PRE_PING: Optional[Literal["always", "idle", "never"]] = None
+    DATABASE_POOL_PRE_PING_IDLE_SECONDS: int = 30
+    # asyncpg prepared statements cached per connection; 0 disables it (e.g. behind pgbouncer in transaction mode)
+    DATABASE_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+
     # FIRST SUPERUSER
     FIRST_SUPERUSER_EMAIL: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
     # EXTRA DATASET
+    # Dummy users are inserted `DUMMY_USERS_BATCH_SIZE` at a time. The password of each one is its full name,
+    # hashed in a process pool, unless `DUMMY_USERS_PASSWORD` is set: every dummy user then shares that password,
+    # hashed once.
     ADD_DUMMY_USERS: bool = False
     TOTAL_DUMMY_USERS: int
+    DUMMY_USERS_BATCH_SIZE: int = 1000
+    DUMMY_USERS_PASSWORD: Optional[str] = None
+
+    # PASSWORD HASHING
+    # bcrypt blocks for hundreds of milliseconds, so it runs in a bounded worker pool.
+    # `PASSWORD_HASHER_WORKERS` defaults to the number of CPUs when left empty.
+    PASSWORD_HASHER_EXECUTOR: Literal["thread", "process"] = "thread"
+    PASSWORD_HASHER_WORKERS: Optional[int] = None
+    PASSWORD_HASHER_MAX_QUEUE_DEPTH: int = 64
+
+    # PASSWORD HASH COST
+    # Either pin `PASSWORD_HASH_ROUNDS`, or let the startup calibration pick the highest bcrypt cost
+    # that fits `PASSWORD_HASH_TARGET_MS` per hash. The calibrated cost is shared by all workers via Redis.
+    # Hashes stored with another cost are re-hashed in the background on the next successful login.
+    PASSWORD_HASH_ROUNDS: Optional[int] = None
+    PASSWORD_HASH_CALIBRATE: bool = False
+    PASSWORD_HASH_TARGET_MS: int = 250
+    PASSWORD_HASH_MIN_ROUNDS: int = 10
+    PASSWORD_HASH_MAX_ROUNDS: int = 15
+    PASSWORD_HASH_CALIBRATION_TTL_HOURS: int = 24
+
+    # SOCIAL LOGIN HTTP CLIENT
+    # The calls to the social login providers share one pool of keep-alive connections per worker.
+    # A connection failure is retried `SOCIAL_LOGIN_HTTP_RETRIES` times; so are the idempotent calls (GET) failing
+    # with a read timeout or error, or a 502/503/504 response. A call is never tried more than retries + 1 times.
+    SOCIAL_LOGIN_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5
+    SOCIAL_LOGIN_HTTP_READ_TIMEOUT_SECONDS: float = 10
+    SOCIAL_LOGIN_HTTP_RETRIES: int = 2
+    SOCIAL_LOGIN_HTTP_MAX_CONNECTIONS: int = 20
 
     # VALIDATORS
     @validator("BACKEND_CORS_ORIGINS")
@@ -18,11 +18,15 @@ class Google(BaseSettings):
         EXT_GOOGLE_CLIENT_ID
         EXT_GOOGLE_CLIENT_SECRET
         EXT_GOOGLE_CONF_URL
+        EXT_GOOGLE_METADATA_TTL_SECONDS
 
     Attributes:
         GOOGLE_CLIENT_ID(str): Google client ID.
         GOOGLE_CLIENT_SECRET(str): Google client secret.
         GOOGLE_CONF_URL(str): Google openid configuration.
+        GOOGLE_METADATA_TTL_SECONDS(int): Seconds during which the openid
+            configuration and signing keys (JWKS) are reused before being
+            fetched again.
 
     """
 
@@ -30,6 +34,7 @@ class Google(BaseSettings):
     GOOGLE_CLIENT_ID: str = None
     GOOGLE_CLIENT_SECRET: str = None
     GOOGLE_CONF_URL: str = None
+    GOOGLE_METADATA_TTL_SECONDS: int = 3600
 
     class Config:
         """Config sub-class needed to customize BaseSettings settings.
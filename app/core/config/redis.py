@@ -2,6 +2,7 @@
 """Redis configuration."""
 
 from pathlib import Path
+from typing import Optional
 from pydantic import BaseSettings
 
 PROJECT_DIR = Path(__file__).parent.parent.parent.parent
@@ -19,8 +20,16 @@ class Redis(BaseSettings):
         EXT_REDIS_PORT
         EXT_REDIS_USERNAME
         EXT_REDIS_PASSWORD
-        EXT_EXT_REDIS_DB
+        EXT_REDIS_DB
         EXT_REDIS_USE_SENTINEL
+        EXT_REDIS_SENTINEL_SERVICE_NAME
+        EXT_REDIS_READ_FROM_REPLICAS
+        EXT_REDIS_MAX_CONNECTIONS
+        EXT_REDIS_POOL_TIMEOUT
+        EXT_REDIS_SOCKET_TIMEOUT
+        EXT_REDIS_SOCKET_CONNECT_TIMEOUT
+        EXT_REDIS_RETRY_ON_TIMEOUT
+        EXT_REDIS_HEALTH_CHECK_INTERVAL
 
     Attributes:
         REDIS_HOST(str): Redis host.
@@ -29,6 +38,18 @@ class Redis(BaseSettings):
         REDIS_PASSWORD(str): Redis password.
         REDIS_DB(str): Redis database.
         REDIS_USE_SENTINEL(bool): If provided Redis config is for Sentinel.
+        REDIS_SENTINEL_SERVICE_NAME(str): Name of the master monitored by Sentinel.
+        REDIS_READ_FROM_REPLICAS(bool): With Sentinel, send the read-only
+            lookups to the replicas.
+        REDIS_MAX_CONNECTIONS(int): Maximum number of connections per worker.
+        REDIS_POOL_TIMEOUT(float): Seconds to wait for a free connection once
+            the pool is full, None to wait forever. Not applied with Sentinel,
+            whose pool fails right away instead.
+        REDIS_SOCKET_TIMEOUT(float): Seconds to wait for a command reply.
+        REDIS_SOCKET_CONNECT_TIMEOUT(float): Seconds to wait for a connection.
+        REDIS_RETRY_ON_TIMEOUT(bool): Retry a command once after a timeout.
+        REDIS_HEALTH_CHECK_INTERVAL(int): PING a connection idle for longer than
+            this many seconds before reusing it, 0 to disable.
 
     """
 
@@ -39,6 +60,16 @@ class Redis(BaseSettings):
     REDIS_PASSWORD: str = None
     REDIS_DB: str = "0"
     REDIS_USE_SENTINEL: bool = False
+    REDIS_SENTINEL_SERVICE_NAME: str = "mymaster"
+    REDIS_READ_FROM_REPLICAS: bool = True
+
+    # Redis Connection Pool
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: Optional[float] = 5.0
+    REDIS_SOCKET_TIMEOUT: Optional[float] = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: Optional[float] = 5.0
+    REDIS_RETRY_ON_TIMEOUT: bool = True
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
 
     # REDIS_USE_SENTINEL: bool = False
     class Config:
@@ -2,6 +2,8 @@
 """Email Composer Configuration."""
 
 from pathlib import Path
+from typing import Optional
+
 from pydantic import BaseSettings
 
 PROJECT_DIR = Path(__file__).parent.parent.parent.parent
@@ -22,6 +24,10 @@ class SMTP(BaseSettings):
         EXT_SMTP_PASSWORD
         EXT_SMTP_SSL
         EXT_SMTP_TEMPLATE_PATH
+        EXT_SMTP_TIMEOUT
+        EXT_SMTP_POOL_SIZE
+        EXT_SMTP_POOL_IDLE_TIMEOUT
+        EXT_SMTP_TEMPLATE_BYTECODE_CACHE_DIR
 
     Attributes:
         SMTP_SERVER(str): SMTP server.
@@ -31,6 +37,13 @@ class SMTP(BaseSettings):
         SMTP_PASSWORD(str): SMTP password.
         SMTP_SSL(bool): SMTP SSL configuration status (enabled or disabled).
         SMTP_TEMPLATE_PATH(str): SMTP HTML template folder path.
+        SMTP_TIMEOUT(int): SMTP connection and command timeout in seconds.
+        SMTP_POOL_SIZE(int): Maximum number of SMTP connections per process.
+        SMTP_POOL_IDLE_TIMEOUT(int): Seconds after which an idle SMTP
+            connection is closed rather than reused; keep it below the idle
+            timeout of the server.
+        SMTP_TEMPLATE_BYTECODE_CACHE_DIR(str): Folder keeping the compiled
+            HTML templates across restarts; disabled if not set.
 
     """
 
@@ -42,6 +55,10 @@ class SMTP(BaseSettings):
     SMTP_PASSWORD: str = None
     SMTP_SSL: bool = True
     SMTP_TEMPLATE_PATH: str = True
+    SMTP_TIMEOUT: int = 30
+    SMTP_POOL_SIZE: int = 4
+    SMTP_POOL_IDLE_TIMEOUT: int = 60
+    SMTP_TEMPLATE_BYTECODE_CACHE_DIR: Optional[str] = None
 
     class Config:
         """Config sub-class needed to customize BaseSettings settings.
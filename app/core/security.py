@@ -4,6 +4,8 @@ Black-box security shortcuts to generate JWT tokens and password hash/verify
 `subject` in access/refresh func may be antyhing unique to User account, `id` etc.
 """
 
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Any, Tuple, Union, Optional
 
@@ -45,6 +47,11 @@ def create_refresh_token(subject: Union[str, Any]) -> Tuple[str, datetime]:
     return encoded_jwt, expire
 
 
+def token_digest(token: str) -> str:
+    """ Fixed-size fingerprint of a token, so caches never hold the bearer token itself """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -53,6 +60,46 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
+def configure_password_context(bcrypt_rounds: Optional[int] = None) -> None:
+    """ Pin the bcrypt cost; stored hashes with any other cost are reported by `password_needs_rehash`
+
+    Also used as the process pool initializer, so every worker hashes with the same cost.
+    """
+    if bcrypt_rounds is not None:
+        pwd_context.update(
+            bcrypt__default_rounds=bcrypt_rounds,
+            bcrypt__min_rounds=bcrypt_rounds,
+            bcrypt__max_rounds=bcrypt_rounds,
+        )
+
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """ Find the highest bcrypt cost whose single hash fits `target_ms` on this host
+
+    Each extra round doubles the cost, so it stops before measuring a round that would clearly not fit.
+    """
+    handler = pwd_context.handler("bcrypt")
+    rounds = min_rounds
+
+    for candidate in range(min_rounds, max_rounds + 1):
+        started_at = time.perf_counter()
+        handler.using(rounds=candidate).hash("calibration-password")
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+
+        if elapsed_ms > target_ms and candidate > min_rounds:
+            break
+
+        rounds = candidate
+        if elapsed_ms * 2 > target_ms:
+            break
+
+    return rounds
+
+
 def create_email_verification_token(subject: Union[str, Any]) -> Tuple[str, datetime]:
     now = datetime.utcnow()
     expire = now + timedelta(minutes=settings.EMAIL_VERIFICATION_EXPIRE_MINUTES)
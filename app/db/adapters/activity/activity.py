@@ -0,0 +1,83 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models.activity import LoginEvent, DailyActivity
+from typing import List, Mapping
+from sqlalchemy import distinct, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta, date, time
+
+
+def record_login(session: AsyncSession, user_id: int, logged_at: datetime) -> None:
+    """ Append a login event; stored along with the next commit of the session
+
+    :param session:
+    :param user_id:
+    :param logged_at: (UTC)
+    :return:
+    """
+    session.add(LoginEvent(user_id=user_id, logged_at=logged_at))
+
+
+async def rollup_daily_activity(session: AsyncSession, day: date) -> None:
+    """ Count the active users and the logins of a day, from its login events, and store them
+
+    Idempotent: the row of the day is replaced, so a day can be rolled up again as its events come in.
+
+    :param session:
+    :param day: (UTC)
+    :return:
+    """
+    day_start = datetime.combine(day, time.min)
+    query = select(
+        func.count(distinct(LoginEvent.user_id)).label("active_users"),
+        func.count().label("logins"),
+    ).where(LoginEvent.logged_at >= day_start, LoginEvent.logged_at < day_start + timedelta(days=1))
+    counts = (await session.execute(query)).mappings().one()
+
+    insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(DailyActivity).values(
+        day=day, active_users=counts["active_users"], logins=counts["logins"], updated_at=datetime.utcnow(),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[DailyActivity.day],
+        set_={
+            "active_users": statement.excluded.active_users,
+            "logins": statement.excluded.logins,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+    await session.execute(statement)
+    await session.commit()
+
+
+async def rollup_recent_activity(session: AsyncSession, today: date) -> None:
+    """ Roll up today, and yesterday until it has been rolled up once after its end
+
+    :param session:
+    :param today: (UTC)
+    :return:
+    """
+    yesterday = today - timedelta(days=1)
+    result = await session.execute(select(DailyActivity.updated_at).where(DailyActivity.day == yesterday))
+    rolled_up_at = result.scalar_one_or_none()
+    if rolled_up_at is None or rolled_up_at < datetime.combine(today, time.min):
+        await rollup_daily_activity(session, yesterday)
+
+    await rollup_daily_activity(session, today)
+
+
+async def get_daily_activity(session: AsyncSession, start: date, end: date) -> List[Mapping]:
+    """ Get the rolled up activity of the days between `start` and `end`, both included
+
+    Days never rolled up have no row.
+
+    :param session:
+    :param start:
+    :param end:
+    :return: `day`, `active_users` and `logins`, by day
+    """
+    query = select(
+        DailyActivity.day, DailyActivity.active_users, DailyActivity.logins,
+    ).where(DailyActivity.day >= start, DailyActivity.day <= end).order_by(DailyActivity.day)
+
+    result = await session.execute(query)
+    return result.mappings().all()
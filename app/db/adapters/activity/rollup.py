@@ -0,0 +1,87 @@
+"""
+Background rollup of the recent login events into `daily_activity`.
+
+Every `ACTIVITY_ROLLUP_INTERVAL_SECONDS`, one worker (elected by a Redis lock, left to expire so that the workers
+together roll up once per interval) rolls up today, and yesterday until it has been rolled up after its end. The
+dashboard only reads the rollup; older days are rolled up by `app.scripts.activity.rollup_daily_activity`.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.db.adapters.activity.activity import rollup_recent_activity
+from app.db.session import async_session
+from app.utils import RedisClient
+
+L = logging.getLogger("uvicorn.error")
+
+
+class ActivityRollup(object):
+    """
+    Rollup of the recent daily activity, run in the background by one worker at a time
+    """
+
+    lock_key: str = "activity-rollup:lock"
+    refresher_task: Optional[asyncio.Task] = None
+    counters: Dict[str, int] = {"rollups": 0, "skipped": 0, "failures": 0}
+
+    @classmethod
+    def start_refresher(cls) -> None:
+        """ Start rolling up the recent activity in the background """
+        if cls.refresher_task is None and settings.ACTIVITY_ROLLUP_INTERVAL_SECONDS > 0:
+            cls.refresher_task = asyncio.ensure_future(cls._run_refresher())
+
+    @classmethod
+    async def stop_refresher(cls) -> None:
+        """ Stop the background rollup """
+        if cls.refresher_task is not None:
+            cls.refresher_task.cancel()
+            try:
+                await cls.refresher_task
+            except asyncio.CancelledError:
+                pass
+            cls.refresher_task = None
+
+    @classmethod
+    async def rollup(cls) -> bool:
+        """ Roll up the recent activity, unless another worker did it within the interval
+
+        :return: whether this worker rolled it up
+        """
+        lock_ttl = max(settings.ACTIVITY_ROLLUP_INTERVAL_SECONDS, 1)
+        locked = await RedisClient.set(cls.lock_key, "1", lock_ttl, nx=True)
+
+        # another worker is on it (rather than Redis being unreachable)
+        if not locked and await RedisClient.get(cls.lock_key):
+            cls.counters["skipped"] += 1
+            return False
+
+        try:
+            async with async_session() as session:
+                await rollup_recent_activity(session, datetime.utcnow().date())
+        except Exception:
+            cls.counters["failures"] += 1
+            raise
+
+        cls.counters["rollups"] += 1
+        return True
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return dict(cls.counters)
+
+    @classmethod
+    async def _run_refresher(cls) -> None:
+        while True:
+            try:
+                await cls.rollup()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                # the login events stay, and are rolled up at the next tick
+                L.warning(f"Daily activity rollup failed: {err}")
+
+            await asyncio.sleep(settings.ACTIVITY_ROLLUP_INTERVAL_SECONDS)
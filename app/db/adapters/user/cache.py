@@ -0,0 +1,216 @@
+"""
+Read-through cache in front of the user lookups.
+
+Two tiers: an in-process LRU per worker, backed by Redis shared by all workers. Both tiers hold a JSON
+snapshot of the `user` row under its id and its email, without the password hash: the password checks load it
+from the database, see `load_hashed_password`. The write helpers in `user.py` invalidate both tiers (the
+in-process tier of every worker through `CacheInvalidator`) once their transaction is committed.
+
+Every invalidation also bumps a generation per cache key in Redis. A lookup that missed reads the generation
+before loading the row, and only stores the snapshot if it is unchanged, so an invalidation landing between the
+load and the store is not overwritten by the stale row.
+With Sentinel replicas, the Redis tier is read from a replica: a lookup racing an invalidation may still
+get the previous snapshot, for as long as the replication lag.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import DateTime, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.config import settings
+from app.db.models.user import User
+from app.utils import RedisClient
+from app.utils.cache import LRUCache, CacheInvalidator
+
+L = logging.getLogger("uvicorn.error")
+
+# columns never copied into a snapshot
+SECRET_COLUMNS = frozenset({"hashed_password"})
+
+# KEYS: cache keys to drop, each followed by its generation key; ARGV[1]: expiry of the generations in seconds
+INVALIDATE_SCRIPT = """
+for index = 1, #KEYS, 2 do
+    redis.call('DEL', KEYS[index])
+    redis.call('INCR', KEYS[index + 1])
+    redis.call('EXPIRE', KEYS[index + 1], ARGV[1])
+end
+return 1
+"""
+
+# KEYS[1]: generation key of the lookup, KEYS[2..]: cache keys; ARGV[1]: generation read before the lookup,
+# ARGV[2]: snapshot, ARGV[3]: its expiry in seconds
+STORE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+for index = 2, #KEYS do
+    redis.call('SET', KEYS[index], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+
+class UserCache(object):
+    """
+    Two-tier read-through cache of user snapshots
+
+    A hit returns a fresh, detached `User` built from the snapshot; change it through `update_user`.
+    A miss returns the instance loaded by the given session.
+    """
+
+    local: LRUCache = CacheInvalidator.register(
+        LRUCache("users", max_size=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+    )
+    key_prefix: str = "user-cache"
+    # outlives by far any lookup in progress, which could otherwise miss an invalidation
+    generation_ttl: int = 24 * 3600
+    counters: Dict[str, int] = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    @classmethod
+    async def get_by_id(cls, session: AsyncSession, user_id: int) -> Optional[User]:
+        return await cls._get(session, cls._id_key(user_id), User.id == user_id)
+
+    @classmethod
+    async def get_by_email(cls, session: AsyncSession, email: str) -> Optional[User]:
+        return await cls._get(session, cls._email_key(email), User.email == email)
+
+    @classmethod
+    async def invalidate(cls, user: User, stale_email: Optional[str] = None) -> None:
+        """ Drop a user from both tiers, in every worker
+
+        :param user:
+        :param stale_email: previous email, when the email itself has been changed
+        :return:
+        """
+        keys = [cls._id_key(user.id), cls._email_key(user.email)]
+        if stale_email is not None and stale_email != user.email:
+            keys.append(cls._email_key(stale_email))
+
+        await cls._drop(keys)
+
+    @classmethod
+    async def invalidate_many(cls, users: Iterable) -> None:
+        """ Drop several users from both tiers, in every worker, at once
+
+        :param users: anything with the `id` and the `email` of a user, e.g. rows of these columns
+        :return:
+        """
+        keys = [key for user in users for key in (cls._id_key(user.id), cls._email_key(user.email))]
+        if not keys:
+            return
+
+        await cls._drop(keys)
+
+    @classmethod
+    async def _drop(cls, keys: List[str]) -> None:
+        await RedisClient.run_script(
+            INVALIDATE_SCRIPT,
+            keys=[name for key in keys for name in (key, cls._generation_key(key))],
+            args=[cls.generation_ttl],
+        )
+        await CacheInvalidator.invalidate(cls.local.name, *keys)
+
+    @classmethod
+    def stats(cls) -> Dict:
+        lookups = sum(cls.counters.values())
+        hits = cls.counters["local_hits"] + cls.counters["redis_hits"]
+        return {
+            **cls.counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "local": cls.local.stats(),
+        }
+
+    @classmethod
+    async def _get(cls, session: AsyncSession, key: str, criterion) -> Optional[User]:
+        # (1) in-process tier
+        snapshot = cls.local.get(key)
+        if snapshot is not None:
+            cls.counters["local_hits"] += 1
+            return cls._load(snapshot)
+
+        # (2) shared Redis tier, read from a replica if any; any failure is handled as a miss
+        data = await RedisClient.get(key, replica=True)
+        if data:
+            snapshot = json.loads(data)
+            cls.local.set(key, snapshot)
+            cls.counters["redis_hits"] += 1
+            return cls._load(snapshot)
+
+        # (3) database; the generations are read first, to tell whether the row is invalidated meanwhile
+        cls.counters["misses"] += 1
+        local_invalidations = cls.local.invalidations
+        generation = await RedisClient.get(cls._generation_key(key))
+
+        result = await session.execute(select(User).where(criterion))
+        user: Optional[User] = result.scalars().first()
+
+        if user is not None:
+            await cls._store(user, key, local_invalidations, generation)
+
+        return user
+
+    @classmethod
+    async def _store(cls, user: User, key: str, local_invalidations: int, generation) -> None:
+        """ Store the snapshot of a user loaded from the database, unless it has been invalidated meanwhile
+
+        :param user:
+        :param key: cache key of the lookup
+        :param local_invalidations: `invalidations` of the in-process tier, read before loading the user
+        :param generation: generation of `key`, read before loading the user; False if it could not be read
+        :return:
+        """
+        snapshot = cls._dump(user)
+        keys = [cls._id_key(user.id), cls._email_key(user.email)]
+
+        # any eviction in this worker, whichever the key, skips the store: the next lookup stores it
+        if cls.local.invalidations == local_invalidations:
+            for cache_key in keys:
+                cls.local.set(cache_key, snapshot)
+
+        if settings.USER_CACHE_REDIS_TTL_SECONDS > 0 and generation is not False:
+            await RedisClient.run_script(
+                STORE_SCRIPT,
+                keys=[cls._generation_key(key), *keys],
+                args=[generation or "0", json.dumps(snapshot), settings.USER_CACHE_REDIS_TTL_SECONDS],
+            )
+
+    @classmethod
+    def _dump(cls, user: User) -> Dict:
+        snapshot = {}
+        for column in User.__table__.columns:
+            if column.key in SECRET_COLUMNS:
+                continue
+            value = getattr(user, column.key)
+            snapshot[column.key] = value.isoformat() if isinstance(value, datetime) else value
+
+        return snapshot
+
+    @classmethod
+    def _load(cls, snapshot: Dict) -> User:
+        values = {name: value for name, value in snapshot.items() if name not in SECRET_COLUMNS}
+        for column in User.__table__.columns:
+            if isinstance(column.type, DateTime) and values.get(column.key) is not None:
+                values[column.key] = datetime.fromisoformat(values[column.key])
+
+        # mark it as an already persisted row, so `session.add` attaches it without a SELECT; the columns left
+        # out of the snapshot stay unloaded, and raise on access until it is attached to a session
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    @classmethod
+    def _id_key(cls, user_id: int) -> str:
+        return f"{cls.key_prefix}:id:{user_id}"
+
+    @classmethod
+    def _email_key(cls, email: str) -> str:
+        return f"{cls.key_prefix}:email:{email}"
+
+    @classmethod
+    def _generation_key(cls, key: str) -> str:
+        return f"{key}:generation"
@@ -0,0 +1,290 @@
+"""
+Login counters, buffered in Redis and written to the database in batches.
+
+A login only runs one Redis script: it increments the login count of the user, keeps its latest login time and
+appends the login event. Every `LOGIN_COUNTER_FLUSH_INTERVAL_SECONDS`, one worker (elected by a Redis lock) claims
+everything buffered so far, by renaming the keys, and applies it in a single transaction: `total_login` and
+`session_at` in batched `UPDATE ... FROM (VALUES ...)` statements, and the login events.
+
+Crash safety: the claimed keys are only deleted once that transaction is committed, and a flush always applies a
+claimed batch left behind before claiming a new one. A claimed batch gets an id, recorded in `login_counter_batches`
+by the same transaction, and a batch whose id is already recorded is not applied again.
+- A crash before the commit loses nothing: the next flush, by any worker, applies the batch.
+- A crash, or a failed deletion, between the commit and the deletion leaves an applied batch behind: the next flush
+  only deletes it.
+- Logins buffered in Redis are lost along with Redis, if it does not persist its data (AOF/RDB).
+When Redis is unreachable, or no flusher runs in this worker, a login is written to the database right away.
+
+The flush lock holds a token of its owner, and is only released by it: a flush outliving the lock TTL does not
+release the lock of the next one.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, Integer, bindparam, case, cast, column, delete, insert, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.adapters.user.cache import UserCache
+from app.db.models.activity import LoginCounterBatch, LoginEvent
+from app.db.models.user import User
+from app.db.session import async_session
+from app.utils import RedisClient
+
+L = logging.getLogger("uvicorn.error")
+
+# KEYS[1]: login counts, KEYS[2]: latest login times, KEYS[3]: login events; ARGV[1]: user id, ARGV[2]: login time
+# (ISO format, fixed width, so that the latest one is the greatest string)
+RECORD_LOGIN_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+local latest = redis.call('HGET', KEYS[2], ARGV[1])
+if not latest or latest < ARGV[2] then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+end
+redis.call('RPUSH', KEYS[3], ARGV[1] .. ' ' .. ARGV[2])
+return 1
+"""
+
+# KEYS[1..3]: buffered keys, KEYS[4..6]: their claimed counterparts, KEYS[7]: id of the claimed batch; ARGV[1]: id
+# of a new batch. Claims the buffered keys unless a claimed batch is left, and returns the claimed batch and its id
+CLAIM_LOGINS_SCRIPT = """
+if redis.call('EXISTS', KEYS[4], KEYS[5], KEYS[6]) == 0 then
+    redis.call('DEL', KEYS[7])
+    for i = 1, 3 do
+        if redis.call('EXISTS', KEYS[i]) == 1 then
+            redis.call('RENAME', KEYS[i], KEYS[i + 3])
+        end
+    end
+end
+if redis.call('EXISTS', KEYS[4], KEYS[5], KEYS[6]) > 0 and redis.call('EXISTS', KEYS[7]) == 0 then
+    redis.call('SET', KEYS[7], ARGV[1])
+end
+return {
+    redis.call('HGETALL', KEYS[4]), redis.call('HGETALL', KEYS[5]), redis.call('LRANGE', KEYS[6], 0, -1),
+    redis.call('GET', KEYS[7]),
+}
+"""
+
+
+class LoginCounter(object):
+    """
+    Login counters of all workers, buffered in Redis and flushed to the database in the background
+    """
+
+    key_prefix: str = "login-counter"
+    buffered_keys = (f"{key_prefix}:logins", f"{key_prefix}:session-at", f"{key_prefix}:events")
+    claimed_keys = tuple(f"{key}:claimed" for key in buffered_keys) + (f"{key_prefix}:batch-id:claimed",)
+    lock_key: str = f"{key_prefix}:lock"
+    lock_ttl: int = 60
+    # applied batch ids are kept long enough to recognize any batch left behind
+    batch_retention: timedelta = timedelta(days=1)
+    flusher_task: Optional[asyncio.Task] = None
+    counters: Dict[str, int] = {
+        "buffered": 0, "direct": 0, "flushes": 0, "flushed_users": 0, "replayed_batches": 0, "failures": 0,
+    }
+
+    @classmethod
+    async def record(cls, user_id: int, logged_at: datetime) -> bool:
+        """ Buffer a login
+
+        :param user_id:
+        :param logged_at: (UTC)
+        :return: whether it has been buffered; otherwise the caller has to write it to the database itself
+        """
+        if cls.flusher_task is None:
+            cls.counters["direct"] += 1
+            return False
+
+        buffered = await RedisClient.run_script(
+            RECORD_LOGIN_SCRIPT,
+            keys=cls.buffered_keys,
+            args=(user_id, logged_at.isoformat(timespec="microseconds")),
+        )
+        cls.counters["buffered" if buffered == 1 else "direct"] += 1
+        return buffered == 1
+
+    @classmethod
+    def start_flusher(cls) -> None:
+        """ Start flushing the buffered logins in the background """
+        if cls.flusher_task is None and settings.LOGIN_COUNTER_FLUSH_INTERVAL_SECONDS > 0:
+            cls.flusher_task = asyncio.ensure_future(cls._run_flusher())
+
+    @classmethod
+    async def stop_flusher(cls) -> None:
+        """ Stop the background flush, then flush what this worker may have buffered last """
+        if cls.flusher_task is None:
+            return
+
+        cls.flusher_task.cancel()
+        try:
+            await cls.flusher_task
+        except asyncio.CancelledError:
+            pass
+        cls.flusher_task = None
+
+        try:
+            await cls.flush()
+        except Exception as err:
+            L.warning(f"Login counters flush failed: {err}")
+
+    @classmethod
+    async def flush(cls) -> int:
+        """ Write the buffered logins to the database, unless another worker is already doing it
+
+        :return: number of users updated
+        """
+        token = uuid.uuid4().hex
+        if not await RedisClient.set(cls.lock_key, token, cls.lock_ttl, nx=True):
+            return 0
+
+        try:
+            batch = await RedisClient.run_script(
+                CLAIM_LOGINS_SCRIPT, keys=cls.buffered_keys + cls.claimed_keys, args=(uuid.uuid4().hex,),
+            )
+            if not batch:
+                return 0
+
+            logins, session_at, events = cls._parse(batch)
+            users = []
+            if logins:
+                async with async_session() as session:
+                    users = await cls._apply(session, cls._decode(batch[3]), logins, session_at, events)
+
+                # the cached snapshots hold the previous counters
+                await UserCache.invalidate_many(users)
+
+            if await RedisClient.delete(*cls.claimed_keys) is False:
+                # the batch is recorded as applied: the next flush only deletes it
+                cls.counters["failures"] += 1
+                L.warning("Login counters flush: the applied batch could not be deleted from Redis")
+        except Exception:
+            cls.counters["failures"] += 1
+            raise
+        finally:
+            await RedisClient.release_lock(cls.lock_key, token)
+
+        cls.counters["flushes"] += 1
+        cls.counters["flushed_users"] += len(users)
+        return len(users)
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return dict(cls.counters)
+
+    @classmethod
+    async def _run_flusher(cls) -> None:
+        while True:
+            await asyncio.sleep(settings.LOGIN_COUNTER_FLUSH_INTERVAL_SECONDS)
+            try:
+                await cls.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                # the claimed batch stays in Redis, and is applied by the next flush
+                L.warning(f"Login counters flush failed: {err}")
+
+    @classmethod
+    def _decode(cls, value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    @classmethod
+    def _parse(cls, batch: List) -> Tuple[Dict[int, int], Dict[int, datetime], Dict[int, List[datetime]]]:
+        decode = cls._decode
+
+        def to_dict(pairs: List) -> Dict[int, str]:
+            return {int(decode(pairs[i])): decode(pairs[i + 1]) for i in range(0, len(pairs), 2)}
+
+        logins = {user_id: int(count) for user_id, count in to_dict(batch[0]).items()}
+        session_at = {user_id: datetime.fromisoformat(value) for user_id, value in to_dict(batch[1]).items()}
+        events = defaultdict(list)
+        for event in batch[2]:
+            user_id, logged_at = decode(event).split(" ")
+            events[int(user_id)].append(datetime.fromisoformat(logged_at))
+
+        return logins, session_at, events
+
+    @classmethod
+    async def _apply(
+            cls,
+            session: AsyncSession,
+            batch_id: str,
+            logins: Dict[int, int],
+            session_at: Dict[int, datetime],
+            events: Dict[int, List[datetime]],
+    ) -> List:
+        """ Apply a batch in a single transaction, along with its id, unless it has already been applied
+
+        :return: `id` and `email` of the updated users; logins of users deleted meanwhile are dropped
+        """
+        if await session.get(LoginCounterBatch, batch_id) is not None:
+            cls.counters["replayed_batches"] += 1
+            L.warning(f"Login counters batch {batch_id} has already been applied, dropping it")
+            return []
+
+        # a concurrent flush applying the same batch fails on this primary key, and rolls back
+        now = datetime.utcnow()
+        session.add(LoginCounterBatch(id=batch_id, applied_at=now))
+        await session.execute(delete(LoginCounterBatch).where(LoginCounterBatch.applied_at < now - cls.batch_retention))
+
+        result = await session.execute(select(User.id, User.email).where(User.id.in_(list(logins))))
+        users = result.all()
+
+        user_ids = sorted(user.id for user in users)  # always the same lock order, whatever the batch
+        batch_size = settings.LOGIN_COUNTER_FLUSH_BATCH_SIZE
+        for start in range(0, len(user_ids), batch_size):
+            rows = [(user_id, logins[user_id], session_at[user_id]) for user_id in user_ids[start:start + batch_size]]
+            await cls._update_users(session, rows)
+
+        login_events = [
+            {"user_id": user_id, "logged_at": logged_at} for user_id in user_ids for logged_at in events[user_id]
+        ]
+        if login_events:
+            await session.execute(insert(LoginEvent), login_events)
+
+        await session.commit()
+        return users
+
+    @classmethod
+    async def _update_users(cls, session: AsyncSession, rows: List[Tuple[int, int, datetime]]) -> None:
+        """ Add the login counts to `total_login`, and move `session_at` forward
+
+        :param session:
+        :param rows: user id, number of logins, latest login time
+        :return:
+        """
+        if session.bind.dialect.name == "postgresql":
+            # one statement for the whole batch; cast, as the planner cannot infer the types of bare VALUES params
+            batch = values(
+                column("id", Integer), column("logins", Integer), column("session_at", DateTime), name="batch",
+            ).data([
+                (cast(user_id, Integer), cast(count, Integer), cast(logged_at, DateTime))
+                for user_id, count, logged_at in rows
+            ])
+            await session.execute(
+                update(User.__table__)
+                .where(User.id == batch.c.id)
+                .values(
+                    total_login=User.total_login + batch.c.logins,
+                    session_at=case((batch.c.session_at > User.session_at, batch.c.session_at), else_=User.session_at),
+                )
+            )
+            return
+
+        # no UPDATE ... FROM (VALUES ...) with named columns elsewhere (e.g. SQLite): one statement, many parameters
+        await session.execute(
+            update(User.__table__)
+            .where(User.id == bindparam("user_id"))
+            .values(
+                total_login=User.total_login + bindparam("logins"),
+                session_at=case(
+                    (bindparam("session_at", type_=DateTime) > User.session_at, bindparam("session_at", type_=DateTime)),
+                    else_=User.session_at,
+                ),
+            ),
+            [{"user_id": user_id, "logins": count, "session_at": logged_at} for user_id, count, logged_at in rows],
+        )
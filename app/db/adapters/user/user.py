@@ -1,23 +1,43 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models.user import User
-from typing import Optional, List, Mapping
-from sqlalchemy import select
+from typing import Optional, List, Mapping, Tuple
+from sqlalchemy import and_, func, inspect, or_, select, update
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
 from app.core.utils import get_pgsql_integrity_error_msg
 from app.exceptions import ErrorMessage
-from datetime import datetime, timedelta, date
-from sqlalchemy.sql import text
+from datetime import datetime, timedelta, date, time
 from fastapi import HTTPException, status
+from app.db.session import async_session
+from app.db.adapters.user.cache import UserCache
+from app.db.adapters.activity.activity import record_login
+from app.db.adapters.user.login_counter import LoginCounter
+import json
 import logging
 
 L = logging.getLogger("uvicorn.error")
 
+# columns of the user listings; never the password hash
+USER_LIST_COLUMNS = (
+    User.id, User.full_name, User.email, User.signup_by, User.total_login, User.session_at, User.created_at,
+    User.activated,
+)
+
 
 async def get_user_by_email(session: AsyncSession, email: str) -> Optional[User]:
-    result = await session.execute(select(User).where(User.email == email))
-    user: Optional[User] = result.scalars().first()
+    """ Read-through `UserCache`; a cached user is detached, see `UserCache` """
+    return await UserCache.get_by_email(session, email)
+
+
+async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[User]:
+    """ Read-through `UserCache`; a cached user is detached, see `UserCache` """
+    return await UserCache.get_by_id(session, user_id)
 
-    return user
+
+async def load_hashed_password(session: AsyncSession, user_id: int) -> Optional[str]:
+    """ Load the password hash of a user, which `UserCache` never holds """
+    result = await session.execute(select(User.hashed_password).where(User.id == user_id))
+    return result.scalars().first()
 
 
 async def insert(
@@ -26,9 +46,10 @@ async def insert(
         raise_exception=False
 ) -> None:
     try:
+        # the primary key and the column defaults are set on `user` by the flush, and kept by the commit
+        # (`expire_on_commit=False`): no refresh needed
         session.add(user)
         await session.commit()
-        await session.refresh(user)
     except IntegrityError as err:
         await session.rollback()
         if raise_exception:
@@ -46,10 +67,46 @@ async def insert(
             )
 
 
+async def update_user(session: AsyncSession, user: User, **values) -> None:
+    """ Apply column values to a user in a single UPDATE, commit, and invalidate its cached snapshot
+
+    The updated row comes back with `UPDATE ... RETURNING` (a SELECT after the commit on databases without it,
+    e.g. SQLite) and is loaded into `user`, which may come from `UserCache` (detached), as well as into the
+    instance the session holds for the same row, if any: no refresh is needed afterwards.
+
+    :param session:
+    :param user:
+    :param values: column values, either plain values or SQL expressions (e.g. `User.total_login + 1`)
+    :return:
+    """
+    previous_email = user.email
+    table = User.__table__
+    statement = update(table).where(table.c.id == user.id).values(**values)
+
+    if session.bind.dialect.full_returning:
+        result = await session.execute(statement.returning(*table.columns))
+        row = result.mappings().one()
+        await session.commit()
+    else:
+        await session.execute(statement)
+        await session.commit()
+        result = await session.execute(select(*table.columns).where(table.c.id == user.id))
+        row = result.mappings().one()
+
+    instances = [user]
+    held = session.identity_map.get(inspect(user).key)
+    if held is not None and held is not user:
+        instances.append(held)
+
+    for instance in instances:
+        for column in table.columns:
+            set_committed_value(instance, column.key, row[column.key])
+
+    await UserCache.invalidate(user, stale_email=previous_email)
+
+
 async def update_activation_status(user: User, session: AsyncSession, activated: bool) -> None:
-    user.activated = activated
-    await session.commit()
-    await session.refresh(user)
+    await update_user(session, user, activated=activated)
 
 
 async def get_all_users(session: AsyncSession) -> Optional[List]:
@@ -68,91 +125,196 @@ async def get_users(
 
     :param session:
     :param limit:
+    :param order_desc: newest users first
     :return:
     """
-    # initial query
-    query = "SELECT full_name, email, signup_by, total_login, session_at, created_at, activated " \
-            "FROM public.user "
-
-    # add limit if any
-    if limit is not None:
-        query += f" LIMIT {limit}"
+    query = select(*USER_LIST_COLUMNS)
 
     if order_desc:
-        query += " ORDER BY created_at DESC"
+        query = query.order_by(User.created_at.desc())
+
+    # add limit if any; applied after the ordering
+    if limit is not None:
+        query = query.limit(limit)
 
     # get the results
-    result = await session.execute(text(query))
+    result = await session.execute(query)
     results_as_dict = result.mappings().all()
     return results_as_dict
 
 
-async def update_session_login(
-        user: User,
-        session: AsyncSession,
-) -> None:
-    user.total_login += 1  # update total login
-    user.session_at = datetime.utcnow()
+def name_or_email_prefix(search: str):
+    """ Case-insensitive prefix match on the full name or the email
+
+    A prefix (rather than a substring) can be served by an index on the lowered column.
+
+    :param search:
+    :return:
+    """
+    escaped = search.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"{escaped}%"
+    return or_(
+        func.lower(User.full_name).like(pattern, escape="\\"),
+        func.lower(User.email).like(pattern, escape="\\"),
+    )
+
+
+async def count_users(session: AsyncSession, search: Optional[str] = None) -> int:
+    """ Count the users, optionally only those matching a search
+
+    :param session:
+    :param search: prefix of the full name or the email
+    :return:
+    """
+    query = select(func.count(User.id))
+    if search:
+        query = query.where(name_or_email_prefix(search))
+
+    result = await session.execute(query)
+    return result.scalar_one()
+
+
+async def count_all_users(session: AsyncSession, where_by: List, count: str) -> Tuple[int, bool]:
+    """ Count the users matching the filters
+
+    :param session:
+    :param where_by:
+    :param count: `exact`, or `estimated` to read the planner estimate instead (PostgreSQL only; other databases
+        fall back to an exact count)
+    :return: the total, and whether it is an estimate
+    """
+    if count == "estimated" and session.bind.dialect.name == "postgresql":
+        estimate = await estimate_rows(session, select(User.id).where(*where_by))
+        if estimate is not None:
+            return estimate, True
 
-    await session.commit()
-    await session.refresh(user)
+    result = await session.execute(select(func.count(User.id)).where(*where_by))
+    return result.scalar_one(), False
 
 
-async def get_session_today(
+async def estimate_rows(session: AsyncSession, query) -> Optional[int]:
+    """ Number of rows the PostgreSQL planner expects a query to return, without running it
+
+    The filters are rendered as literals, quoted and escaped by the dialect, as EXPLAIN cannot take bound
+    parameters. The statement goes to the driver as is: `text()` would parse a colon in a literal as a bind
+    parameter.
+
+    :param session:
+    :param query:
+    :return: the estimate, None if the planner has no statistics for the table yet
+    """
+    compiled = query.compile(dialect=session.bind.dialect, compile_kwargs={"literal_binds": True})
+    connection = await session.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")
+    plan = result.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    rows = plan[0]["Plan"]["Plan Rows"]
+    return int(rows) if rows > 0 else None
+
+
+async def search_users(
         session: AsyncSession,
+        offset: int,
+        limit: int,
+        order_by: str = "id",
+        order_desc: bool = False,
+        search: Optional[str] = None,
 ) -> List[Mapping]:
-    query = "SELECT full_name, email, signup_by, total_login, session_at, created_at, activated " \
-            "FROM public.user " \
-            "WHERE DATE(session_at) = DATE(NOW()) "
+    """ Get one page of users, sorted by a listed column, optionally only those matching a search
 
-    result = await session.execute(text(query))
-    results_as_dict = result.mappings().all()
-    return results_as_dict
+    :param session:
+    :param offset:
+    :param limit:
+    :param order_by: name of one of `USER_LIST_COLUMNS`
+    :param order_desc:
+    :param search: prefix of the full name or the email
+    :return:
+    """
+    column = User.__table__.columns[order_by]
+    query = select(*USER_LIST_COLUMNS)
+    if search:
+        query = query.where(name_or_email_prefix(search))
+
+    # `id` breaks the ties, so that the pages neither overlap nor skip rows
+    query = query.order_by(column.desc() if order_desc else column.asc(), User.id.desc() if order_desc else User.id)
+    query = query.offset(offset).limit(limit)
+
+    result = await session.execute(query)
+    return result.mappings().all()
 
 
-async def get_sessions_last_7days(
+async def get_user_statistics(
         session: AsyncSession,
-) -> List[Mapping]:
-    # get today and last 7 days
-    today = date.today()
-    week_ago = today - timedelta(days=6)
+        today: date,
+) -> Mapping:
+    """ Count the users and the unverified sign-ups in a single aggregate query
 
-    # build a virtual table with 7 days backwards
-    vtable_7d = f"SELECT day::date as date " \
-                f"FROM generate_series('{str(week_ago)}', '{str(today)}', INTERVAL '1 day') day"
+    The sign-up count uses a range on the raw column, so it can be served by an index on that column (see
+    `User.__table_args__`). The session counts come from the daily activity rollup instead, see
+    `get_daily_activity`.
 
-    # build a virtual table to count total sessions each day
-    vtable_session = "SELECT DATE(session_at) date, COUNT(DATE(session_at)) as total " \
-                     "FROM public.user " \
-                     "GROUP BY DATE(session_at) "
+    :param session:
+    :param today: current (UTC) date; `created_at` is stored in UTC
+    :return: `total_users` and `total_unver_acc_tmonth` (unverified sign-ups of the current calendar month)
+    """
+    month_start = datetime.combine(today, time.min).replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
 
-    # (LEFT) JOIN `vtable_7d` table with `session_vtable` table, and set default value as 0 IFNULL
-    query = f"SELECT d.date, COALESCE(u.total, 0) as total " \
-            f"FROM ({vtable_7d}) as d LEFT JOIN ({vtable_session}) as u ON d.date = u.date "
+    query = select(
+        func.count().label("total_users"),
+        func.count().filter(
+            and_(User.activated.is_(False), User.created_at >= month_start, User.created_at < next_month_start)
+        ).label("total_unver_acc_tmonth"),
+    ).select_from(User)
 
-    result = await session.execute(text(query))
-    results_as_dict = result.mappings().all()
-    return results_as_dict
+    result = await session.execute(query)
+    return result.mappings().one()
+
+
+async def update_session_login(
+        user: User,
+        session: AsyncSession,
+) -> None:
+    now = datetime.utcnow()
+
+    # buffered in Redis and written in batches by `LoginCounter`, when possible
+    if await LoginCounter.record(user.id, now):
+        return
+
+    # keep every login for the daily activity rollup; committed along with the user update
+    record_login(session, user.id, now)
+
+    # update total login; incremented in SQL, as a cached value may be stale
+    await update_user(session, user, total_login=User.total_login + 1, session_at=now)
 
 
 async def get_unverified_users(
         session: AsyncSession,
+        year: int,
         month: int,
 ) -> List[Mapping]:
-    """ Get unverified user filtered by month
+    """ Get the unverified users who signed up in a given month
+
+    A range on the raw `created_at` column, served by the partial index on the unverified users.
 
     :param session:
+    :param year:
     :param month:
     :return:
     """
-    # initial query
-    # https://www.postgresql.org/docs/8.0/functions-datetime.html
-    query = "SELECT full_name, email, signup_by, total_login, session_at, created_at, activated " \
-            "FROM public.user " \
-            f"WHERE activated is false AND cast(date_part('month', created_at) as int) = {month}"
+    month_start = datetime(year, month, 1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+    query = select(*USER_LIST_COLUMNS).where(
+        User.activated.is_(False),
+        User.created_at >= month_start,
+        User.created_at < next_month_start,
+    ).order_by(User.created_at, User.id)
 
     # get the results
-    result = await session.execute(text(query))
+    result = await session.execute(query)
     results_as_dict = result.mappings().all()
     return results_as_dict
 
@@ -162,9 +324,7 @@ async def update_current_password(
         user: User,
         new_password: str
 ) -> None:
-    user.hashed_password = new_password
-    await session.commit()
-    await session.refresh(user)
+    await update_user(session, user, hashed_password=new_password)
 
 
 async def update_current_full_name(
@@ -172,6 +332,33 @@ async def update_current_full_name(
         user: User,
         full_name: str
 ) -> None:
-    user.full_name = full_name
-    await session.commit()
-    await session.refresh(user)
+    await update_user(session, user, full_name=full_name)
+
+
+async def save_rehashed_password(
+        user: User,
+        old_hashed_password: str,
+        new_hashed_password: str,
+) -> bool:
+    """ Replace an outdated password hash, unless the password has been changed meanwhile
+
+    Runs in the background after the login request is done, hence it opens its own session.
+
+    :param user:
+    :param old_hashed_password:
+    :param new_hashed_password:
+    :return: whether the stored hash has been replaced
+    """
+    async with async_session() as session:
+        result = await session.execute(
+            update(User)
+            .where(User.id == user.id, User.hashed_password == old_hashed_password)
+            .values(hashed_password=new_hashed_password)
+        )
+        await session.commit()
+
+    if result.rowcount == 0:
+        return False
+
+    await UserCache.invalidate(user)
+    return True
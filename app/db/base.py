@@ -11,3 +11,4 @@ Base = cast(Any, declarative_base())
 
 # Import all the models, so that Base has them before being called
 from app.db.models.user import User
+from app.db.models.activity import LoginEvent, DailyActivity, LoginCounterBatch
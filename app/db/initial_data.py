@@ -10,11 +10,11 @@ from typing import Optional
 
 from sqlalchemy import select, func
 
-from app.core import security
 from app.core.config import settings
 from app.db.models.user import User
 from app.db.session import async_session
-from app.scripts.users.generator import DummyUserDataGenerator
+from app.scripts.users.seeder import DummyUserSeeder
+from app.utils import PasswordHasher
 
 
 async def main() -> None:
@@ -30,7 +30,7 @@ async def main() -> None:
             new_superuser = User(
                 full_name=settings.FIRST_SUPERUSER_EMAIL,
                 email=settings.FIRST_SUPERUSER_EMAIL,
-                hashed_password=security.get_password_hash(
+                hashed_password=await PasswordHasher.hash(
                     settings.FIRST_SUPERUSER_PASSWORD
                 ),
             )
@@ -49,28 +49,15 @@ async def main() -> None:
         if settings.ADD_DUMMY_USERS and total_users > settings.TOTAL_DUMMY_USERS:
             print("Dummy data have been generated. Nothing to do.")
 
-        # otherwise, try creating some dummy users
+        # otherwise, top the users up with dummy users
         elif settings.ADD_DUMMY_USERS and total_users < settings.TOTAL_DUMMY_USERS:
-            generator = DummyUserDataGenerator(settings.TOTAL_DUMMY_USERS)
-            await generator.run()
-            dummy_users = await generator.get_dummy_users()
-
-            for dummy_user in dummy_users:
-                new_dummy_user = User(
-                    full_name=dummy_user["full_name"],
-                    email=dummy_user["email"],
-                    hashed_password=dummy_user["hashed_password"],
-                    total_login=dummy_user["total_login"],
-                    signup_by=dummy_user["signup_by"],
-                    activated=dummy_user["activated"],
-                    created_at=dummy_user["created_at"],
-                    updated_at=dummy_user["updated_at"],
-                    session_at=dummy_user["session_at"],
-                )
-                # new_dummy_user = User(dummy_user)
-                session.add(new_dummy_user)
-                await session.commit()
-                print("Dummy User(={}) was created".format(dummy_user["full_name"]))
+            seeder = DummyUserSeeder(
+                settings.TOTAL_DUMMY_USERS - total_users,
+                batch_size=settings.DUMMY_USERS_BATCH_SIZE,
+                password=settings.DUMMY_USERS_PASSWORD,
+                first_index=total_users,
+            )
+            await seeder.run(session)
 
             print("\nInitial data created with some dummy data")
         else:
@@ -0,0 +1,45 @@
+"""
+SQL Alchemy models of the login activity.
+
+Note, imported by alembic migrations logic, see `alembic/env.py`
+"""
+
+from sqlalchemy import Column, Integer, BigInteger, DateTime, Date, ForeignKey, Index, String
+from datetime import datetime
+
+from app.db.models.user import Base
+
+
+class LoginEvent(Base):
+    """ One row per login; the `session_at` of a user only keeps the latest one """
+    __tablename__ = "login_events"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    logged_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # the rollup of a day reads the events of that day only, from the index alone
+        Index("ix_login_events_logged_at_user_id", "logged_at", "user_id"),
+    )
+
+
+class DailyActivity(Base):
+    """ Login activity of a (UTC) day, rolled up from `login_events` """
+    __tablename__ = "daily_activity"
+    day = Column(Date, primary_key=True)
+    active_users = Column(Integer, nullable=False, default=0)
+    logins = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class LoginCounterBatch(Base):
+    """ Batch of buffered logins applied by `LoginCounter`, recorded in the same transaction so that it is never
+    applied twice """
+    __tablename__ = "login_counter_batches"
+    id = Column(String(32), primary_key=True)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # the batches older than a day are pruned
+        Index("ix_login_counter_batches_applied_at", "applied_at"),
+    )
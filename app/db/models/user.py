@@ -4,7 +4,7 @@ SQL Alchemy models declaration.
 Note, imported by alembic migrations logic, see `alembic/env.py`
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, func
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 from typing import Any, cast
@@ -38,3 +38,27 @@ class User(Base):
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     session_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # dashboard statistics: sessions of today and of the last 7 days
+        Index("ix_user_session_at", "session_at"),
+        # user listing, newest first, paginated on (created_at, id); optionally filtered by signup method
+        Index("ix_user_created_at_id", "created_at", "id"),
+        Index("ix_user_signup_by_created_at_id", "signup_by", "created_at", "id"),
+        # unverified users only (a small share of the table): listing filtered on them, unverified sign-ups per month
+        Index(
+            "ix_user_unverified_created_at_id", "created_at", "id",
+            postgresql_where=activated.is_(False),
+            sqlite_where=activated.is_(False),
+        ),
+        # case-insensitive prefix search on the name or the email; `text_pattern_ops` lets LIKE 'abc%' use the index
+        # whatever the database collation
+        Index(
+            "ix_user_lower_full_name", func.lower(full_name).label("lower_full_name"),
+            postgresql_ops={"lower_full_name": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_user_lower_email", func.lower(email).label("lower_email"),
+            postgresql_ops={"lower_email": "text_pattern_ops"},
+        ),
+    )
@@ -0,0 +1,100 @@
+"""
+Instrumented connection pool of the async engine.
+
+Measures how long a checkout waits for a connection and how long the connection is held afterwards, and
+optionally pings connections that have been idle for a while before handing them out (the `idle` pre-ping
+strategy, see `app/db/session.py`). The counters are kept per process, there is one engine per worker.
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.utils.metrics import percentile_ms
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    `AsyncAdaptedQueuePool` keeping checkout metrics
+
+    Settings live on the class rather than on the instance, as `Pool.recreate` (e.g. on `engine.dispose()`)
+    only carries the standard pool arguments over. The checkout/checkin listeners have to be attached to the
+    engine once created, see `listen`.
+    """
+
+    ping_idle_after: Optional[float] = None
+    counters: Dict[str, int] = {"checkouts": 0, "failures": 0, "idle_pings": 0, "stale": 0}
+    wait_times: Deque[float] = deque(maxlen=1024)
+    hold_times: Deque[float] = deque(maxlen=1024)
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            connection = super().connect()
+        except Exception:
+            self.counters["failures"] += 1
+            raise
+        finally:
+            self.wait_times.append(time.perf_counter() - started_at)
+
+        self.counters["checkouts"] += 1
+        return connection
+
+    @classmethod
+    def listen(cls, engine: AsyncEngine) -> None:
+        """ Attach the checkout/checkin listeners to the pool of an engine, and to the pools it recreates """
+        event.listen(engine.sync_engine, "checkout", _on_checkout)
+        event.listen(engine.sync_engine, "checkin", _on_checkin)
+
+    def stats(self) -> Dict:
+        wait_times = sorted(self.wait_times)
+        hold_times = sorted(self.hold_times)
+        return {
+            "pool_size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": self.overflow(),
+            "counters": dict(self.counters),
+            "wait_p50_ms": percentile_ms(wait_times, 0.50),
+            "wait_p95_ms": percentile_ms(wait_times, 0.95),
+            "wait_max_ms": percentile_ms(wait_times, 1.0),
+            "hold_p50_ms": percentile_ms(hold_times, 0.50),
+            "hold_p95_ms": percentile_ms(hold_times, 0.95),
+            "hold_max_ms": percentile_ms(hold_times, 1.0),
+        }
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    now = time.monotonic()
+    checked_in_at = connection_record.info.get("checked_in_at")
+    connection_record.info["checked_out_at"] = now
+
+    ping_idle_after = InstrumentedAsyncAdaptedQueuePool.ping_idle_after
+    if ping_idle_after is None or checked_in_at is None or now - checked_in_at < ping_idle_after:
+        return
+
+    InstrumentedAsyncAdaptedQueuePool.counters["idle_pings"] += 1
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+    except Exception as err:
+        # the pool invalidates this connection and checks out another one
+        InstrumentedAsyncAdaptedQueuePool.counters["stale"] += 1
+        raise DisconnectionError(str(err)) from err
+    finally:
+        cursor.close()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    now = time.monotonic()
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        InstrumentedAsyncAdaptedQueuePool.hold_times.append(now - checked_out_at)
+
+    connection_record.info["checked_in_at"] = now
@@ -1,9 +1,9 @@
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 from fastapi import Query
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from app.db.models.user import signup_by_list
+from app.db.models.user import SignupBy
 
 
 class BaseUser(BaseModel):
@@ -53,20 +53,41 @@ class UserLogout(BaseUser):
 
 class UserAll(BaseUser):
     total: int
+    total_estimated: bool = False  # whether `total` is the planner estimate rather than an exact count
+    next_cursor: Optional[str] = None  # pass it as `cursor` to get the next page; None on the last page
     data: List[User]
 
 
 class QueryParams(BaseModel):
     activated: Optional[bool] = None  # None, True, or False
-    signup_by: Optional[str] = None
+    signup_by: Optional[SignupBy] = None
+    cursor: Optional[str] = None
+    limit: int = 50
+    count: Literal["exact", "estimated"] = "exact"
 
 
 async def query_params(
         activated: Optional[bool] = Query(None, description="Activated account or not"),
-        signup_by: Optional[str] = Query(
-            None,
-            enum=signup_by_list,
-            description="Type of registration method used by the user"
+        signup_by: Optional[SignupBy] = Query(None, description="Type of registration method used by the user"),
+        cursor: Optional[str] = Query(None, description="`next_cursor` of the previous page; empty for the first page"),
+        limit: int = Query(50, ge=1, le=500, description="Maximum number of users per page"),
+        count: Literal["exact", "estimated"] = Query(
+            "exact",
+            description="How `total` is computed: an exact count, or the (much cheaper) query planner estimate"
         ),
 ):
-    return QueryParams(activated=activated, signup_by=signup_by)
+    return QueryParams(activated=activated, signup_by=signup_by, cursor=cursor, limit=limit, count=count)
+
+
+class ExportParams(BaseModel):
+    activated: Optional[bool] = None  # None, True, or False
+    signup_by: Optional[SignupBy] = None
+    format: Literal["ndjson", "csv"] = "ndjson"
+
+
+async def export_params(
+        activated: Optional[bool] = Query(None, description="Activated account or not"),
+        signup_by: Optional[SignupBy] = Query(None, description="Type of registration method used by the user"),
+        format: Literal["ndjson", "csv"] = Query("ndjson", description="One JSON object per line, or CSV"),
+):
+    return ExportParams(activated=activated, signup_by=signup_by, format=format)
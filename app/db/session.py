@@ -1,7 +1,65 @@
+from typing import Dict
+
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm.session import sessionmaker
 
 from app.core.config import settings
+from app.db.pool import InstrumentedAsyncAdaptedQueuePool
+
+# Connection pool defaults per environment, each value can be overridden by the matching `DATABASE_POOL_*` setting
+# `pre_ping`: `always` pings on every checkout, `idle` only once a connection has been idle for a while,
+# `never` relies on `pool_recycle` alone
+ENGINE_PROFILES: Dict[str, Dict] = {
+    "DEV": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 30, "pool_recycle": 1800, "pre_ping": "always"},
+    "STAGE": {"pool_size": 10, "max_overflow": 10, "pool_timeout": 10, "pool_recycle": 1800, "pre_ping": "idle"},
+    "PRODUCTION": {"pool_size": 20, "max_overflow": 10, "pool_timeout": 5, "pool_recycle": 1800, "pre_ping": "idle"},
+}
+
+
+def get_engine_options(environment: str, database_uri: str) -> Dict:
+    """ Build the `create_async_engine` pool options, from the environment profile and the settings
+
+    :param environment:
+    :param database_uri:
+    :return:
+    """
+    profile = dict(ENGINE_PROFILES[environment])
+    overrides = {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+
+    pre_ping = profile.pop("pre_ping")
+    InstrumentedAsyncAdaptedQueuePool.ping_idle_after = (
+        settings.DATABASE_POOL_PRE_PING_IDLE_SECONDS if pre_ping == "idle" else None
+    )
+
+    options = {
+        **profile,
+        "poolclass": InstrumentedAsyncAdaptedQueuePool,
+        "pool_pre_ping": pre_ping == "always",
+    }
+
+    # asyncpg keeps an LRU of prepared statements per connection
+    if make_url(database_uri).get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DATABASE_PREPARED_STATEMENT_CACHE_SIZE}
+
+    return options
+
+
+def pool_stats() -> Dict:
+    """ Summarize the connection pool usage of this worker; empty unless the pool is instrumented """
+    pool = async_engine.pool
+    if not isinstance(pool, InstrumentedAsyncAdaptedQueuePool):
+        return {}
+
+    return pool.stats()
+
 
 # In the unit test mode, it uses the local database using sqlite instead of using pre-deployed postgresql
 # Solution: https://github.com/talkpython/web-applications-with-fastapi-course/issues/4
@@ -15,6 +73,9 @@ if settings.ENVIRONMENT == "PYTEST":
 # uses pre-deployed postgresql as the main database
 else:
     sqlalchemy_database_uri = settings.DEFAULT_SQLALCHEMY_DATABASE_URI
-    async_engine = create_async_engine(sqlalchemy_database_uri, pool_pre_ping=True)
+    async_engine = create_async_engine(
+        sqlalchemy_database_uri, **get_engine_options(settings.ENVIRONMENT, sqlalchemy_database_uri)
+    )
+    InstrumentedAsyncAdaptedQueuePool.listen(async_engine)
 
 async_session = sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
@@ -2,3 +2,5 @@ from enum import Enum
 
 class ErrorMessage(Enum):
 	UNKNOWN_ERROR = "UNKNOWN_ERROR"  # default error when system is unable to identify
+	SERVICE_BUSY = "SERVICE_BUSY"  # a bounded worker pool is saturated; the client should retry shortly
+	INVALID_CURSOR = "INVALID_CURSOR"  # a pagination cursor that has not been issued by this API
@@ -9,7 +9,14 @@ from starlette.middleware.sessions import SessionMiddleware
 
 from app.api.api import api_router
 from app.webapps.base import api_router as web_app_router
-from app.utils import RedisClient
+from app.utils import RedisClient, PasswordHasher
+from app.utils.cache import CacheInvalidator
+from app.webapps.dashboard.service import StatisticsSnapshot
+from app.db.adapters.activity.rollup import ActivityRollup
+from app.db.adapters.user.login_counter import LoginCounter
+from app.utils.email_publisher import epub
+from app.utils.social_login.http_client import SocialLoginHTTP
+from app.utils.social_login.google import GoogleLogin
 from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
 
@@ -30,6 +37,28 @@ async def on_startup():
         log.error("Could not connect to Redis ... Retrying ...")
     log.debug("Connected to Redis Storage")
 
+    # Apply the cache evictions broadcast by the other workers
+    CacheInvalidator.start_listener()
+
+    # Pick the bcrypt cost, then spawn the password hashing workers before the first login arrives
+    await PasswordHasher.configure_cost()
+    PasswordHasher.open_executor()
+
+    # Roll up the recent login events for the dashboard, which only reads the rollup
+    ActivityRollup.start_refresher()
+
+    # Keep the dashboard statistics snapshot fresh ahead of the dashboard loads
+    StatisticsSnapshot.start_refresher()
+
+    # Write the login counters buffered in Redis to the database, in batches
+    LoginCounter.start_flusher()
+
+    # Compile the email templates ahead of the first sign-up (emails are sent from here when Redis is down)
+    epub.precompile_templates()
+
+    # Fetch the Google openid configuration and signing keys ahead of the first Google login, and keep them fresh
+    GoogleLogin.start_refresher()
+
 
 async def on_shutdown():
     """Fastapi shutdown event handler.
@@ -40,7 +69,15 @@ async def on_shutdown():
     log.debug("Execute FastAPI shutdown event handler.")
 
     # Gracefully close utilities.
+    await CacheInvalidator.stop_listener()
+    await StatisticsSnapshot.stop_refresher()
+    await ActivityRollup.stop_refresher()
+    await LoginCounter.stop_flusher()
+    await epub.close()
+    await GoogleLogin.stop_refresher()
+    await SocialLoginHTTP.close_transport()
     await RedisClient.close_redis_client()
+    PasswordHasher.close_executor()
 
     log.debug("All utilities have been gracefully closed.")
 
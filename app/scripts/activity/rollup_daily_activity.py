@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Roll up the login events of the last days into `daily_activity`.
+
+The web workers keep today and yesterday rolled up (see `ActivityRollup`); this is for the older days, e.g. after
+the workers have been down for a while, or for every day when `ACTIVITY_ROLLUP_INTERVAL_SECONDS` is 0.
+
+    python -m app.scripts.activity.rollup_daily_activity --days 30
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from app.db.adapters.activity.activity import rollup_daily_activity
+from app.db.session import async_engine, async_session
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-d', '--days', type=int, default=7, help="Number of days to roll up, up to today (UTC)")
+
+
+async def main():
+    """ Main program """
+    args = parser.parse_args()
+    today = datetime.utcnow().date()
+
+    async with async_session() as session:
+        for days_ago in range(args.days - 1, -1, -1):
+            day = today - timedelta(days=days_ago)
+            await rollup_daily_activity(session, day)
+            print(f"Rolled up {day}")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
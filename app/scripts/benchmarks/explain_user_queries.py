@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Show which plans PostgreSQL picks for the user queries of the dashboard, the listings and the login.
+
+Runs `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` on the very statements the adapters build, against the database of
+the current environment, and reports the scanned indexes of each plan. On a small table the planner rightly prefers
+a sequential scan: seed enough users first, or pass `--no-seqscan` to check the indexes are usable at all.
+
+    python -m app.scripts.benchmarks.explain_user_queries --analyze
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.sql import text
+
+from app.api.v1.endpoints.users.service import get_all_users
+from app.db.adapters.user.user import get_user_statistics, get_unverified_users, get_users, search_users
+from app.db.models.user import User, SignupBy
+from app.db.schemas import QueryParams
+from app.db.session import async_engine
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--analyze', action='store_true', help="Refresh the planner statistics of the user table first")
+parser.add_argument('--no-seqscan', action='store_true', help="Discourage sequential scans (SET enable_seqscan = off)")
+
+
+class CapturedStatement(Exception):
+    def __init__(self, statement):
+        self.statement = statement
+
+
+class StatementRecorder:
+    """ Stands in for the session: captures the first statement an adapter executes, and stops it there """
+
+    async def execute(self, statement, *args, **kwargs):
+        raise CapturedStatement(statement)
+
+
+async def capture(adapter_call) -> str:
+    """ Render the first statement of an adapter call, with its parameters inlined
+
+    :param adapter_call: coroutine of the adapter, called with a `StatementRecorder` as its session
+    :return:
+    """
+    try:
+        await adapter_call
+    except CapturedStatement as captured:
+        return str(captured.statement.compile(dialect=async_engine.dialect, compile_kwargs={"literal_binds": True}))
+
+    raise RuntimeError("The adapter did not run any statement")
+
+
+async def build_statements() -> Dict[str, str]:
+    recorder = StatementRecorder()
+    now = datetime.utcnow()
+    return {
+        "dashboard statistics": await capture(get_user_statistics(recorder, today=now.date())),
+        "unverified sign-ups of the month": await capture(get_unverified_users(recorder, now.year, now.month)),
+        "latest users": await capture(get_users(recorder, limit=10, order_desc=True)),
+        "listing, by signup method": await capture(
+            get_all_users(recorder, QueryParams(signup_by=SignupBy.EMAIL.value))
+        ),
+        "listing, unverified users": await capture(get_all_users(recorder, QueryParams(activated=False))),
+        "datatable search": await capture(search_users(recorder, offset=0, limit=10, search="jo")),
+        "login lookup": await capture(recorder.execute(select(User).where(User.email == "jo@gmail.com"))),
+    }
+
+
+def scanned_indexes(plan: Dict) -> List[str]:
+    """ Node types of a plan tree, with the index they scan if any """
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node = f"{node} using {plan['Index Name']}"
+    elif "Relation Name" in plan:
+        node = f"{node} on {plan['Relation Name']}"
+
+    nodes = [node]
+    for child in plan.get("Plans", []):
+        nodes.extend(scanned_indexes(child))
+    return nodes
+
+
+async def main():
+    """ Main program """
+    args = parser.parse_args()
+    statements = await build_statements()
+
+    async with async_engine.connect() as conn:
+        if args.analyze:
+            await conn.execute(text('ANALYZE "user"'))
+        if args.no_seqscan:
+            await conn.execute(text("SET enable_seqscan = off"))
+
+        for name, statement in statements.items():
+            result = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}"))
+            explained = result.scalar_one()
+            if isinstance(explained, str):
+                explained = json.loads(explained)
+
+            plan = explained[0]
+            nodes = [node for node in scanned_indexes(plan["Plan"]) if "Scan" in node]
+            print(f"{name}: {plan['Execution Time']:.3f} ms")
+            for node in nodes:
+                print(f"    {node}")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the SMTP throughput, in messages per second, of a new connection per message (the previous path) and of
+the pooled connections of `SMTPPool`.
+
+By default, both run against a local SMTP stand-in answering every command after `--latency` seconds, i.e. a
+simulated round-trip; `--host` targets a real SMTP server instead (messages are then really sent, to `--to`).
+
+    python -m app.scripts.benchmarks.smtp_throughput -n 500 -c 4 --latency 0.02
+"""
+import argparse
+import asyncio
+import time
+from email.mime.text import MIMEText
+
+import aiosmtplib
+
+from app.utils.smtp_pool import SMTPPool
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--num-messages', type=int, default=200, help="Number of messages per path")
+parser.add_argument('-c', '--concurrency', type=int, default=4, help="Messages sent at a time (and pool size)")
+parser.add_argument('--latency', type=float, default=0.01, help="Seconds before each reply of the stand-in")
+parser.add_argument('--host', type=str, default=None, help="SMTP server to use instead of the stand-in")
+parser.add_argument('--port', type=int, default=465)
+parser.add_argument('--tls', action='store_true', help="Connect to `--host` over TLS")
+parser.add_argument('--username', type=str, default=None)
+parser.add_argument('--password', type=str, default=None)
+parser.add_argument('--to', type=str, default="someone@example.com", help="Recipient of the messages")
+
+
+class SMTPStandIn(object):
+    """ Bare local SMTP server, accepting every login and message; each reply is delayed by `latency` seconds """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.server = None
+        self.connections = 0
+        self.writers = set()
+        self.messages = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.drop_connections()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_connections(self):
+        """ Close the open connections, as a server does with the idle ones """
+        for writer in list(self.writers):
+            writer.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self.writers.add(writer)
+
+        async def reply(*lines: str):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            writer.write("".join(f"{line}\r\n" for line in lines).encode())
+            await writer.drain()
+
+        try:
+            await reply("220 stand-in ESMTP")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                command = line[:4].upper()
+                if command == b"EHLO":
+                    await reply("250-stand-in", "250-AUTH PLAIN LOGIN", "250 8BITMIME")
+                elif command == b"AUTH":
+                    await reply("235 2.7.0 Authentication successful")
+                elif command == b"DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    message = []
+                    while True:
+                        data_line = await reader.readline()
+                        if data_line in (b".\r\n", b""):
+                            break
+                        message.append(data_line)
+                    self.messages.append(b"".join(message))
+                    await reply("250 2.0.0 OK")
+                elif command == b"QUIT":
+                    await reply("221 2.0.0 Bye")
+                    break
+                else:
+                    # MAIL, RCPT, RSET, NOOP, HELO
+                    await reply("250 2.0.0 OK")
+        except ConnectionError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+def build_message(index: int, recipient: str) -> MIMEText:
+    message = MIMEText(f"<p>Benchmark message {index}</p>", "html")
+    message["From"] = "benchmark@example.com"
+    message["To"] = recipient
+    message["Subject"] = f"SMTP benchmark {index}"
+    return message
+
+
+async def measure(name: str, send, num_messages: int, concurrency: int, recipient: str) -> str:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send_one(index: int):
+        async with slots:
+            await send(build_message(index, recipient))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(send_one(index) for index in range(num_messages)))
+    elapsed = time.perf_counter() - started_at
+    return f"{name:<24} {num_messages} messages in {elapsed:.2f}s: {num_messages / elapsed:.1f} messages/s"
+
+
+async def main():
+    """ Main program """
+    args = parser.parse_args()
+
+    stand_in = None
+    if args.host is None:
+        stand_in = await SMTPStandIn(latency=args.latency).start()
+        server = {"hostname": stand_in.host, "port": stand_in.port, "use_tls": False}
+    else:
+        server = {"hostname": args.host, "port": args.port, "use_tls": args.tls}
+    server.update({"username": args.username, "password": args.password})
+
+    async def send_on_new_connection(message):
+        client = aiosmtplib.SMTP(**server)
+        await client.connect()
+        await client.send_message(message)
+        await client.quit()
+
+    pool = SMTPPool(**server, size=args.concurrency)
+    try:
+        print(await measure(
+            "connection per message", send_on_new_connection, args.num_messages, args.concurrency, args.to,
+        ))
+        print(await measure("pooled connections", pool.send_message, args.num_messages, args.concurrency, args.to))
+        print(f"pool: {pool.stats()}")
+    finally:
+        await pool.close()
+        if stand_in is not None:
+            await stand_in.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
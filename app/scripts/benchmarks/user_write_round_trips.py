@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the two ways of writing a user: commit then `session.refresh` (the previous path), and `update_user`
+(a single `UPDATE ... RETURNING`).
+
+Counts the statements sent to the database and times each write, against the database of the current environment.
+The user is rewritten with its own full name, so nothing changes but `updated_at`.
+
+    python -m app.scripts.benchmarks.user_write_round_trips --email example@example.com -n 200
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import event, select
+
+from app.db.adapters.user.user import update_user
+from app.db.models.user import User
+from app.db.session import async_engine, async_session
+from app.utils import RedisClient
+from app.utils.metrics import percentile_ms
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-e', '--email', type=str, required=True, help="Email of the user to rewrite")
+parser.add_argument('-n', '--num-writes', type=int, default=100, help="Number of writes per path")
+
+
+class StatementCounter(object):
+    """ Counts the statements the engine sends, BEGIN/COMMIT aside """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def update_with_refresh(session, user: User) -> None:
+    """ The previous write path: the ORM flushes the change on commit, then the row is read back """
+    # an unchanged full name would not be flushed at all: set `updated_at`, as its `onupdate` would
+    user.updated_at = datetime.utcnow()
+    await session.commit()
+    await session.refresh(user)
+
+
+async def update_with_returning(session, user: User) -> None:
+    await update_user(session, user, full_name=user.full_name)
+
+
+async def measure(name: str, write, email: str, num_writes: int, counter: StatementCounter) -> Dict:
+    async with async_session() as session:
+        user = (await session.execute(select(User).where(User.email == email))).scalars().one()
+
+        durations: List[float] = []
+        counter.count = 0
+        for _ in range(num_writes):
+            started_at = time.perf_counter()
+            await write(session, user)
+            durations.append(time.perf_counter() - started_at)
+
+    durations.sort()
+    return {
+        "path": name,
+        "statements_per_write": counter.count / num_writes,
+        "p50_ms": percentile_ms(durations, 0.50),
+        "p95_ms": percentile_ms(durations, 0.95),
+    }
+
+
+async def main():
+    """ Main program """
+    args = parser.parse_args()
+
+    # `update_user` invalidates the cached user
+    await RedisClient.open_redis_client()
+
+    counter = StatementCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+    try:
+        for name, write in (("commit + refresh", update_with_refresh), ("UPDATE ... RETURNING", update_with_returning)):
+            print(await measure(name, write, args.email, args.num_writes, counter))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
+        await RedisClient.close_redis_client()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Send the queued emails, see `app.utils.email_queue`.
+
+Run as many workers as needed, next to the web workers; each one sends up to `EMAIL_WORKER_CONCURRENCY` emails at a
+time. SIGINT/SIGTERM stop claiming new emails, and let the ones in progress finish.
+
+    python -m app.scripts.mails.email_worker --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.utils import RedisClient
+from app.utils.email_publisher import epub
+from app.utils.email_queue import EmailQueue
+
+L = logging.getLogger("uvicorn.error")
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    '-c', '--concurrency', type=int, default=settings.EMAIL_WORKER_CONCURRENCY,
+    help="Number of emails sent at a time",
+)
+parser.add_argument(
+    '-p', '--poll', type=float, default=settings.EMAIL_WORKER_POLL_SECONDS,
+    help="Seconds to wait before polling an empty queue again",
+)
+
+
+async def send(raw: str, job: dict, slots: asyncio.Semaphore):
+    """ Send a claimed email, then drop or reschedule its job
+
+    :param raw: claimed job, as stored
+    :param job: claimed job, decoded
+    :param slots: released once done
+    :return:
+    """
+    try:
+        if await epub.compose_and_wait(job["email"]):
+            await EmailQueue.complete(raw)
+        else:
+            await EmailQueue.fail(raw, job)
+    finally:
+        slots.release()
+
+
+async def main():
+    """ Main program """
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    await RedisClient.open_redis_client()
+    if not await RedisClient.ping():
+        L.error("Could not connect to Redis ... Retrying ...")
+
+    epub.precompile_templates()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    slots = asyncio.Semaphore(args.concurrency)
+    tasks = set()
+    L.info(f"Email worker started, sending up to {args.concurrency} emails at a time")
+    while not stopping.is_set():
+        await slots.acquire()
+        claimed = await EmailQueue.claim()
+        if claimed is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(stopping.wait(), args.poll)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        task = asyncio.ensure_future(send(*claimed, slots))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        L.info(f"Email worker stopping, waiting for {len(tasks)} emails")
+        await asyncio.gather(*tasks, return_exceptions=True)
+    L.info(f"Email worker stopped: {EmailQueue.stats()}, SMTP: {epub.get_smtp_pool().stats()}")
+
+    await epub.close()
+    await RedisClient.close_redis_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
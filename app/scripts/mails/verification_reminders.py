@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Remind the unverified users to verify their email, with a fresh verification link.
+
+The users are read in chunks, in sign-up order, with a keyset on (`created_at`, `id`) served by the partial index on
+the unverified users; each chunk is a short query of its own. The emails of a chunk are rendered and sent
+concurrently through the SMTP pool of `epub`, at most `--rate` per second. Once a chunk is done, its last user is
+saved as the checkpoint of the campaign, in Redis: running the same campaign again resumes after it (only the chunk
+in progress is sent again after a crash). An email the SMTP server refused is handed to the email queue, for its
+retries. Prints the throughput of the run.
+
+    python -m app.scripts.mails.verification_reminders --campaign reminders-2022-03 --older-than-hours 24 --rate 5
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Mapping, Optional
+
+from sqlalchemy import select, tuple_
+
+from app.core.config import settings, smtp as smtp_conf
+from app.core.security import create_email_verification_token
+from app.db.models.user import User
+from app.db.session import async_engine, async_session
+from app.utils import RedisClient
+from app.utils.email_publisher import epub
+from app.utils.email_queue import EmailQueue
+from app.webapps.auth.route import router as auth_router
+from app.webapps.auth.service import build_email_payload
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--campaign', type=str, required=True, help="Campaign name; a campaign resumes where it stopped")
+parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint, start over from the first user")
+parser.add_argument(
+    '--older-than-hours', type=float, default=24, help="Only remind the users who signed up longer ago than this",
+)
+parser.add_argument('--base-url', type=str, default=settings.APP_WEBSITE, help="Root URL of the verification link")
+parser.add_argument('-s', '--chunk-size', type=int, default=500, help="Number of users read at a time")
+parser.add_argument(
+    '-c', '--concurrency', type=int, default=smtp_conf.SMTP_POOL_SIZE, help="Number of emails sent at a time",
+)
+parser.add_argument('-r', '--rate', type=float, default=10, help="Maximum number of emails per second; 0: no limit")
+
+CHECKPOINT_TTL_SECONDS = 30 * 24 * 3600
+
+
+class RateLimiter(object):
+    """ Spaces the callers out, `rate` per second at most """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+
+        now = time.monotonic()
+        slot = max(now, self.next_at)
+        self.next_at = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class VerificationReminderCampaign(object):
+    """ Sends a verification reminder to each unverified user, once per campaign """
+
+    def __init__(
+            self,
+            name: str,
+            base_url: str,
+            signed_up_before: datetime,
+            chunk_size: int = 500,
+            concurrency: int = 4,
+            rate: float = 10,
+    ):
+        self.name = name
+        self.verify_url = base_url.rstrip("/") + auth_router.url_path_for("verify_email")
+        self.signed_up_before = signed_up_before
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate)
+        self.checkpoint_key = f"email-campaign:{name}:checkpoint"
+        self.report = {"users": 0, "sent": 0, "queued": 0, "chunks": 0}
+
+    async def run(self, restart: bool = False) -> Dict:
+        """ Send the reminders, from the checkpoint of the campaign unless `restart`
+
+        :param restart:
+        :return: report of the run
+        """
+        checkpoint = None if restart else await self.load_checkpoint()
+        slots = asyncio.Semaphore(self.concurrency)
+        started_at = time.perf_counter()
+
+        while True:
+            users = await self.read_chunk(checkpoint)
+            if not users:
+                break
+
+            await asyncio.gather(*(self.remind(user, slots) for user in users))
+            checkpoint = (users[-1]["created_at"], users[-1]["id"])
+            await self.save_checkpoint(checkpoint)
+
+            self.report["users"] += len(users)
+            self.report["chunks"] += 1
+            print(f"[{self.name}] {self.report['users']} users reminded, up to user {checkpoint[1]}")
+
+        elapsed = time.perf_counter() - started_at
+        self.report.update({
+            "elapsed_seconds": round(elapsed, 3),
+            "emails_per_second": round(self.report["users"] / elapsed, 1) if elapsed else 0,
+            "smtp_pool": epub.get_smtp_pool().stats(),
+        })
+        return self.report
+
+    async def read_chunk(self, checkpoint: Optional[tuple]) -> List[Mapping]:
+        query = select(User.id, User.full_name, User.email, User.created_at).where(
+            User.activated.is_(False),
+            User.created_at < self.signed_up_before,
+        )
+        if checkpoint is not None:
+            query = query.where(tuple_(User.created_at, User.id) > tuple_(*checkpoint))
+
+        async with async_session() as session:
+            result = await session.execute(query.order_by(User.created_at, User.id).limit(self.chunk_size))
+            return result.mappings().all()
+
+    async def remind(self, user: Mapping, slots: asyncio.Semaphore):
+        async with slots:
+            await self.rate_limiter.wait()
+
+            token, _ = create_email_verification_token(user["email"])
+            payload = await build_email_payload(user["full_name"], user["email"], f"{self.verify_url}?token={token}")
+            if await epub.compose_and_wait(payload):
+                self.report["sent"] += 1
+                return
+
+        # refused, or the SMTP server is unreachable: the email worker retries it with a backoff
+        await EmailQueue.enqueue(payload)
+        self.report["queued"] += 1
+
+    async def load_checkpoint(self) -> Optional[tuple]:
+        checkpoint = await RedisClient.get(self.checkpoint_key)
+        if not checkpoint:
+            return None
+
+        checkpoint = json.loads(checkpoint)
+        return datetime.fromisoformat(checkpoint["created_at"]), checkpoint["id"]
+
+    async def save_checkpoint(self, checkpoint: tuple):
+        created_at, user_id = checkpoint
+        value = json.dumps({"created_at": created_at.isoformat(), "id": user_id})
+        if not await RedisClient.set(self.checkpoint_key, value, CHECKPOINT_TTL_SECONDS):
+            print(f"[{self.name}] WARNING: the checkpoint could not be saved, the campaign cannot be resumed")
+
+
+async def main():
+    """ Main program """
+    args = parser.parse_args()
+
+    await RedisClient.open_redis_client()
+    epub.precompile_templates()
+
+    campaign = VerificationReminderCampaign(
+        name=args.campaign,
+        base_url=args.base_url,
+        signed_up_before=datetime.utcnow() - timedelta(hours=args.older_than_hours),
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        rate=args.rate,
+    )
+    try:
+        report = await campaign.run(restart=args.restart)
+        print(json.dumps(report, indent=4))
+    finally:
+        await epub.close()
+        await RedisClient.close_redis_client()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,25 +1,81 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""
+Generate a dummy user dataset, e.g. a load-test fixture, streamed to a NDJSON or CSV file.
+
+The users are generated in chunks, fanned out to a process pool, and written in order as they come back; at most a
+few chunks per worker are in memory at any time, whatever the number of users. The same `--seed`, `--now` and
+chunk size give the same file (the bcrypt salts aside).
+
+    python -m app.scripts.users.generate_dummy_dataset -n 10000000 -e dummy_users.csv --raw --seed 42
+"""
 import argparse
-from app.scripts.users.generator import DummyUserDataGenerator
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app.core.security import get_password_hash
+from app.scripts.users.generator import generate_chunk, dataset_columns
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-n', '--num-users', type=int, default=20, help="Total number of users to be generated")
-parser.add_argument('-e', '--export-path', type=str, default="dummy_users.json", help="Path to export json file")
+parser.add_argument('-e', '--export-path', type=str, default="dummy_users.ndjson", help="Path of the exported file")
+parser.add_argument(
+    '-f', '--format', type=str, choices=["ndjson", "csv"], default=None,
+    help="Format of the exported file; guessed from its extension by default",
+)
+parser.add_argument('-s', '--seed', type=int, default=0, help="Seed of the random generation")
+parser.add_argument(
+    '--now', type=datetime.fromisoformat, default=None,
+    help="Reference time of the sign-up/session dates (ISO format); the current time by default",
+)
+parser.add_argument('-w', '--workers', type=int, default=None, help="Worker processes; the number of CPUs by default")
+parser.add_argument('-c', '--chunk-size', type=int, default=10000, help="Users generated per task")
+parser.add_argument('--raw', action='store_true', help="Export plain passwords (the full names) rather than hashes")
+parser.add_argument(
+    '--shared-password', type=str, default=None,
+    help="Give every user this password, hashed once, rather than hashing each one (bcrypt is slow)",
+)
 
 
 def main():
     """ Main program """
     args = parser.parse_args()
-    generator = DummyUserDataGenerator(args.num_users, args.export_path)
-    generator.run()
-
-    # # Opening JSON file
-    # import json
-    # json_file = open('dummy_users.json')
-    # try load json
-    # data = json.load(json_file)
-    # print(data)
+    export_format = args.format or ("csv" if args.export_path.endswith(".csv") else "ndjson")
+    workers = args.workers or os.cpu_count() or 1
+    now = args.now or datetime.now()
+    shared_hash = get_password_hash(args.shared_password) if args.shared_password and not args.raw else None
+    print("Generating {} users with --seed {} --now {}".format(args.num_users, args.seed, now.isoformat()))
+
+    starts = range(0, args.num_users, args.chunk_size)
+    window = workers * 2  # chunks in flight: keeps every worker busy, and the memory bounded
+    written = 0
+    started_at = time.perf_counter()
+
+    with open(args.export_path, 'w', encoding='utf-8', newline='') as f, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        if export_format == "csv":
+            f.write(",".join(dataset_columns(args.raw)) + "\r\n")
+
+        def submit(start):
+            size = min(args.chunk_size, args.num_users - start)
+            return executor.submit(
+                generate_chunk, args.seed, start, size, now, export_format, args.raw, shared_hash,
+            ), size
+
+        pending = [submit(start) for start in starts[:window]]
+        for index in range(len(starts)):
+            future, size = pending.pop(0)
+            if index + window < len(starts):
+                pending.append(submit(starts[index + window]))
+
+            f.write(future.result())
+            written += size
+            elapsed = time.perf_counter() - started_at
+            print("{}/{} users written, {:.0f} users/s".format(written, args.num_users, written / elapsed))
+
+    print("Exported to {}".format(args.export_path))
 
 
 if __name__ == "__main__":
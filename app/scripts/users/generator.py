@@ -1,14 +1,44 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import bisect
+import csv
+import io
 import json
 import random
 from app.core.security import get_password_hash
 from app.db.schemas.user.user import UserDummyCreate
 from app.db.models.user import SignupBy
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 import names
 from datetime import timedelta, datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _name_table(filename: str) -> Tuple[List[float], List[str]]:
+    """ Cumulative frequencies and names of a `names` distribution file, loaded once per process """
+    cumulatives, table = [], []
+    with open(filename) as name_file:
+        for line in name_file:
+            name, _, cumulative, _ = line.split()
+            cumulatives.append(float(cumulative))
+            table.append(name)
+
+    return cumulatives, table
+
+
+def _random_name(filename: str) -> str:
+    cumulatives, table = _name_table(filename)
+    index = bisect.bisect_right(cumulatives, random.random() * 90)
+    return table[index] if index < len(table) else ""
+
+
+def random_full_name() -> str:
+    """ Same draws and result as `names.get_full_name()`, without reading the distribution files at each call """
+    gender = random.choice(('male', 'female'))
+    first_name = _random_name(names.FILES['first:%s' % gender]).capitalize()
+    return "{0} {1}".format(first_name, _random_name(names.FILES['last']).capitalize())
 
 
 class DummyUserModel(BaseModel):
@@ -46,11 +76,15 @@ class DummyUserDataGenerator:
         await self.__generate()
 
     async def generate_one(self, default_activated=None, raw=False):
+        return self.generate(default_activated=default_activated, raw=raw)
+
+    def generate(self, default_activated=None, raw=False, now=None):
+        """ Generate a random user; only `random` is used, so `random.seed` makes it reproducible along with `now` """
         # create a random user
-        rand_full_name = names.get_full_name().lower()
+        rand_full_name = random_full_name().lower()
 
         # get date by randoming between this week and last three week ago
-        today_dt = datetime.now()
+        today_dt = now or datetime.now()
         today_date = today_dt.date()
         today_time = today_dt.time()
         weekday = today_date.weekday()
@@ -74,14 +108,13 @@ class DummyUserDataGenerator:
 
         # otherwise, if login by Email, randomize the activation status between True or False
         else:
-            activated = default_activated
+            activated = bool(default_activated)  # `activated` is not nullable
             signup_by = SignupBy.EMAIL.value  # generate variable values
 
         # generate a random user detailed information based on the generate random name
         user = {
             "full_name": rand_full_name,
             "email": "{}@gmail.com".format(rand_full_name.replace(" ", ".")),
-            "hashed_password": get_password_hash(rand_full_name),
             "total_login": random.randint(0, 60),
             "signup_by": signup_by,
             "activated": activated,
@@ -117,3 +150,54 @@ class DummyUserDataGenerator:
     def export_to_json_file(self, generated_users):
         with open(self.path, 'w', encoding='utf-8') as f:
             json.dump(generated_users, f, ensure_ascii=False, indent=4)
+
+
+def generate_chunk(
+        seed: int,
+        start: int,
+        size: int,
+        now: datetime,
+        export_format: str,
+        raw: bool = False,
+        shared_hash: Optional[str] = None,
+) -> str:
+    """ Generate and serialize the users `start` to `start + size`; runs in a worker process
+
+    The users only depend on the arguments (the bcrypt salts aside), whichever worker generates them.
+
+    :param seed:
+    :param start: index of the first user; makes the emails unique
+    :param size:
+    :param now: reference time of the sign-up/session dates
+    :param export_format: `ndjson` or `csv`
+    :param raw: plain passwords rather than hashes
+    :param shared_hash: hash of the password shared by every user; each password is hashed otherwise
+    :return:
+    """
+    random.seed(f"{seed}:{start}")
+    generator = DummyUserDataGenerator(size)
+    columns = dataset_columns(raw)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for index in range(start, start + size):
+        user = generator.generate(raw=True, now=now)
+        local_part, domain = user["email"].split("@")
+        user["email"] = "{}.{}@{}".format(local_part, index, domain)
+        if not raw:
+            user["hashed_password"] = shared_hash or get_password_hash(user.pop("password"))
+
+        row = [user[column].isoformat() if isinstance(user[column], datetime) else user[column] for column in columns]
+        if export_format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+    return buffer.getvalue()
+
+
+def dataset_columns(raw: bool = False) -> List[str]:
+    return [
+        "full_name", "email", "password" if raw else "hashed_password", "total_login", "signup_by", "activated",
+        "created_at", "updated_at", "session_at",
+    ]
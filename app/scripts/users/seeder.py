@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import get_password_hash
+from app.db.models.user import User
+from app.scripts.users.generator import DummyUserDataGenerator
+
+# columns written for each dummy user, in the COPY record order
+COLUMNS = (
+    "full_name", "email", "hashed_password", "total_login", "signup_by", "activated", "created_at", "updated_at",
+    "session_at",
+)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """ Hash a chunk of passwords; runs in a worker process """
+    return [get_password_hash(password) for password in passwords]
+
+
+class DummyUserSeeder:
+    """
+    Bulk insert of dummy users, e.g. for load tests
+
+    Users are generated, hashed and inserted one batch at a time, in a transaction per batch: with `COPY` on
+    PostgreSQL (asyncpg), with a single `executemany` INSERT otherwise. bcrypt dominates the cost, so the passwords of
+    the next batch are hashed in a process pool while the current batch is being inserted, unless a shared password
+    is given, which is hashed once.
+    """
+
+    def __init__(
+            self,
+            num_users: int,
+            batch_size: int = 1000,
+            password: Optional[str] = None,
+            first_index: int = 0,
+            workers: Optional[int] = None,
+    ):
+        self.num_users = num_users
+        self.batch_size = batch_size
+        self.password = password
+        self.first_index = first_index  # keeps the emails unique across several seedings
+        self.workers = workers or os.cpu_count() or 1
+        self.generator = DummyUserDataGenerator(num_users)
+
+    async def run(self, session: AsyncSession) -> int:
+        """ Insert all the dummy users, printing the progress and the throughput after each batch
+
+        :param session:
+        :return: number of users inserted
+        """
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        inserted = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            shared_hash = None
+            if self.password is not None:
+                shared_hash = await loop.run_in_executor(executor, get_password_hash, self.password)
+
+            starts = range(0, self.num_users, self.batch_size)
+            pending = asyncio.ensure_future(self._prepare(executor, starts[0], shared_hash)) if starts else None
+            for index, start in enumerate(starts):
+                rows = await pending
+                if index + 1 < len(starts):
+                    # hash the next batch while this one is being inserted
+                    pending = asyncio.ensure_future(self._prepare(executor, starts[index + 1], shared_hash))
+
+                await self._insert(session, rows)
+                inserted += len(rows)
+
+                elapsed = time.perf_counter() - started_at
+                print("{}/{} dummy users inserted, {:.0f} users/s".format(inserted, self.num_users, inserted / elapsed))
+
+        return inserted
+
+    async def _prepare(self, executor: ProcessPoolExecutor, start: int, shared_hash: Optional[str]) -> List[Dict]:
+        """ Generate a batch of users, with their password hashed """
+        size = min(self.batch_size, self.num_users - start)
+        rows = []
+        for offset in range(size):
+            user = await self.generator.generate_one(raw=True)
+            local_part, domain = user["email"].split("@")
+            user["email"] = "{}.{}@{}".format(local_part, self.first_index + start + offset, domain)
+            rows.append(user)
+
+        if shared_hash is not None:
+            hashes = [shared_hash] * size
+        else:
+            # one chunk per worker, to keep the inter-process round trips down
+            passwords = [user.pop("password") for user in rows]
+            chunk_size = -(-size // self.workers)
+            loop = asyncio.get_running_loop()
+            chunks = await asyncio.gather(*[
+                loop.run_in_executor(executor, hash_passwords, passwords[i:i + chunk_size])
+                for i in range(0, size, chunk_size)
+            ])
+            hashes = [hashed for chunk in chunks for hashed in chunk]
+
+        for user, hashed in zip(rows, hashes):
+            user.pop("password", None)
+            user["hashed_password"] = hashed
+
+        return rows
+
+    async def _insert(self, session: AsyncSession, rows: List[Dict]) -> None:
+        connection = await session.connection()
+        if connection.dialect.driver == "asyncpg":
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.connection.driver_connection.copy_records_to_table(
+                User.__tablename__,
+                records=[tuple(row[column] for column in COLUMNS) for row in rows],
+                columns=COLUMNS,
+            )
+        else:
+            await session.execute(insert(User.__table__), rows)
+
+        await session.commit()
@@ -0,0 +1,45 @@
+// Initiate the users datatable; pages are loaded on demand (server-side processing)
+(function() {
+    'use strict';
+
+    var table = $('#users-datatable');
+    // the rows are no longer rendered by Jinja: escape the user provided values
+    var text = $.fn.dataTable.render.text();
+
+    table.DataTable({
+        responsive: true,
+        pageLength: 20,
+        lengthChange: false,
+        searching: true,
+        ordering: true,
+        order: [[0, 'desc']],
+        processing: true,
+        serverSide: true,
+        searchDelay: 400,
+        ajax: {
+            url: table.data('source'),
+            error: function(xhr) {
+                // the session has expired: go back to the login page
+                if (xhr.status === 401) {
+                    window.location.reload();
+                }
+            }
+        },
+        columns: [
+            {data: 'id'},
+            {data: 'full_name', render: text},
+            {data: 'email', render: text},
+            {data: 'signup_by', render: text},
+            {data: 'total_login'},
+            {data: 'session_at', render: text},
+            {
+                data: 'activated',
+                render: function(activated) {
+                    return activated
+                        ? '<b class="text-end text-success">ACTIVATED</b>'
+                        : '<b class="text-end text-danger">INACTIVE</b>';
+                }
+            }
+        ]
+    });
+})();
@@ -3,6 +3,7 @@ from typing import Dict
 from httpx import AsyncClient
 
 from app.db.models.user import User
+from app.utils import RedisClient
 from app.api.v1.endpoints.auth.utils import AuthErrMessage
 
 # All test coroutines in file will be treated as marked (async allowed).
@@ -216,6 +217,40 @@ async def test_invalid_refresh_token(
     assert refresh_token_resp.status_code == 403
 
 
+async def test_revoked_refresh_token(
+        client: AsyncClient,
+        default_activated_user: User,  # to enforce the creation of activated user
+        activated_user_data: Dict,
+        monkeypatch,
+):
+    """ Test refresh token of a well-formed refresh token that is no longer stored in Redis
+
+    :param client:`
+    :param default_activated_user:
+    :param activated_user_data:
+    :param monkeypatch:
+    :return:
+    """
+    access_token_resp = await get_token_resp(client, activated_user_data)
+    assert access_token_resp.status_code == 200
+    refresh_token = access_token_resp.json()["refresh_token"]
+
+    # the check-and-store script reports the refresh token as missing
+    async def run_script(source, keys=(), args=()):
+        return 0
+
+    monkeypatch.setattr(RedisClient, "run_script", run_script)
+
+    refresh_token_resp = await client.post(
+        "/api/v1/auth/refresh-token",  # refresh-token endpoint
+        json={
+            "refresh_token": refresh_token
+        }
+    )
+    assert refresh_token_resp.status_code == 403
+    assert refresh_token_resp.json()["detail"] == "Invalidated/Invalid refresh token"
+
+
 async def get_token_resp(client: AsyncClient, user_data: Dict):
     """ Get access token response
 
@@ -0,0 +1,144 @@
+import time
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api import deps
+from app.api.deps import get_token_payload, token_cache
+from app.core import security
+from app.db.adapters.user.cache import UserCache
+from app.db.adapters.user.user import get_user_by_email, update_current_full_name
+from app.db.models.user import User
+from app.utils.cache import LRUCache, CacheInvalidator
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def test_lru_cache_evicts_least_recently_used():
+    """ Test that a full cache drops the least recently used entry first
+
+    :return:
+    """
+    cache = LRUCache("test-lru", max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # `b` becomes the least recently used
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+async def test_lru_cache_entry_expiry():
+    """ Test that an entry never outlives its own TTL, nor the cache TTL
+
+    :return:
+    """
+    cache = LRUCache("test-ttl", max_size=10, ttl=60)
+    cache.set("expired", 1, ttl=-1)
+    cache.set("short", 2, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("expired") is None
+    assert cache.get("short") is None
+    assert LRUCache("disabled", max_size=10, ttl=0).enabled is False
+
+
+async def test_token_payload_cached_until_invalidated():
+    """ Test that verified token claims are served from the cache, and evicted on revocation
+
+    :return:
+    """
+    access_token, _ = security.create_access_token(42)
+    digest = security.token_digest(access_token)
+
+    token_data = await get_token_payload(access_token)
+    assert token_data.sub == 42
+    assert token_cache.get(digest) is token_data
+
+    # served from the cache on the next call, without decoding again
+    assert await get_token_payload(access_token) is token_data
+
+    await CacheInvalidator.invalidate(token_cache.name, digest)
+    assert token_cache.get(digest) is None
+
+
+async def test_token_payload_not_cached_when_revoked_meanwhile(monkeypatch):
+    """ Test that a token revoked while it is being checked is not cached
+
+    :param monkeypatch:
+    :return:
+    """
+    access_token, _ = security.create_access_token(43)
+    digest = security.token_digest(access_token)
+
+    async def revoked_after_check(token: str) -> bool:
+        # the revocation broadcast lands right after the (negative) revocation check
+        await CacheInvalidator.invalidate(token_cache.name, digest)
+        return False
+
+    monkeypatch.setattr(deps, "token_revoked", revoked_after_check)
+
+    token_data = await get_token_payload(access_token)
+    assert token_data.sub == 43
+    assert token_cache.get(digest) is None
+
+
+async def test_user_cache_read_through_and_invalidation(session: AsyncSession, default_activated_user: User):
+    """ Test that user lookups are served from the cache, and that the write helpers invalidate it
+
+    :param session:
+    :param default_activated_user:
+    :return:
+    """
+    email = default_activated_user.email
+    await UserCache.invalidate(default_activated_user)
+
+    # first lookup loads from the database, the second one is served from the cache
+    await get_user_by_email(session, email)
+    local_hits = UserCache.counters["local_hits"]
+    cached_user = await get_user_by_email(session, email)
+    assert UserCache.counters["local_hits"] == local_hits + 1
+    assert "hashed_password" not in UserCache.local.get(f"{UserCache.key_prefix}:email:{email}")
+    assert cached_user.id == default_activated_user.id
+    assert cached_user.full_name == default_activated_user.full_name
+
+    # a cached (detached) user can be written through the adapters, which drop the stale snapshot
+    await update_current_full_name(session, cached_user, "renamed.user")
+    assert UserCache.local.get(f"{UserCache.key_prefix}:email:{email}") is None
+
+    reloaded_user = await get_user_by_email(session, email)
+    assert reloaded_user.full_name == "renamed.user"
+
+    await update_current_full_name(session, reloaded_user, default_activated_user.full_name)
+
+
+async def test_user_cache_skips_snapshot_invalidated_meanwhile(
+        session: AsyncSession, default_activated_user: User, monkeypatch
+):
+    """ Test that a row loaded before an invalidation is not stored over it
+
+    :param session:
+    :param default_activated_user:
+    :param monkeypatch:
+    :return:
+    """
+    email = default_activated_user.email
+    await UserCache.invalidate(default_activated_user)
+    execute = session.execute
+
+    async def execute_then_invalidate(*args, **kwargs):
+        # the user is updated, and invalidated, by another request while this one loads it
+        result = await execute(*args, **kwargs)
+        await UserCache.invalidate(default_activated_user)
+        return result
+
+    monkeypatch.setattr(session, "execute", execute_then_invalidate)
+    user = await get_user_by_email(session, email)
+
+    assert user.id == default_activated_user.id
+    assert UserCache.local.get(f"{UserCache.key_prefix}:email:{email}") is None
@@ -0,0 +1,193 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models.user import User
+from app.db.models.activity import DailyActivity, LoginEvent
+from app.db.adapters.activity.rollup import ActivityRollup
+from app.db.adapters.user.user import get_users, get_user_statistics, get_unverified_users
+from app.db.adapters.activity.activity import rollup_daily_activity, get_daily_activity
+from app.webapps.dashboard.service import get_statistics
+from app.webapps.user import service as user_service
+from app.webapps.user.service import load_users_datatable
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def test_user_statistics(session: AsyncSession, default_activated_user: User, default_inactive_user: User):
+    """ Test the aggregate statistics query against counts made over every user row
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :return:
+    """
+    today = datetime.utcnow().date()
+    users = (await session.execute(select(User))).scalars().all()
+
+    counts = await get_user_statistics(session, today=today)
+
+    assert set(counts.keys()) == {"total_users", "total_unver_acc_tmonth"}
+    assert counts["total_users"] == len(users)
+    assert counts["total_unver_acc_tmonth"] == len([
+        u for u in users
+        if not u.activated and (u.created_at.year, u.created_at.month) == (today.year, today.month)
+    ])
+    assert counts["total_unver_acc_tmonth"] >= 1  # at least `default_inactive_user`
+
+
+async def test_latest_users(session: AsyncSession, default_activated_user: User, default_inactive_user: User):
+    """ Test the latest users list is ordered before being limited
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :return:
+    """
+    users = await get_users(session, limit=1, order_desc=True)
+    newest = (await session.execute(select(User).order_by(User.created_at.desc()))).scalars().first()
+
+    assert len(users) == 1
+    assert users[0]["email"] == newest.email
+
+
+async def test_unverified_users(session: AsyncSession, default_activated_user: User, default_inactive_user: User):
+    """ Test the unverified users of a month are those created within that month only
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :return:
+    """
+    created_at = default_inactive_user.created_at
+
+    users = await get_unverified_users(session, created_at.year, created_at.month)
+    emails = [user["email"] for user in users]
+    assert default_inactive_user.email in emails
+    assert default_activated_user.email not in emails
+
+    previous_month = created_at.replace(day=1) - timedelta(days=1)
+    users = await get_unverified_users(session, previous_month.year, previous_month.month)
+    assert default_inactive_user.email not in [user["email"] for user in users]
+
+
+async def test_users_datatable(session: AsyncSession, default_activated_user: User, default_inactive_user: User):
+    """ Test the DataTables server-side page: counts, sort, search and page length
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :return:
+    """
+    total = len((await session.execute(select(User))).scalars().all())
+
+    page = await load_users_datatable(session, {
+        "draw": "3", "start": "0", "length": "1", "order[0][column]": "2", "order[0][dir]": "asc",
+    })
+    assert page["draw"] == 3
+    assert page["recordsTotal"] == page["recordsFiltered"] == total
+    assert len(page["data"]) == 1
+    assert "hashed_password" not in page["data"][0]
+    first_email = (await session.execute(select(User.email).order_by(User.email))).scalars().first()
+    assert page["data"][0]["email"] == first_email
+
+    # prefix search on the email (or the full name), case-insensitive
+    page = await load_users_datatable(session, {"start": "0", "length": "-1", "search[value]": "INACTIVE.U"})
+    assert page["recordsTotal"] == total
+    assert page["recordsFiltered"] == 1
+    assert [user["email"] for user in page["data"]] == [default_inactive_user.email]
+
+    # a LIKE wildcard is matched literally
+    page = await load_users_datatable(session, {"search[value]": "%"})
+    assert page["recordsFiltered"] == 0
+
+
+async def test_users_datatable_total_estimated(session: AsyncSession, default_activated_user: User, monkeypatch):
+    """ Test a draw asks for the estimated table total, and only counts exactly the search matches
+
+    :param session:
+    :param default_activated_user:
+    :param monkeypatch:
+    :return:
+    """
+    totals, exact_counts = [], []
+
+    async def count_all_users(session, where_by, count):
+        totals.append(count)
+        return 1234, True
+
+    async def count_users(session, search=None):
+        exact_counts.append(search)
+        return 1
+
+    monkeypatch.setattr(user_service, "count_all_users", count_all_users)
+    monkeypatch.setattr(user_service, "count_users", count_users)
+
+    page = await load_users_datatable(session, {"start": "20", "length": "10"})
+    assert page["recordsTotal"] == page["recordsFiltered"] == 1234
+    assert exact_counts == []
+
+    page = await load_users_datatable(session, {"search[value]": "default"})
+    assert (page["recordsTotal"], page["recordsFiltered"]) == (1234, 1)
+    assert exact_counts == ["default"]
+    assert totals == ["estimated", "estimated"]
+
+
+async def test_daily_activity(session: AsyncSession, default_activated_user: User, default_inactive_user: User):
+    """ Test the rollup counts every login of a day, and each user once as active
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :return:
+    """
+    day = datetime(2021, 3, 14).date()
+    day_start = datetime(2021, 3, 14)
+    for user, logged_at in [
+        (default_activated_user, day_start),
+        (default_activated_user, day_start + timedelta(hours=23, minutes=59)),
+        (default_inactive_user, day_start + timedelta(hours=12)),
+        (default_inactive_user, day_start + timedelta(days=1)),  # the next day
+    ]:
+        session.add(LoginEvent(user_id=user.id, logged_at=logged_at))
+    await session.commit()
+
+    await rollup_daily_activity(session, day)
+    await rollup_daily_activity(session, day)  # rolling up again replaces the row
+    activity = await get_daily_activity(session, start=day - timedelta(days=1), end=day)
+    assert [dict(row) for row in activity] == [{"day": day, "active_users": 2, "logins": 3}]
+
+
+async def test_statistics_sessions(
+        session: AsyncSession,
+        default_activated_user: User,
+        default_inactive_user: User,
+):
+    """ Test the dashboard session counts come from the rolled up login events, today's included
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :return:
+    """
+    session.add(LoginEvent(user_id=default_activated_user.id, logged_at=datetime.utcnow()))
+    await session.commit()
+
+    # the statistics only read the rollup, which is brought up to date in the background
+    today = datetime.utcnow().date()
+    assert not await session.scalar(select(DailyActivity.day).where(DailyActivity.day == today))
+    await get_statistics(session)
+    assert not await session.scalar(select(DailyActivity.day).where(DailyActivity.day == today))
+
+    assert await ActivityRollup.rollup()
+    statistics = await get_statistics(session)
+
+    today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    logged_today = (await session.execute(
+        select(LoginEvent.user_id).where(LoginEvent.logged_at >= today_start).distinct()
+    )).scalars().all()
+    assert default_activated_user.id in logged_today
+    assert statistics["total_session_today"] == len(logged_today)
+    assert statistics["total_session_7days"] >= 1
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.db.models.user import User
+from app.utils import RedisClient
+from app.webapps.dashboard.service import StatisticsSnapshot
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def computations(monkeypatch):
+    """ Count the statistics computations, with an empty snapshot to start with
+
+    :param monkeypatch:
+    :return:
+    """
+    calls = []
+    compute = StatisticsSnapshot._compute
+
+    async def counted_compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)  # long enough for the concurrent loads to pile up
+        return await compute()
+
+    monkeypatch.setattr(StatisticsSnapshot, "_compute", counted_compute)
+    monkeypatch.setattr(StatisticsSnapshot, "snapshot", None)
+    monkeypatch.setattr(StatisticsSnapshot, "refresh_task", None)
+    return calls
+
+
+async def test_single_flight(computations, default_activated_user: User):
+    """ Test concurrent loads of a missing snapshot share a single computation
+
+    :param computations:
+    :param default_activated_user:
+    :return:
+    """
+    snapshots = await asyncio.gather(*[StatisticsSnapshot.get() for _ in range(5)])
+
+    assert len(computations) == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert snapshots[0]["statistics"]["total_users"] >= 1
+
+
+async def test_stale_while_revalidate(computations, default_activated_user: User):
+    """ Test an expired snapshot is served right away, then refreshed in the background
+
+    :param computations:
+    :param default_activated_user:
+    :return:
+    """
+    fresh = await StatisticsSnapshot.get()
+    stale = dict(fresh, as_of=fresh["as_of"] - timedelta(seconds=settings.DASHBOARD_STATS_TTL_SECONDS + 1))
+    StatisticsSnapshot.snapshot = stale
+
+    assert await StatisticsSnapshot.get() is stale
+
+    await StatisticsSnapshot.refresh_task
+    assert len(computations) == 2
+    assert StatisticsSnapshot.snapshot["as_of"] > stale["as_of"]
+
+
+async def test_refresh_releases_own_lock_only(computations, default_activated_user: User, monkeypatch):
+    """ Test a refresh releases the lock with its own token, never with a blind delete
+
+    :param computations:
+    :param default_activated_user:
+    :param monkeypatch:
+    :return:
+    """
+    locks, released = {}, []
+
+    async def set_value(key, value, expired=None, nx=False):
+        if key == StatisticsSnapshot.lock_key:
+            locks[key] = value
+        return True
+
+    async def release_lock(key, token):
+        released.append((key, token))
+        return True
+
+    async def delete(*keys):
+        assert StatisticsSnapshot.lock_key not in keys
+        return len(keys)
+
+    monkeypatch.setattr(RedisClient, "set", set_value)
+    monkeypatch.setattr(RedisClient, "release_lock", release_lock)
+    monkeypatch.setattr(RedisClient, "delete", delete)
+
+    await StatisticsSnapshot.refresh()
+    await StatisticsSnapshot.refresh()
+
+    assert len(released) == 2
+    assert released[-1] == (StatisticsSnapshot.lock_key, locks[StatisticsSnapshot.lock_key])
+    assert released[0][1] != released[1][1]
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.pool import InstrumentedAsyncAdaptedQueuePool
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def test_pool_stats(monkeypatch):
+    """ Test the instrumented pool counts the checkouts, and pings the connections found idle
+
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(InstrumentedAsyncAdaptedQueuePool, "counters", {
+        "checkouts": 0, "failures": 0, "idle_pings": 0, "stale": 0
+    })
+    # every connection counts as idle once checked in
+    monkeypatch.setattr(InstrumentedAsyncAdaptedQueuePool, "ping_idle_after", 0)
+
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:", poolclass=InstrumentedAsyncAdaptedQueuePool, pool_size=1, max_overflow=0
+    )
+    InstrumentedAsyncAdaptedQueuePool.listen(engine)
+    try:
+        for _ in range(2):
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+                assert engine.pool.stats()["checked_out"] == 1
+
+        stats = engine.pool.stats()
+    finally:
+        await engine.dispose()
+
+    assert stats["checked_out"] == 0
+    assert stats["idle"] == 1
+    assert stats["counters"]["checkouts"] == 2
+    # the first checkout opened a brand new connection, only the second one has been pinged
+    assert stats["counters"]["idle_pings"] == 1
+    assert stats["counters"]["stale"] == 0
@@ -0,0 +1,26 @@
+import pytest
+
+from app.utils.email_publisher import EmailPublisher
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+META = {"full_name": "Someone", "verify_email_link": "http://test/verify?tokenlink=abc"}
+
+
+async def test_generate_html():
+    """ Test the email is rendered from the template compiled once for the whole process
+
+    :return:
+    """
+    publisher = EmailPublisher()
+    assert publisher.precompile_templates() >= 1
+    template = publisher.template_env.get_template(EmailPublisher.TEMPLATE_NAME)
+
+    html = await publisher.generate_html(META)
+
+    assert META["verify_email_link"] in html
+    assert EmailPublisher().template_env is publisher.template_env
+    assert publisher.template_env.get_template(EmailPublisher.TEMPLATE_NAME) is template
+    # no check for changes outside of DEV
+    assert not publisher.template_env.auto_reload
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.utils import RedisClient
+from app.utils.email_publisher import epub
+from app.utils.email_queue import EmailQueue, SETTLE_EMAIL_SCRIPT
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+EMAIL_PAYLOAD = {
+    "email": "someone@example.com",
+    "subject_email": "Action required: Activate your account now",
+    "meta": {"full_name": "Someone", "verify_email_link": "http://test/verify"},
+}
+
+
+async def test_enqueue(monkeypatch):
+    """ Test an email is only queued, not sent
+
+    :param monkeypatch:
+    :return:
+    """
+    pushed = []
+
+    async def rpush(key, value):
+        pushed.append((key, value))
+        return len(pushed)
+
+    async def compose_and_wait(email_obj):
+        raise AssertionError("The email must not be sent by the web worker")
+
+    monkeypatch.setattr(RedisClient, "rpush", rpush)
+    monkeypatch.setattr(epub, "compose_and_wait", compose_and_wait)
+
+    assert await EmailQueue.enqueue(EMAIL_PAYLOAD)
+
+    key, value = pushed[0]
+    job = json.loads(value)
+    assert key == EmailQueue.queue_key
+    assert job["email"] == EMAIL_PAYLOAD
+    assert job["attempts"] == 0
+
+
+async def test_enqueue_fallback(monkeypatch):
+    """ Test an email is sent in the background when it cannot be queued
+
+    :param monkeypatch:
+    :return:
+    """
+    sent = []
+
+    async def rpush(key, value):
+        raise ConnectionError("Redis is down")
+
+    async def compose_and_wait(email_obj):
+        sent.append(email_obj)
+        return True
+
+    monkeypatch.setattr(RedisClient, "rpush", rpush)
+    monkeypatch.setattr(epub, "compose_and_wait", compose_and_wait)
+
+    assert not await EmailQueue.enqueue(EMAIL_PAYLOAD)
+
+    for task in list(EmailQueue.fallback_tasks):
+        await task
+    assert sent == [EMAIL_PAYLOAD]
+
+
+async def test_fail(monkeypatch):
+    """ Test a failed email is scheduled again after a growing backoff, then dead-lettered
+
+    :param monkeypatch:
+    :return:
+    """
+    settled = []
+
+    async def run_script(source, keys=(), args=()):
+        assert source == SETTLE_EMAIL_SCRIPT
+        settled.append(args)
+        return 1
+
+    monkeypatch.setattr(RedisClient, "run_script", run_script)
+    monkeypatch.setattr(settings, "EMAIL_QUEUE_MAX_ATTEMPTS", 2)
+
+    job = {"id": "1", "email": EMAIL_PAYLOAD, "attempts": 0, "enqueued_at": 0}
+    await EmailQueue.fail(json.dumps(job), job)
+    raw, outcome, retried, retry_at = settled[-1]
+    assert outcome == "retry"
+    assert json.loads(retried)["attempts"] == 1
+    assert retry_at > 0
+
+    job = json.loads(retried)
+    await EmailQueue.fail(retried, job)
+    raw, outcome, dead, retry_at = settled[-1]
+    assert raw == retried
+    assert outcome == "dead"
+    assert json.loads(dead)["attempts"] == 2
+
+
+async def test_backoff(monkeypatch):
+    """ Test the backoff doubles at each attempt, up to its maximum
+
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(settings, "EMAIL_QUEUE_BACKOFF_SECONDS", 10)
+    monkeypatch.setattr(settings, "EMAIL_QUEUE_MAX_BACKOFF_SECONDS", 60)
+
+    assert 5 <= EmailQueue.backoff(1) <= 10
+    assert 20 <= EmailQueue.backoff(3) <= 40
+    assert 30 <= EmailQueue.backoff(10) <= 60
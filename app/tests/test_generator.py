@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from app.scripts.users.generator import dataset_columns, generate_chunk
+
+NOW = datetime(2022, 2, 3, 10, 30)
+
+
+def test_chunk_is_reproducible():
+    """ Test a chunk only depends on its arguments, and changes with the seed
+
+    :return:
+    """
+    chunk = generate_chunk(42, 0, 20, NOW, "csv", raw=True)
+
+    assert generate_chunk(42, 0, 20, NOW, "csv", raw=True) == chunk
+    assert generate_chunk(43, 0, 20, NOW, "csv", raw=True) != chunk
+
+
+def test_chunk_rows_match_columns():
+    """ Test the CSV and NDJSON rows hold the dataset columns, in order
+
+    :return:
+    """
+    columns = dataset_columns(raw=True)
+
+    rows = list(csv.reader(io.StringIO(generate_chunk(42, 0, 5, NOW, "csv", raw=True))))
+    assert len(rows) == 5
+    assert all(len(row) == len(columns) for row in rows)
+
+    records = [json.loads(line) for line in generate_chunk(42, 0, 5, NOW, "ndjson", raw=True).splitlines()]
+    assert len(records) == 5
+    assert all(list(record) == columns for record in records)
+    # both formats serialize the same users
+    assert [row[columns.index("email")] for row in rows] == [record["email"] for record in records]
+
+
+def test_adjacent_chunks_unique_emails():
+    """ Test the emails stay unique across adjacent chunks, even when the random names collide
+
+    :return:
+    """
+    emails = []
+    for start in (0, 50, 100):
+        chunk = generate_chunk(42, start, 50, NOW, "ndjson", raw=True)
+        emails.extend(json.loads(line)["email"] for line in chunk.splitlines())
+
+    assert len(emails) == 150
+    assert len(set(emails)) == 150
@@ -0,0 +1,186 @@
+import pytest
+from datetime import timedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.adapters.user.login_counter import LoginCounter, CLAIM_LOGINS_SCRIPT
+from app.db.adapters.user.user import update_session_login
+from app.db.models.activity import LoginEvent
+from app.db.models.user import User
+from app.utils import RedisClient
+from app.utils.redis import RELEASE_LOCK_SCRIPT
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def count_events(session: AsyncSession, user: User) -> int:
+    result = await session.execute(select(func.count()).select_from(LoginEvent).where(LoginEvent.user_id == user.id))
+    return result.scalar_one()
+
+
+async def test_buffered_login(session: AsyncSession, default_activated_user: User, monkeypatch):
+    """ Test a buffered login leaves the database alone
+
+    :param session:
+    :param default_activated_user:
+    :param monkeypatch:
+    :return:
+    """
+    recorded = []
+
+    async def run_script(source, keys=(), args=()):
+        recorded.append(args)
+        return 1
+
+    monkeypatch.setattr(RedisClient, "run_script", run_script)
+    monkeypatch.setattr(LoginCounter, "flusher_task", object())  # a flusher runs in this worker
+
+    total_login = default_activated_user.total_login
+    events = await count_events(session, default_activated_user)
+    await update_session_login(default_activated_user, session)
+
+    assert recorded[0][0] == default_activated_user.id
+    await session.refresh(default_activated_user)
+    assert default_activated_user.total_login == total_login
+    assert await count_events(session, default_activated_user) == events
+
+
+def build_batch(activated: User, inactive: User, batch_id: bytes) -> list:
+    latest = activated.session_at + timedelta(minutes=5)
+    earlier = inactive.session_at - timedelta(days=1)
+    return [
+        # login counts; logins of a user deleted meanwhile are dropped
+        [str(activated.id).encode(), b"2", str(inactive.id).encode(), b"1", b"999999", b"1"],
+        # latest login times
+        [
+            str(activated.id).encode(), latest.isoformat(timespec="microseconds").encode(),
+            str(inactive.id).encode(), earlier.isoformat(timespec="microseconds").encode(),
+            b"999999", latest.isoformat(timespec="microseconds").encode(),
+        ],
+        # login events
+        [
+            f"{activated.id} {(latest - timedelta(minutes=1)).isoformat(timespec='microseconds')}".encode(),
+            f"{activated.id} {latest.isoformat(timespec='microseconds')}".encode(),
+            f"{inactive.id} {earlier.isoformat(timespec='microseconds')}".encode(),
+            f"999999 {latest.isoformat(timespec='microseconds')}".encode(),
+        ],
+        batch_id,
+    ]
+
+
+class FakeRedis(object):
+    """ Stand-in of the Redis calls of a flush, serving one claimed batch """
+
+    def __init__(self, batch: list, delete_fails: bool = False):
+        self.batch = batch
+        self.delete_fails = delete_fails
+        self.lock = None
+        self.released = []
+        self.deleted = []
+
+    async def set(self, key, value, expired=None, nx=False):
+        self.lock = value
+        return True
+
+    async def run_script(self, source, keys=(), args=()):
+        if source == CLAIM_LOGINS_SCRIPT:
+            return self.batch
+        if source == RELEASE_LOCK_SCRIPT:
+            self.released.append(args[0])
+        # the invalidation of the cached users, or the lock release
+        return 1
+
+    async def delete(self, *keys):
+        if self.delete_fails:
+            return False
+        self.deleted.extend(keys)
+        return len(keys)
+
+    def patch(self, monkeypatch):
+        for name in ("set", "run_script", "delete"):
+            monkeypatch.setattr(RedisClient, name, getattr(self, name))
+
+
+async def test_flush(session: AsyncSession, default_activated_user: User, default_inactive_user: User, monkeypatch):
+    """ Test a flush adds the buffered counts, moves `session_at` forward only, and appends the login events
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :param monkeypatch:
+    :return:
+    """
+    activated, inactive = default_activated_user, default_inactive_user
+    latest = activated.session_at + timedelta(minutes=5)
+    redis = FakeRedis(build_batch(activated, inactive, b"batch-flush"))
+    redis.patch(monkeypatch)
+
+    totals = {user.id: user.total_login for user in (activated, inactive)}
+    inactive_session_at = inactive.session_at
+    events = {user.id: await count_events(session, user) for user in (activated, inactive)}
+
+    assert await LoginCounter.flush() == 2
+
+    # the claimed batch is dropped once applied, and the lock released by its owner
+    assert set(LoginCounter.claimed_keys) <= set(redis.deleted)
+    assert redis.released == [redis.lock]
+
+    for user in (activated, inactive):
+        await session.refresh(user)
+    assert activated.total_login == totals[activated.id] + 2
+    assert activated.session_at == latest
+    assert inactive.total_login == totals[inactive.id] + 1
+    assert inactive.session_at == inactive_session_at
+    assert await count_events(session, activated) == events[activated.id] + 2
+    assert await count_events(session, inactive) == events[inactive.id] + 1
+
+
+async def test_flush_applies_batch_once(
+        session: AsyncSession, default_activated_user: User, default_inactive_user: User, monkeypatch
+):
+    """ Test a batch left behind by a failed deletion is not applied again by the next flush
+
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :param monkeypatch:
+    :return:
+    """
+    activated, inactive = default_activated_user, default_inactive_user
+    redis = FakeRedis(build_batch(activated, inactive, b"batch-replayed"), delete_fails=True)
+    redis.patch(monkeypatch)
+
+    total_login = activated.total_login
+    events = await count_events(session, activated)
+    failures = LoginCounter.counters["failures"]
+
+    assert await LoginCounter.flush() == 2
+    assert LoginCounter.counters["failures"] == failures + 1
+
+    # the same batch is claimed again
+    redis.delete_fails = False
+    assert await LoginCounter.flush() == 0
+    assert set(LoginCounter.claimed_keys) <= set(redis.deleted)
+
+    await session.refresh(activated)
+    assert activated.total_login == total_login + 2
+    assert await count_events(session, activated) == events + 2
+
+
+async def test_flush_locked(monkeypatch):
+    """ Test a flush leaves the buffered logins alone while another worker is flushing them
+
+    :param monkeypatch:
+    :return:
+    """
+    async def set_nx(key, value, expired=None, nx=False):
+        return False
+
+    async def run_script(source, keys=(), args=()):
+        raise AssertionError("The batch must not be claimed")
+
+    monkeypatch.setattr(RedisClient, "set", set_nx)
+    monkeypatch.setattr(RedisClient, "run_script", run_script)
+
+    assert await LoginCounter.flush() == 0
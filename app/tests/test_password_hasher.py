@@ -0,0 +1,68 @@
+import pytest
+from fastapi import HTTPException
+
+from app.core import security
+from app.core.config import settings
+from app.exceptions import ErrorMessage
+from app.utils import PasswordHasher
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def test_hash_and_verify_in_pool():
+    """ Test that hashing and verification through the worker pool round-trip
+
+    :return:
+    """
+    hashed_password = await PasswordHasher.hash("aRdi-1fds*")
+
+    assert hashed_password != "aRdi-1fds*"
+    assert await PasswordHasher.verify("aRdi-1fds*", hashed_password) is True
+    assert await PasswordHasher.verify("wrong-password", hashed_password) is False
+
+    # every call is recorded in the metrics
+    stats = PasswordHasher.stats()
+    assert stats["in_flight"] == 0
+    assert stats["counters"]["hash"] >= 1
+    assert stats["counters"]["verify"] >= 2
+    assert stats["latencies"]["verify"]["samples"] >= 2
+
+
+async def test_saturated_pool_rejects_fast(monkeypatch):
+    """ Test that a saturated pool rejects new jobs with 503 instead of queueing them
+
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(settings, "PASSWORD_HASHER_MAX_QUEUE_DEPTH", 0)
+    rejected = PasswordHasher.counters["rejected"]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await PasswordHasher.hash("aRdi-1fds*")
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.detail == ErrorMessage.SERVICE_BUSY.value
+    assert PasswordHasher.counters["rejected"] == rejected + 1
+
+
+async def test_calibrated_cost_flags_outdated_hashes():
+    """ Test that the calibrated bcrypt cost stays within bounds and outdated hashes get re-hashed
+
+    :return:
+    """
+    saved_policy = security.pwd_context.to_dict()
+    outdated_hash = security.get_password_hash("aRdi-1fds*")
+
+    try:
+        rounds = security.calibrate_bcrypt_rounds(target_ms=1, min_rounds=4, max_rounds=6)
+        assert 4 <= rounds <= 6
+
+        security.configure_password_context(rounds)
+        assert security.password_needs_rehash(outdated_hash) is True
+
+        new_hash = await PasswordHasher.hash("aRdi-1fds*")
+        assert security.password_needs_rehash(new_hash) is False
+        assert await PasswordHasher.verify("aRdi-1fds*", new_hash) is True
+    finally:
+        security.pwd_context.load(saved_policy)
@@ -0,0 +1,157 @@
+import os
+
+import pytest
+from aioredis.exceptions import ConnectionError
+
+from app.utils.redis import InstrumentedBlockingConnectionPool, RedisClient
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+class StubConnection(object):
+    """ Connection standing in for a Redis server, it never talks to the network """
+
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    async def connect(self):
+        pass
+
+    async def can_read(self, timeout=None):
+        return False
+
+    async def disconnect(self):
+        pass
+
+
+async def test_pool_stats():
+    """ Test the pool stats follow the checkouts, including one timing out on a full pool
+
+    :return:
+    """
+    pool = InstrumentedBlockingConnectionPool(max_connections=1, timeout=0.05, connection_class=StubConnection)
+
+    connection = await pool.get_connection("GET")
+    stats = pool.stats()
+    assert stats["created"] == 1
+    assert stats["in_use"] == 1
+    assert stats["idle"] == 0
+
+    # the only connection is taken: the next checkout waits for the pool timeout, then fails
+    with pytest.raises(ConnectionError):
+        await pool.get_connection("GET")
+    stats = pool.stats()
+    assert stats["failures"] == 1
+    assert stats["wait_max_ms"] >= 50
+
+    await pool.release(connection)
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+    assert stats["checkouts"] == 1
+
+
+class StubPipeline(object):
+    """ MULTI/EXEC pipeline of a `StubRedis`, queuing GET and DELETE """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def get(self, key):
+        self.commands.append(("get", key))
+        return self
+
+    def delete(self, key):
+        self.commands.append(("delete", key))
+        return self
+
+    async def execute(self):
+        if self.redis.fail:
+            raise ConnectionError("master down")
+        results = []
+        for command, key in self.commands:
+            if command == "get":
+                results.append(self.redis.values.get(key))
+            else:
+                results.append(int(self.redis.values.pop(key, None) is not None))
+        return results
+
+
+class StubRedis(object):
+    """ Client answering GET/MGET from a dict, or failing like an unreachable server """
+
+    def __init__(self, values=None, fail=False):
+        self.values = values or {}
+        self.fail = fail
+
+    async def get(self, key):
+        if self.fail:
+            raise ConnectionError("replica down")
+        return self.values.get(key)
+
+    async def mget(self, *keys):
+        if self.fail:
+            raise ConnectionError("replica down")
+        return [self.values.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return StubPipeline(self)
+
+
+async def test_replica_reads(monkeypatch):
+    """ Test reads go to the replica, and fall back to the master when the replica fails
+
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(RedisClient, "redis_client", StubRedis({"key": "from-master"}))
+    monkeypatch.setattr(RedisClient, "replica_client", StubRedis({"key": "from-replica"}))
+    monkeypatch.setattr(RedisClient, "replica_counters", {"reads": 0, "fallbacks": 0})
+
+    assert await RedisClient.get("key", replica=True) == "from-replica"
+    assert await RedisClient.get("key") == "from-master"
+
+    monkeypatch.setattr(RedisClient, "replica_client", StubRedis(fail=True))
+    assert await RedisClient.get("key", replica=True) == "from-master"
+    assert RedisClient.replica_counters == {"reads": 2, "fallbacks": 1}
+
+
+async def test_mget(monkeypatch):
+    """ Test MGET answers in the order of the keys, on a replica when asked for, and fails open
+
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(RedisClient, "redis_client", StubRedis({"a": "master-a", "b": "master-b"}))
+    monkeypatch.setattr(RedisClient, "replica_client", StubRedis({"a": "replica-a"}))
+    monkeypatch.setattr(RedisClient, "replica_counters", {"reads": 0, "fallbacks": 0})
+
+    assert await RedisClient.mget("b", "missing", "a") == ["master-b", None, "master-a"]
+    assert await RedisClient.mget("a", "b", replica=True) == ["replica-a", None]
+    assert RedisClient.replica_counters == {"reads": 1, "fallbacks": 0}
+
+    monkeypatch.setattr(RedisClient, "redis_client", StubRedis(fail=True))
+    assert await RedisClient.mget("a") is False
+
+
+async def test_getdel(monkeypatch):
+    """ Test GETDEL returns the value once, deleting the key, and fails open
+
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(RedisClient, "redis_client", StubRedis({"key": "value"}))
+
+    assert await RedisClient.getdel("key") == "value"
+    assert await RedisClient.getdel("key") is None
+
+    monkeypatch.setattr(RedisClient, "redis_client", StubRedis(fail=True))
+    assert await RedisClient.getdel("key") is False
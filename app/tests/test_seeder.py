@@ -0,0 +1,107 @@
+import re
+
+import pytest
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.security import verify_password
+from app.db import initial_data
+from app.db.models.user import User
+from app.scripts.users.seeder import DummyUserSeeder
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def last_user_id(session: AsyncSession) -> int:
+    result = await session.execute(select(func.coalesce(func.max(User.id), 0)))
+    return result.scalars().one()
+
+
+async def seeded_users(session: AsyncSession, after_id: int):
+    result = await session.execute(select(User).where(User.id > after_id).order_by(User.id))
+    return result.scalars().all()
+
+
+async def remove_seeded_users(session: AsyncSession, after_id: int) -> None:
+    """ Keep the shared test database as the other tests expect it """
+    await session.execute(delete(User).where(User.id > after_id))
+    await session.commit()
+
+
+async def test_seed_shared_password(session: AsyncSession):
+    """ Test batches of users sharing a password: one hash for all, unique emails across the batches
+
+    :param session:
+    :return:
+    """
+    after_id = await last_user_id(session)
+    try:
+        inserted = await DummyUserSeeder(5, batch_size=2, password="dummy-password", workers=1).run(session)
+        users = await seeded_users(session, after_id)
+
+        assert inserted == len(users) == 5
+        assert len({user.email for user in users}) == 5
+        assert len({user.hashed_password for user in users}) == 1
+        assert verify_password("dummy-password", users[0].hashed_password)
+    finally:
+        await remove_seeded_users(session, after_id)
+
+
+async def test_seed_own_passwords(session: AsyncSession):
+    """ Test batches of users hashed in the process pool: every user has the hash of its own full name
+
+    :param session:
+    :return:
+    """
+    after_id = await last_user_id(session)
+    try:
+        inserted = await DummyUserSeeder(3, batch_size=2, first_index=7, workers=2).run(session)
+        users = await seeded_users(session, after_id)
+
+        assert inserted == len(users) == 3
+        assert len({user.email for user in users}) == 3
+        # the email index carries on from `first_index`
+        assert sorted(int(re.search(r"\.(\d+)@", user.email).group(1)) for user in users) == [7, 8, 9]
+        for user in users:
+            assert user.hashed_password
+            assert verify_password(user.full_name, user.hashed_password)
+    finally:
+        await remove_seeded_users(session, after_id)
+
+
+async def test_initial_data_tops_up(session: AsyncSession, monkeypatch):
+    """ Test the initial data only seeds the missing dummy users, numbered after the existing ones
+
+    :param session:
+    :param monkeypatch:
+    :return:
+    """
+    # the superuser is created first when missing, so count once it exists
+    monkeypatch.setattr(settings, "ADD_DUMMY_USERS", False)
+    after_id = await last_user_id(session)
+    try:
+        await initial_data.main()
+        total_users = (await session.execute(select(func.count(User.id)))).scalars().one()
+
+        monkeypatch.setattr(settings, "ADD_DUMMY_USERS", True)
+        monkeypatch.setattr(settings, "TOTAL_DUMMY_USERS", total_users + 3)
+        monkeypatch.setattr(settings, "DUMMY_USERS_BATCH_SIZE", 2)
+        monkeypatch.setattr(settings, "DUMMY_USERS_PASSWORD", "dummy-password")
+        await initial_data.main()
+
+        dummy_users = [
+            user for user in await seeded_users(session, after_id) if user.email != settings.FIRST_SUPERUSER_EMAIL
+        ]
+        assert len(dummy_users) == 3
+        assert sorted(int(re.search(r"\.(\d+)@", user.email).group(1)) for user in dummy_users) == [
+            total_users, total_users + 1, total_users + 2,
+        ]
+
+        # the total is reached: nothing more is seeded
+        seeded = len(await seeded_users(session, after_id))
+        await initial_data.main()
+        assert len(await seeded_users(session, after_id)) == seeded
+    finally:
+        await remove_seeded_users(session, after_id)
@@ -0,0 +1,109 @@
+import asyncio
+from email.mime.text import MIMEText
+
+import pytest
+
+from app.scripts.benchmarks.smtp_throughput import SMTPStandIn
+from app.utils.email_publisher import EmailPublisher
+from app.utils.smtp_pool import SMTPPool
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+def build_message(subject: str) -> MIMEText:
+    message = MIMEText("<p>Hello</p>", "html")
+    message["From"] = "sender@example.com"
+    message["To"] = "someone@example.com"
+    message["Subject"] = subject
+    return message
+
+
+@pytest.fixture
+async def stand_in():
+    """ Local SMTP server
+
+    :return:
+    """
+    stand_in = await SMTPStandIn().start()
+    yield stand_in
+    await stand_in.close()
+
+
+def build_pool(stand_in: SMTPStandIn, **kwargs) -> SMTPPool:
+    return SMTPPool(stand_in.host, stand_in.port, username="user", password="secret", use_tls=False, **kwargs)
+
+
+async def test_connections_reused(stand_in: SMTPStandIn):
+    """ Test the messages share the pooled connections, at most `size` of them
+
+    :param stand_in:
+    :return:
+    """
+    pool = build_pool(stand_in, size=2)
+    try:
+        await asyncio.gather(*(pool.send_message(build_message(f"message {index}")) for index in range(10)))
+    finally:
+        await pool.close()
+
+    assert len(stand_in.messages) == 10
+    assert stand_in.connections <= 2
+    assert pool.counters["sent"] == 10
+    assert pool.counters["connects"] + pool.counters["reuses"] == 10
+
+
+async def test_idle_timeout(stand_in: SMTPStandIn):
+    """ Test a connection idle for too long is replaced
+
+    :param stand_in:
+    :return:
+    """
+    pool = build_pool(stand_in, size=1, idle_timeout=0)
+    try:
+        await pool.send_message(build_message("first"))
+        await asyncio.sleep(0.01)
+        await pool.send_message(build_message("second"))
+    finally:
+        await pool.close()
+
+    assert stand_in.connections == 2
+    assert pool.counters["recycled"] == 1
+
+
+async def test_dropped_connection(stand_in: SMTPStandIn):
+    """ Test a message is still sent once the server dropped the pooled connection
+
+    :param stand_in:
+    :return:
+    """
+    pool = build_pool(stand_in, size=1)
+    try:
+        await pool.send_message(build_message("first"))
+        stand_in.drop_connections()
+        await pool.send_message(build_message("second"))
+    finally:
+        await pool.close()
+
+    assert len(stand_in.messages) == 2
+    assert stand_in.connections == 2
+    assert pool.counters["failures"] == 0
+
+
+async def test_compose_and_wait(stand_in: SMTPStandIn):
+    """ Test the publisher renders and sends the email through its pool
+
+    :param stand_in:
+    :return:
+    """
+    publisher = EmailPublisher()
+    publisher.smtp_pool = build_pool(stand_in)
+    try:
+        assert await publisher.compose_and_wait({
+            "email": "someone@example.com",
+            "subject_email": "Action required: Activate your account now",
+            "meta": {"full_name": "Someone", "verify_email_link": "http://test/verify"},
+        })
+    finally:
+        await publisher.close()
+
+    assert b"Activate your account now" in stand_in.messages[0]
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+from authlib.jose import JsonWebKey, jwt
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import facebook as fb_conf, google as google_conf
+from app.db.models.user import SignupBy, User
+from app.utils.social_login.google import oauth
+from app.utils.social_login.http_client import SharedTransport, SocialLoginHTTP
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+TOKEN_URL = "https://graph.test/oauth/access_token"
+FB_USER = {"id": "1020304050", "name": "facebook user", "email": "facebook.user@gmail.com"}
+
+
+class MockFacebook(object):
+    """ Local stand-in of the Facebook OAuth and Graph API endpoints """
+
+    def __init__(self, token_response: httpx.Response, read_timeouts: int = 0):
+        self.token_response = token_response
+        self.read_timeouts = read_timeouts
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if str(request.url) == TOKEN_URL:
+            return self.token_response
+
+        if request.url.path == "/me":
+            if self.read_timeouts:
+                self.read_timeouts -= 1
+                raise httpx.ReadTimeout("Graph API too slow", request=request)
+            assert request.headers["Authorization"] == "Bearer fb-token"
+            return httpx.Response(200, json=FB_USER)
+
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def mock_facebook(monkeypatch):
+    """ Route the social login requests to a `MockFacebook`
+
+    :param monkeypatch:
+    :return:
+    """
+    def setup(token_response: httpx.Response, read_timeouts: int = 0) -> MockFacebook:
+        facebook = MockFacebook(token_response, read_timeouts)
+        monkeypatch.setattr(SocialLoginHTTP, "transport", SharedTransport(
+            httpx.MockTransport(facebook), retries=2, backoff=0,
+        ))
+        return facebook
+
+    monkeypatch.setattr(fb_conf, "FB_CLIENT_ID", "fb-client")
+    monkeypatch.setattr(fb_conf, "FB_CLIENT_SECRET", "fb-secret")
+    monkeypatch.setattr(fb_conf, "FB_TOKEN_URL", TOKEN_URL)
+    monkeypatch.setattr(fb_conf, "FB_AUTHORIZATION_BASE_URL", "https://www.facebook.test/dialog/oauth")
+    return setup
+
+
+async def test_login_facebook(client: AsyncClient, mock_facebook):
+    """ Test the login redirects to the Facebook dialog
+
+    :param client:
+    :param mock_facebook:
+    :return:
+    """
+    mock_facebook(httpx.Response(500))
+
+    resp = await client.get("/login_facebook")
+
+    assert resp.status_code == 302
+    location = urlparse(resp.headers["location"])
+    query = parse_qs(location.query)
+    assert location.netloc == "www.facebook.test"
+    assert query["client_id"] == ["fb-client"]
+    assert query["redirect_uri"] == ["http://test/fb-callback"]
+
+
+async def test_facebook_callback(client: AsyncClient, session: AsyncSession, mock_facebook):
+    """ Test the callback exchanges the code, retries the Graph API timeout, and signs the user in
+
+    :param client:
+    :param session:
+    :param mock_facebook:
+    :return:
+    """
+    # an URL-encoded token, as Facebook may answer
+    facebook = mock_facebook(
+        httpx.Response(200, text="access_token=fb-token&expires=5183999", headers={"content-type": "text/plain"}),
+        read_timeouts=1,
+    )
+
+    resp = await client.get("/fb-callback", params={"code": "fb-code"})
+
+    assert resp.status_code == 302
+    assert resp.headers["location"] == "/"
+
+    token_request = parse_qs(facebook.requests[0].content.decode())
+    assert token_request["code"] == ["fb-code"]
+    assert token_request["grant_type"] == ["authorization_code"]
+    assert [request.url.path for request in facebook.requests] == ["/oauth/access_token", "/me", "/me"]
+
+    result = await session.execute(select(User).where(User.email == FB_USER["email"]))
+    user = result.scalars().one()
+    assert user.signup_by == SignupBy.FACEBOOK.value
+
+
+async def test_facebook_callback_refused(client: AsyncClient, mock_facebook):
+    """ Test a refused code leads back to the login page
+
+    :param client:
+    :param mock_facebook:
+    :return:
+    """
+    error = {"error": "invalid_grant", "error_description": "This authorization code has expired."}
+    mock_facebook(httpx.Response(400, content=json.dumps(error), headers={"content-type": "application/json"}))
+
+    resp = await client.get("/fb-callback", params={"code": "expired-code"})
+
+    assert resp.status_code == 200
+    assert "Facebook login failed" in resp.text
+
+
+async def test_shared_transport_connect_failure_not_retried_again():
+    """ Test a connection failure, already retried by the wrapped transport, is not retried on top of it
+
+    :return:
+    """
+    attempts = []
+
+    def refuse(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    transport = SharedTransport(httpx.MockTransport(refuse), retries=2, backoff=0)
+    async with httpx.AsyncClient(transport=transport) as client:
+        with pytest.raises(httpx.ConnectError):
+            await client.get("https://graph.test/me")
+
+    assert len(attempts) == 1
+    assert transport.counters["failures"] == 1
+
+
+GOOGLE_CONF_URL = "https://accounts.google.test/.well-known/openid-configuration"
+GOOGLE_USER = {"sub": "3040506070", "name": "google user", "email": "google.user@gmail.com"}
+
+
+class MockGoogle(object):
+    """ Local stand-in of the Google OpenID provider: discovery document, signing keys and token endpoint """
+
+    def __init__(self):
+        self.key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
+        self.nonce = None
+        self.discovery_status = 200
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(str(request.url))
+        if str(request.url) == GOOGLE_CONF_URL:
+            if self.discovery_status != 200:
+                return httpx.Response(self.discovery_status, json={"error": "backend_error"})
+            return httpx.Response(200, json={
+                "issuer": "https://accounts.google.test",
+                "authorization_endpoint": "https://accounts.google.test/o/oauth2/v2/auth",
+                "token_endpoint": "https://oauth2.google.test/token",
+                "jwks_uri": "https://www.google.test/oauth2/v3/certs",
+                "id_token_signing_alg_values_supported": ["RS256"],
+            })
+
+        if str(request.url) == "https://www.google.test/oauth2/v3/certs":
+            public_key = {name: value for name, value in self.key.as_dict().items() if name in ("kty", "n", "e")}
+            return httpx.Response(200, json={"keys": [dict(public_key, kid="test-key", alg="RS256")]})
+
+        if str(request.url) == "https://oauth2.google.test/token":
+            now = int(time.time())
+            claims = dict(
+                GOOGLE_USER, iss="https://accounts.google.test", aud="google-client", iat=now, exp=now + 3600,
+                nonce=self.nonce,
+            )
+            id_token = jwt.encode({"alg": "RS256", "kid": "test-key"}, claims, self.key).decode()
+            return httpx.Response(200, json={
+                "access_token": "google-token", "token_type": "Bearer", "expires_in": 3600, "id_token": id_token,
+            })
+
+        return httpx.Response(404)
+
+    def count(self, url: str) -> int:
+        return self.requests.count(url)
+
+
+@pytest.fixture
+def mock_google(monkeypatch) -> MockGoogle:
+    """ Route the social login requests to a `MockGoogle`, and point the registered Google app to it
+
+    :param monkeypatch:
+    :return:
+    """
+    google = MockGoogle()
+    monkeypatch.setattr(SocialLoginHTTP, "transport", SharedTransport(httpx.MockTransport(google), backoff=0))
+    monkeypatch.setattr(oauth.google, "client_id", "google-client")
+    monkeypatch.setattr(oauth.google, "client_secret", "google-secret")
+    monkeypatch.setattr(oauth.google, "_server_metadata_url", GOOGLE_CONF_URL)
+    monkeypatch.setattr(oauth.google, "server_metadata", {})
+    monkeypatch.setattr(oauth.google, "refresh_lock", None)
+    monkeypatch.setattr(oauth.google, "retry_at", 0)
+    return google
+
+
+async def test_google_login(client: AsyncClient, session: AsyncSession, mock_google: MockGoogle):
+    """ Test the Google login flow, fetching the discovery document and signing keys once for all the logins
+
+    :param client:
+    :param session:
+    :param mock_google:
+    :return:
+    """
+    for _ in range(2):
+        resp = await client.get("/login_google")
+        assert resp.status_code == 302
+
+        query = parse_qs(urlparse(resp.headers["location"]).query)
+        mock_google.nonce = query["nonce"][0]
+
+        resp = await client.get("/google-auth", params={"code": "google-code", "state": query["state"][0]})
+        assert resp.status_code == 302
+        assert resp.headers["location"] == "/"
+
+    assert mock_google.count(GOOGLE_CONF_URL) == 1
+    assert mock_google.count("https://www.google.test/oauth2/v3/certs") == 1
+
+    result = await session.execute(select(User).where(User.email == GOOGLE_USER["email"]))
+    assert result.scalars().one().signup_by == SignupBy.GMAIL.value
+
+
+async def test_google_metadata_ttl(mock_google: MockGoogle, monkeypatch):
+    """ Test the discovery document and signing keys are fetched by a single caller, cold or once stale
+
+    :param mock_google:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(google_conf, "GOOGLE_METADATA_TTL_SECONDS", 60)
+
+    # cold start, e.g. the refresher is disabled
+    results = await asyncio.gather(*(oauth.google.load_server_metadata() for _ in range(5)))
+    metadata = results[0]
+    assert "keys" in metadata["jwks"]
+    assert mock_google.count(GOOGLE_CONF_URL) == 1
+    assert mock_google.count("https://www.google.test/oauth2/v3/certs") == 1
+
+    await oauth.google.load_server_metadata()
+    assert mock_google.count(GOOGLE_CONF_URL) == 1
+
+    metadata["_loaded_at"] -= 61
+    await asyncio.gather(*(oauth.google.load_server_metadata() for _ in range(5)))
+    assert mock_google.count(GOOGLE_CONF_URL) == 2
+    assert mock_google.count("https://www.google.test/oauth2/v3/certs") == 2
+
+
+async def test_google_metadata_error(mock_google: MockGoogle, monkeypatch):
+    """ Test an error answer is never taken as the metadata, and a failed refresh keeps the stale one in use
+
+    :param mock_google:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(google_conf, "GOOGLE_METADATA_TTL_SECONDS", 60)
+    mock_google.discovery_status = 503
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await oauth.google.load_server_metadata()
+    assert "_loaded_at" not in oauth.google.server_metadata
+
+    mock_google.discovery_status = 200
+    monkeypatch.setattr(oauth.google, "retry_at", 0)
+    metadata = await oauth.google.load_server_metadata()
+    loaded_at = metadata["_loaded_at"]
+
+    # stale, and Google fails: the stale metadata is served, and not fetched again before the backoff
+    metadata["_loaded_at"] = loaded_at = loaded_at - 61
+    mock_google.discovery_status = 500
+    assert (await oauth.google.load_server_metadata())["_loaded_at"] == loaded_at
+    assert (await oauth.google.load_server_metadata())["_loaded_at"] == loaded_at
+    assert "error" not in metadata
+    assert mock_google.count(GOOGLE_CONF_URL) == 3
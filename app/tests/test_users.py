@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+import pytest
+from typing import Dict
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.adapters.user.user import update_user
+from app.db.models.user import User
+from app.exceptions import ErrorMessage
+from app.tests.test_auth import get_token_resp
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def get_auth_headers(client: AsyncClient, user_data: Dict) -> Dict:
+    """ Log a user in and build the authorization header
+
+    :param client:
+    :param user_data:
+    :return:
+    """
+    access_token_resp = await get_token_resp(client, user_data)
+    assert access_token_resp.status_code == 200
+    return {"Authorization": f"Bearer {access_token_resp.json()['access_token']}"}
+
+
+async def test_list_users_by_cursor(
+        client: AsyncClient,
+        session: AsyncSession,
+        default_activated_user: User,
+        default_inactive_user: User,
+        activated_user_data: Dict,
+):
+    """ Test paging through every user, one user per page, newest first
+
+    :param client:
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :param activated_user_data:
+    :return:
+    """
+    headers = await get_auth_headers(client, activated_user_data)
+    users = (await session.execute(select(User).order_by(User.created_at.desc(), User.id.desc()))).scalars().all()
+
+    listed = []
+    params = {"limit": 1}
+    while True:
+        resp = await client.get("/api/v1/users", params=params, headers=headers)
+        assert resp.status_code == 200
+        resp_json = resp.json()
+
+        assert resp_json["total"] == len(users)
+        assert resp_json["total_estimated"] is False
+        assert len(resp_json["data"]) == 1
+        assert "hashed_password" not in resp_json["data"][0]
+        listed.extend(user["id"] for user in resp_json["data"])
+
+        if resp_json["next_cursor"] is None:
+            break
+        params["cursor"] = resp_json["next_cursor"]
+
+    assert listed == [user.id for user in users]
+
+
+async def test_list_users_filters(
+        client: AsyncClient,
+        session: AsyncSession,
+        default_activated_user: User,
+        default_inactive_user: User,
+        activated_user_data: Dict,
+):
+    """ Test the filters apply to both the page and the total
+
+    :param client:
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :param activated_user_data:
+    :return:
+    """
+    headers = await get_auth_headers(client, activated_user_data)
+    inactive_ids = (await session.execute(select(User.id).where(User.activated.is_(False)))).scalars().all()
+
+    resp = await client.get("/api/v1/users", params={"activated": False, "count": "estimated"}, headers=headers)
+    assert resp.status_code == 200
+    resp_json = resp.json()
+
+    # there is no planner estimate on SQLite, the count is exact
+    assert resp_json["total"] == len(inactive_ids)
+    assert resp_json["total_estimated"] is False
+    assert sorted(user["id"] for user in resp_json["data"]) == sorted(inactive_ids)
+    assert resp_json["next_cursor"] is None
+
+    facebook_ids = (await session.execute(select(User.id).where(User.signup_by == "FACEBOOK"))).scalars().all()
+    resp = await client.get("/api/v1/users", params={"signup_by": "FACEBOOK"}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["total"] == len(facebook_ids)
+
+    # only the registration methods are accepted
+    for signup_by in ("facebook", " :x"):
+        resp = await client.get("/api/v1/users", params={"signup_by": signup_by}, headers=headers)
+        assert resp.status_code == 422
+
+
+async def test_list_users_invalid_cursor(
+        client: AsyncClient,
+        default_activated_user: User,
+        activated_user_data: Dict,
+):
+    """ Test a tampered cursor is rejected
+
+    :param client:
+    :param default_activated_user:
+    :param activated_user_data:
+    :return:
+    """
+    headers = await get_auth_headers(client, activated_user_data)
+
+    resp = await client.get("/api/v1/users", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == ErrorMessage.INVALID_CURSOR.value
+
+    resp = await client.get("/api/v1/users")
+    assert resp.status_code == 401
+
+
+async def test_export_users(
+        client: AsyncClient,
+        session: AsyncSession,
+        default_activated_user: User,
+        default_inactive_user: User,
+        activated_user_data: Dict,
+):
+    """ Test the streamed export, as NDJSON and as CSV, with a filter
+
+    :param client:
+    :param session:
+    :param default_activated_user:
+    :param default_inactive_user:
+    :param activated_user_data:
+    :return:
+    """
+    headers = await get_auth_headers(client, activated_user_data)
+    users = (await session.execute(select(User).order_by(User.id))).scalars().all()
+
+    resp = await client.get("/api/v1/users/export", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in resp.text.splitlines()]
+    assert [user["id"] for user in exported] == [user.id for user in users]
+    assert exported[0]["email"] == users[0].email
+    assert exported[0]["created_at"] == users[0].created_at.isoformat()
+    assert "hashed_password" not in exported[0]
+
+    resp = await client.get("/api/v1/users/export", params={"format": "csv", "activated": False}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [int(row["id"]) for row in rows] == [user.id for user in users if not user.activated]
+
+    resp = await client.get("/api/v1/users/export")
+    assert resp.status_code == 401
+
+
+async def test_update_user(session: AsyncSession, default_activated_user: User):
+    """ Test an update loads the new row into the given user, SQL expressions and column defaults included
+
+    :param session:
+    :param default_activated_user:
+    :return:
+    """
+    user = (await session.execute(select(User).where(User.id == default_activated_user.id))).scalars().one()
+    total_login, updated_at = user.total_login, user.updated_at
+
+    await update_user(session, user, total_login=User.total_login + 1)
+
+    assert user.total_login == total_login + 1
+    assert user.updated_at > updated_at  # `onupdate` of the column
+
+    stored = (await session.execute(select(User.total_login).where(User.id == user.id))).scalar_one()
+    assert stored == total_login + 1
+
+    await update_user(session, user, total_login=total_login)
+    assert user.total_login == total_login
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import get_email_by_verification_token
+from app.db.models.user import User
+from app.scripts.mails.verification_reminders import VerificationReminderCampaign
+from app.utils import RedisClient
+from app.utils.email_publisher import epub
+
+# All test coroutines in file will be treated as marked (async allowed).
+pytestmark = pytest.mark.asyncio
+
+
+async def test_campaign(session: AsyncSession, default_inactive_user: User, default_activated_user: User, monkeypatch):
+    """ Test each unverified user gets one reminder with a valid link, and a campaign resumes after its checkpoint
+
+    :param session:
+    :param default_inactive_user:
+    :param default_activated_user:
+    :param monkeypatch:
+    :return:
+    """
+    sent, storage = [], {}
+
+    async def compose_and_wait(email_obj):
+        sent.append(email_obj)
+        return True
+
+    async def get(key, replica=False):
+        return storage.get(key)
+
+    async def set_value(key, value, expired=None, nx=False):
+        storage[key] = value
+        return True
+
+    monkeypatch.setattr(epub, "compose_and_wait", compose_and_wait)
+    monkeypatch.setattr(RedisClient, "get", get)
+    monkeypatch.setattr(RedisClient, "set", set_value)
+
+    result = await session.execute(select(User.email).where(User.activated.is_(False)))
+    unverified = set(result.scalars().all())
+
+    def build_campaign():
+        return VerificationReminderCampaign(
+            "test", "http://test", datetime.utcnow() + timedelta(minutes=1), chunk_size=1, concurrency=2, rate=0,
+        )
+
+    report = await build_campaign().run()
+
+    assert report["users"] == report["sent"] == report["chunks"] == len(unverified)
+    assert {email_obj["email"] for email_obj in sent} == unverified
+    assert default_activated_user.email not in unverified
+
+    link = next(email_obj for email_obj in sent if email_obj["email"] == default_inactive_user.email)
+    link = urlparse(link["meta"]["verify_email_link"])
+    assert link.path == "/verify"
+    assert get_email_by_verification_token(parse_qs(link.query)["token"][0]) == (True, default_inactive_user.email)
+
+    # nothing left to remind after the checkpoint
+    sent.clear()
+    assert (await build_campaign().run())["users"] == 0
+    assert sent == []
@@ -1,5 +1,7 @@
 from .redis import RedisClient
+from .password_hasher import PasswordHasher
 
 __all__ = (
     RedisClient,
+    PasswordHasher,
 )
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""In-process cache class utilities."""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from app.utils.redis import RedisClient
+
+
+class LRUCache(object):
+    """Bounded in-process LRU cache with a per-entry expiry.
+
+    Entries expire after `ttl` seconds at the latest; `set` may shorten that
+    per entry (e.g. down to a token expiry). When the cache is full, the least
+    recently used entry is evicted. Not thread-safe, it is meant to be used
+    from the event loop only.
+
+    Attributes:
+        name (str): Cache name, used for cross-worker invalidation and metrics.
+        max_size (int): Maximum number of entries; 0 disables the cache.
+        ttl (float): Maximum lifetime of an entry in seconds; 0 disables the cache.
+        hits (int): Total of lookups served from the cache.
+        misses (int): Total of lookups not found, or found expired.
+        evictions (int): Total of entries dropped because the cache was full.
+        invalidations (int): Total of `delete` calls, found or not. A caller
+            filling the cache after a slow lookup compares it with the value
+            read before the lookup, so that it does not store an entry
+            invalidated meanwhile.
+
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expire_at = entry
+        if expire_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        self.invalidations += 1
+        return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class CacheInvalidator(object):
+    """Cross-worker cache invalidation utility.
+
+    Every worker keeps its own in-process caches. Evictions are applied
+    locally right away and broadcast through Redis pub/sub, so the other
+    workers drop their copy as well. The entry TTL bounds the staleness
+    whenever Redis is unreachable.
+
+    Attributes:
+        caches (dict): Registered caches by name.
+        channel (str): Redis pub/sub channel carrying the evictions.
+        listener_task (asyncio.Task, optional): Task applying remote evictions.
+        log (logging.Logger): Logging handler for this class.
+
+    """
+
+    caches: Dict[str, LRUCache] = {}
+    channel: str = "cache-invalidation"
+    listener_task: asyncio.Task = None
+    log: logging.Logger = logging.getLogger("uvicorn.error")
+
+    @classmethod
+    def register(cls, cache: LRUCache) -> LRUCache:
+        cls.caches[cache.name] = cache
+        return cache
+
+    @classmethod
+    async def invalidate(cls, cache_name: str, *keys: str) -> None:
+        """Evict keys from a cache in this worker and in every other worker.
+
+        Args:
+            cache_name (str): Registered cache name.
+            *keys (str): Keys to be evicted.
+
+        """
+        cache = cls.caches.get(cache_name)
+        if cache is not None:
+            for key in keys:
+                cache.delete(key)
+
+        await RedisClient.publish(cls.channel, json.dumps({"cache": cache_name, "keys": keys}))
+
+    @classmethod
+    def start_listener(cls) -> None:
+        """Start applying the evictions broadcast by the other workers."""
+        if cls.listener_task is None:
+            cls.listener_task = asyncio.ensure_future(cls._listen())
+
+    @classmethod
+    async def stop_listener(cls) -> None:
+        """Stop the eviction listener."""
+        if cls.listener_task is not None:
+            cls.listener_task.cancel()
+            try:
+                await cls.listener_task
+            except asyncio.CancelledError:
+                pass
+            cls.listener_task = None
+
+    @classmethod
+    async def _listen(cls) -> None:
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = await RedisClient.subscribe(cls.channel)
+                retry_delay = 1
+                while True:
+                    # poll rather than `listen`, which would hit the socket timeout on a quiet channel
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message.get("type") == "message":
+                        cls._apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                # evictions missed meanwhile are bounded by the cache TTL
+                cls.log.warning(
+                    "Cache invalidation listener failed ({}), retry in {}s".format(ex, retry_delay)
+                )
+            finally:
+                # hand the dedicated connection back to the pool
+                if pubsub is not None:
+                    await pubsub.reset()
+
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
+
+    @classmethod
+    def _apply(cls, data: str) -> None:
+        try:
+            message = json.loads(data)
+        except ValueError:
+            cls.log.warning("Ignore malformed cache invalidation message: {}".format(data))
+            return
+
+        cache = cls.caches.get(message.get("cache"))
+        if cache is not None:
+            for key in message.get("keys", []):
+                cache.delete(key)
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return {name: cache.stats() for name, cache in cls.caches.items()}
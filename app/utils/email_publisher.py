@@ -1,16 +1,38 @@
 from app.core.config import smtp as smtp_conf
 from app.core.config.application import settings
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from app.utils.smtp_pool import SMTPPool
 import asyncio
-import smtplib
 import logging
+from functools import lru_cache
 from pathlib import Path
 
 L = logging.getLogger("uvicorn.error")
 
 
+@lru_cache(maxsize=None)
+def get_template_environment(template_dir: str) -> Environment:
+    """ Jinja environment of a template folder, shared by the whole process; it keeps the compiled templates
+
+    A template is only checked for changes (and compiled again) in DEV; elsewhere, restart to pick the changes up.
+    """
+    bytecode_cache = None
+    if smtp_conf.SMTP_TEMPLATE_BYTECODE_CACHE_DIR:
+        # the next processes load the compiled templates instead of parsing them again
+        Path(smtp_conf.SMTP_TEMPLATE_BYTECODE_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(smtp_conf.SMTP_TEMPLATE_BYTECODE_CACHE_DIR)
+
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        auto_reload=settings.ENVIRONMENT == "DEV",
+        bytecode_cache=bytecode_cache,
+    )
+
+
 class EmailPublisher(object):
     """
     An asynchronous class to validate a given password with multiple scenarios
@@ -21,6 +43,7 @@ class EmailPublisher(object):
     DEFAULT_APP_DESC = settings.APP_DESC
     DEFAULT_APP_WEBSITE = settings.APP_WEBSITE
     DEFAULT_SMTP_TEMPLATE_PATH = smtp_conf.SMTP_TEMPLATE_PATH
+    TEMPLATE_NAME = "email_verification.html"
 
     def __init__(self, folder_path: str = DEFAULT_SMTP_TEMPLATE_PATH,
                  project_dir: str = DEFAULT_PROJECT_DIR,
@@ -32,6 +55,7 @@ class EmailPublisher(object):
         self.app_name = app_name
         self.app_desc = app_desc
         self.app_website = app_website
+        self.smtp_pool = None
 
     def __await__(self):
         async def closure():
@@ -62,24 +86,20 @@ class EmailPublisher(object):
 
         return True
 
-    async def get_smtp_server(self):
-
-        if smtp_conf.SMTP_SSL:
-            server = smtplib.SMTP_SSL(
-                smtp_conf.SMTP_SERVER,
-                smtp_conf.SMTP_PORT
-            )
-        else:
-            server = smtplib.SMTP(
+    def get_smtp_pool(self):
+        """ Connection pool to the SMTP server, opened at the first email """
+        if self.smtp_pool is None:
+            self.smtp_pool = SMTPPool(
                 smtp_conf.SMTP_SERVER,
-                smtp_conf.SMTP_PORT
-            )
-        if len(smtp_conf.SMTP_USERNAME) > 0:
-            server.login(
-                smtp_conf.SMTP_USERNAME,
-                smtp_conf.SMTP_PASSWORD
+                smtp_conf.SMTP_PORT,
+                username=smtp_conf.SMTP_USERNAME,
+                password=smtp_conf.SMTP_PASSWORD,
+                use_tls=smtp_conf.SMTP_SSL,
+                timeout=smtp_conf.SMTP_TIMEOUT,
+                size=smtp_conf.SMTP_POOL_SIZE,
+                idle_timeout=smtp_conf.SMTP_POOL_IDLE_TIMEOUT,
             )
-        return server
+        return self.smtp_pool
 
     async def send_email_and_wait(self, to_email, subject_email, html):
         message = MIMEMultipart()
@@ -90,21 +110,30 @@ class EmailPublisher(object):
 
         message['From'] = smtp_conf.SMTP_SENDER
 
-        smtp_server = await self.get_smtp_server()
-        smtp_server.set_debuglevel(True)
-        smtp_server.sendmail(
-            smtp_conf.SMTP_SENDER,
-            to_email,
-            message.as_string()
-        )
-        smtp_server.quit()
+        await self.get_smtp_pool().send_message(message)
+
+    async def close(self):
+        """ Close the SMTP connections """
+        if self.smtp_pool is not None:
+            await self.smtp_pool.close()
+            self.smtp_pool = None
+
+    @property
+    def template_env(self):
+        return get_template_environment(f"{self.project_dir}/{self.folder_path}")
+
+    def precompile_templates(self):
+        """ Compile every email template ahead of the first email
+
+        :return: number of templates compiled
+        """
+        names = self.template_env.list_templates()
+        for name in names:
+            self.template_env.get_template(name)
+        return len(names)
 
     async def generate_html(self, meta):
-        template_loader = FileSystemLoader(f"{self.project_dir}/{self.folder_path}")
-        env = Environment(loader=template_loader)
-        env.trim_blocks = True
-        env.lstrip_blocks = True
-        template = env.get_template("email_verification.html")
+        template = self.template_env.get_template(self.TEMPLATE_NAME)
 
         html = template.render(
             meta=meta,
@@ -0,0 +1,170 @@
+"""
+Email delivery queue, drained by `python -m app.scripts.mails.email_worker`.
+
+A request only pushes a job (the email payload, as JSON) to a Redis list, and leaves the SMTP conversation to the
+worker processes. A worker claims a job atomically: it moves it from the list to a sorted set of jobs in progress,
+scored by the end of its lease. Then, once the email is sent, the job is dropped; if it failed, the job is scheduled
+again after an exponential backoff, in a sorted set of delayed jobs, and dead-lettered after
+`EMAIL_QUEUE_MAX_ATTEMPTS` attempts.
+
+Crash safety: a job whose lease expired (its worker crashed, or hangs) goes back to the queue, so an email is sent
+at least once; it may be sent twice if a worker dies right between the SMTP server accepting it and the job being
+dropped. Jobs are lost along with Redis, if it does not persist its data (AOF/RDB).
+When Redis is unreachable, the email is sent by the web worker itself, in the background.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.utils.email_publisher import epub
+from app.utils.redis import RedisClient
+
+L = logging.getLogger("uvicorn.error")
+
+# KEYS[1]: queue, KEYS[2]: jobs in progress, KEYS[3]: delayed jobs; ARGV[1]: now, ARGV[2]: end of the lease.
+# Queues the delayed jobs due and the jobs whose lease expired, then claims the first job, if any
+CLAIM_EMAIL_SCRIPT = """
+for _, key in ipairs({KEYS[3], KEYS[2]}) do
+    local jobs = redis.call('ZRANGEBYSCORE', key, '-inf', ARGV[1], 'LIMIT', 0, 100)
+    for _, job in ipairs(jobs) do
+        redis.call('ZREM', key, job)
+        redis.call('RPUSH', KEYS[1], job)
+    end
+end
+local job = redis.call('LPOP', KEYS[1])
+if job then
+    redis.call('ZADD', KEYS[2], ARGV[2], job)
+end
+return job
+"""
+
+# KEYS[1]: jobs in progress, KEYS[2]: delayed jobs, KEYS[3]: dead letters; ARGV[1]: claimed job,
+# ARGV[2]: `done`, `retry` or `dead`, ARGV[3]: job to keep, ARGV[4]: when to try it again.
+# Returns 0 when the lease had expired, the job being queued again already
+SETTLE_EMAIL_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if ARGV[2] == 'retry' then
+    redis.call('ZADD', KEYS[2], ARGV[4], ARGV[3])
+elseif ARGV[2] == 'dead' then
+    redis.call('RPUSH', KEYS[3], ARGV[3])
+end
+return 1
+"""
+
+
+class EmailQueue(object):
+    """
+    Emails waiting to be sent, shared by all workers
+    """
+
+    key_prefix: str = "email-queue"
+    queue_key: str = f"{key_prefix}:jobs"
+    processing_key: str = f"{key_prefix}:processing"
+    delayed_key: str = f"{key_prefix}:delayed"
+    dead_key: str = f"{key_prefix}:dead"
+    fallback_tasks: Set[asyncio.Task] = set()
+    counters: Dict[str, int] = {
+        "enqueued": 0, "fallbacks": 0, "sent": 0, "retried": 0, "dead": 0, "expired_leases": 0,
+    }
+
+    @classmethod
+    async def enqueue(cls, email_obj: Dict) -> bool:
+        """ Queue an email, see `EmailPublisher.compose_and_wait` for the payload
+
+        :param email_obj:
+        :return: whether it has been queued; otherwise it is being sent in the background by this worker
+        """
+        job = {"id": uuid.uuid4().hex, "email": email_obj, "attempts": 0, "enqueued_at": time.time()}
+        try:
+            await RedisClient.rpush(cls.queue_key, json.dumps(job))
+        except Exception as err:
+            L.warning(f"Email could not be queued, sending it right away: {err}")
+            cls.counters["fallbacks"] += 1
+            task = asyncio.ensure_future(epub.compose_and_wait(email_obj))
+            cls.fallback_tasks.add(task)
+            task.add_done_callback(cls.fallback_tasks.discard)
+            return False
+
+        cls.counters["enqueued"] += 1
+        return True
+
+    @classmethod
+    async def claim(cls) -> Optional[Tuple[str, Dict]]:
+        """ Take the next email to send, for `EMAIL_QUEUE_LEASE_SECONDS`
+
+        :return: the job as stored, to settle it, and decoded; None when the queue is empty (or Redis unreachable)
+        """
+        now = time.time()
+        raw = await RedisClient.run_script(
+            CLAIM_EMAIL_SCRIPT,
+            keys=(cls.queue_key, cls.processing_key, cls.delayed_key),
+            args=(now, now + settings.EMAIL_QUEUE_LEASE_SECONDS),
+        )
+        if not raw:
+            return None
+
+        raw = raw.decode() if isinstance(raw, bytes) else raw
+        return raw, json.loads(raw)
+
+    @classmethod
+    async def complete(cls, raw: str) -> None:
+        """ Drop a job, its email being sent
+
+        :param raw: claimed job, as stored
+        :return:
+        """
+        await cls._settle(raw, "done")
+        cls.counters["sent"] += 1
+
+    @classmethod
+    async def fail(cls, raw: str, job: Dict) -> None:
+        """ Schedule a job again after a backoff, or dead-letter it once out of attempts
+
+        :param raw: claimed job, as stored
+        :param job: claimed job, decoded
+        :return:
+        """
+        job = dict(job, attempts=job["attempts"] + 1)
+        if job["attempts"] >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+            L.error(f"Email {job['id']} dead-lettered after {job['attempts']} attempts")
+            await cls._settle(raw, "dead", job)
+            cls.counters["dead"] += 1
+            return
+
+        await cls._settle(raw, "retry", job, time.time() + cls.backoff(job["attempts"]))
+        cls.counters["retried"] += 1
+
+    @classmethod
+    def backoff(cls, attempts: int) -> float:
+        """ Delay before the next attempt: exponential, jittered so that the failures of an outage spread out
+
+        :param attempts: number of failed attempts so far
+        :return: seconds
+        """
+        delay = min(
+            settings.EMAIL_QUEUE_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.EMAIL_QUEUE_MAX_BACKOFF_SECONDS,
+        )
+        return delay * random.uniform(0.5, 1)
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return dict(cls.counters)
+
+    @classmethod
+    async def _settle(cls, raw: str, outcome: str, job: Optional[Dict] = None, retry_at: float = 0) -> None:
+        settled = await RedisClient.run_script(
+            SETTLE_EMAIL_SCRIPT,
+            keys=(cls.processing_key, cls.delayed_key, cls.dead_key),
+            args=(raw, outcome, json.dumps(job) if job else "", retry_at),
+        )
+        if settled == 0:
+            # the job has been queued again meanwhile; it will be sent again
+            cls.counters["expired_leases"] += 1
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""Metrics helper utilities."""
+
+
+def percentile_ms(sorted_samples: list, quantile: float) -> float:
+    """Pick a percentile out of latency samples.
+
+    Args:
+        sorted_samples (list): Latencies in seconds, sorted ascending.
+        quantile (float): Quantile between 0 and 1, e.g. 0.95.
+
+    Returns:
+        float: The percentile in milliseconds, 0 without samples.
+
+    """
+    if not sorted_samples:
+        return 0.0
+
+    index = min(len(sorted_samples) - 1, int(quantile * len(sorted_samples)))
+    return round(sorted_samples[index] * 1000, 3)
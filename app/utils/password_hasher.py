@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""Password hasher class utility."""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core import security
+from app.core.config import settings
+from app.exceptions import ErrorMessage
+from app.utils.metrics import percentile_ms
+from app.utils.redis import RedisClient
+
+
+def _timed_call(func: Callable, *args) -> Tuple[object, float]:
+    """Run `func` inside the worker and measure how long it ran.
+
+    Module level on purpose, so it can be pickled into a process pool.
+
+    """
+    started_at = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started_at
+
+
+class PasswordHasher(object):
+    """Password hasher utility.
+
+    Utility class to run bcrypt hashing and verification in a bounded worker
+    pool, so one burst of logins does not stall the event loop. Jobs above
+    `PASSWORD_HASHER_MAX_QUEUE_DEPTH` are rejected with HTTP 503 right away
+    instead of piling up behind the busy workers.
+
+    The bcrypt cost is either pinned by configuration or calibrated once at
+    startup against a per-hash latency budget, see `configure_cost`.
+
+    Attributes:
+        executor (Executor, optional): Thread or process pool running the jobs.
+        bcrypt_rounds (int, optional): bcrypt cost in use; None keeps passlib's default.
+        calibration_key (str): Redis key sharing the calibrated cost across workers.
+        log (logging.Logger): Logging handler for this class.
+        in_flight (int): Number of jobs either queued or running.
+        background_tasks (set): Pending re-hash tasks, referenced until done.
+        counters (dict): Total of accepted and rejected jobs per operation.
+        latencies (dict): Recent per-call latencies (in seconds) per operation,
+            as tuples of (total, run) where `total` includes the queue wait.
+
+    """
+
+    executor: Executor = None
+    bcrypt_rounds: Optional[int] = None
+    calibration_key: str = "password-hasher:bcrypt-rounds"
+    log: logging.Logger = logging.getLogger("uvicorn.error")
+    in_flight: int = 0
+    background_tasks: Set[asyncio.Task] = set()
+    counters: Dict[str, int] = {"hash": 0, "verify": 0, "rejected": 0, "rehashed": 0}
+    latencies: Dict[str, deque] = {
+        "hash": deque(maxlen=1024),
+        "verify": deque(maxlen=1024),
+    }
+
+    @classmethod
+    def open_executor(cls) -> Executor:
+        """Create the worker pool based on configuration.
+
+        Returns:
+            Executor: Thread or process pool executor instance.
+
+        """
+        if cls.executor is None:
+            max_workers = settings.PASSWORD_HASHER_WORKERS or os.cpu_count() or 1
+            cls.log.debug(
+                "Initialize password hasher ({} pool, {} workers).".format(
+                    settings.PASSWORD_HASHER_EXECUTOR, max_workers
+                )
+            )
+
+            if settings.PASSWORD_HASHER_EXECUTOR == "process":
+                # every worker process owns a copy of `pwd_context`, pin its cost as well
+                cls.executor = ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=security.configure_password_context,
+                    initargs=(cls.bcrypt_rounds,),
+                )
+            else:
+                cls.executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="password-hasher"
+                )
+
+        return cls.executor
+
+    @classmethod
+    async def configure_cost(cls) -> Optional[int]:
+        """Pick the bcrypt cost and apply it to the password context.
+
+        A pinned `PASSWORD_HASH_ROUNDS` always wins. Otherwise, when
+        `PASSWORD_HASH_CALIBRATE` is enabled, the first worker to start
+        calibrates and shares the result through Redis, so every worker hashes
+        with the same cost instead of re-hashing each other's output.
+
+        Must be called before `open_executor`.
+
+        Returns:
+            int, optional: The bcrypt cost in use, None for passlib's default.
+
+        """
+        rounds = settings.PASSWORD_HASH_ROUNDS
+
+        if rounds is None and settings.PASSWORD_HASH_CALIBRATE:
+            shared_rounds = await RedisClient.get(cls.calibration_key)
+            if shared_rounds:
+                rounds = int(shared_rounds)
+            else:
+                rounds = await cls._calibrate()
+
+                # another worker may have won the race, then follow its result
+                expired = settings.PASSWORD_HASH_CALIBRATION_TTL_HOURS * 3600
+                if not await RedisClient.set(cls.calibration_key, rounds, expired, nx=True):
+                    shared_rounds = await RedisClient.get(cls.calibration_key)
+                    if shared_rounds:
+                        rounds = int(shared_rounds)
+
+        if rounds is not None:
+            security.configure_password_context(rounds)
+            cls.log.info("Password hashing uses bcrypt with {} rounds".format(rounds))
+
+        cls.bcrypt_rounds = rounds
+        return rounds
+
+    @classmethod
+    async def _calibrate(cls) -> int:
+        loop = asyncio.get_running_loop()
+        rounds, run_time = await loop.run_in_executor(
+            None,
+            _timed_call,
+            security.calibrate_bcrypt_rounds,
+            settings.PASSWORD_HASH_TARGET_MS,
+            settings.PASSWORD_HASH_MIN_ROUNDS,
+            settings.PASSWORD_HASH_MAX_ROUNDS,
+        )
+        cls.log.info(
+            "Calibrated bcrypt to {} rounds for a {} ms budget (took {:.0f} ms)".format(
+                rounds, settings.PASSWORD_HASH_TARGET_MS, run_time * 1000
+            )
+        )
+        return rounds
+
+    @classmethod
+    def close_executor(cls) -> None:
+        """Shutdown the worker pool."""
+        if cls.executor:
+            cls.log.debug("Closing password hasher pool")
+            cls.executor.shutdown(wait=True)
+            cls.executor = None
+
+    @classmethod
+    async def hash(cls, password: str) -> str:
+        """Hash a plain password in the worker pool.
+
+        Args:
+            password (str): Plain password.
+
+        Returns:
+            str: Hashed password.
+
+        Raises:
+            HTTPException: 503 if the pool is saturated.
+
+        """
+        return await cls._submit("hash", security.get_password_hash, password)
+
+    @classmethod
+    async def verify(cls, plain_password: str, hashed_password: str) -> bool:
+        """Verify a plain password against its hash in the worker pool.
+
+        Args:
+            plain_password (str): Plain password.
+            hashed_password (str): Stored hashed password.
+
+        Returns:
+            bool: Whether the password matches.
+
+        Raises:
+            HTTPException: 503 if the pool is saturated.
+
+        """
+        return await cls._submit(
+            "verify", security.verify_password, plain_password, hashed_password
+        )
+
+    @classmethod
+    def rehash_in_background(
+        cls,
+        password: str,
+        hashed_password: str,
+        on_rehashed: Callable[[str, str], Awaitable],
+    ) -> None:
+        """Re-hash a verified password with the current cost, off the request path.
+
+        Args:
+            password (str): Plain password, already verified against `hashed_password`.
+            hashed_password (str): Outdated stored hash.
+            on_rehashed (callable): Coroutine function persisting the new hash,
+                called with (old_hash, new_hash).
+
+        """
+        task = asyncio.ensure_future(cls._rehash(password, hashed_password, on_rehashed))
+        cls.background_tasks.add(task)
+        task.add_done_callback(cls.background_tasks.discard)
+
+    @classmethod
+    async def _rehash(cls, password: str, hashed_password: str, on_rehashed: Callable) -> None:
+        try:
+            new_hashed_password = await cls.hash(password)
+            await on_rehashed(hashed_password, new_hashed_password)
+        except HTTPException:
+            # the pool is saturated; the next login will try again
+            cls.log.debug("Password hasher busy, skip the background re-hash")
+            return
+        except Exception as ex:
+            cls.log.exception(
+                "Background password re-hash finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return
+
+        cls.counters["rehashed"] += 1
+
+    @classmethod
+    async def _submit(cls, operation: str, func: Callable, *args):
+        if cls.in_flight >= settings.PASSWORD_HASHER_MAX_QUEUE_DEPTH:
+            cls.counters["rejected"] += 1
+            cls.log.warning(
+                "Password hasher saturated ({} jobs in flight), rejecting {}".format(
+                    cls.in_flight, operation
+                )
+            )
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=ErrorMessage.SERVICE_BUSY.value,
+                headers={"Retry-After": "1"},
+            )
+
+        executor = cls.open_executor()
+        loop = asyncio.get_running_loop()
+
+        cls.in_flight += 1
+        started_at = time.perf_counter()
+        try:
+            result, run_time = await loop.run_in_executor(
+                executor, _timed_call, func, *args
+            )
+        finally:
+            cls.in_flight -= 1
+
+        total_time = time.perf_counter() - started_at
+        cls.counters[operation] += 1
+        cls.latencies[operation].append((total_time, run_time))
+        cls.log.debug(
+            "Password {} took {:.1f} ms ({:.1f} ms waiting in queue)".format(
+                operation, total_time * 1000, (total_time - run_time) * 1000
+            )
+        )
+
+        return result
+
+    @classmethod
+    def stats(cls) -> Dict:
+        """Summarize the pool load and the recent per-call latencies.
+
+        Returns:
+            dict: Pool load, counters and latency percentiles in milliseconds.
+
+        """
+        latencies = {}
+        for operation, samples in cls.latencies.items():
+            totals = sorted(total for total, _ in samples)
+            waits = sorted(total - run for total, run in samples)
+            latencies[operation] = {
+                "samples": len(totals),
+                "p50_ms": percentile_ms(totals, 0.50),
+                "p95_ms": percentile_ms(totals, 0.95),
+                "p99_ms": percentile_ms(totals, 0.99),
+                "max_ms": percentile_ms(totals, 1.0),
+                "queue_wait_p95_ms": percentile_ms(waits, 0.95),
+            }
+
+        return {
+            "executor": settings.PASSWORD_HASHER_EXECUTOR,
+            "bcrypt_rounds": cls.bcrypt_rounds,
+            "in_flight": cls.in_flight,
+            "max_queue_depth": settings.PASSWORD_HASHER_MAX_QUEUE_DEPTH,
+            "counters": dict(cls.counters),
+            "latencies": latencies,
+        }
@@ -1,11 +1,114 @@
 # -*- coding: utf-8 -*-
 """Redis client class utility."""
 import logging
+import time
+from collections import deque
 
 import aioredis
 import aioredis.sentinel
+from aioredis.connection import BlockingConnectionPool
 from aioredis.exceptions import RedisError
 from app.core.config import redis as redis_conf
+from app.utils.metrics import percentile_ms
+
+# KEYS[1]: lock; ARGV[1]: token of its owner
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class PoolStatsMixin(object):
+    """Connection pool mixin measuring the connection checkouts.
+
+    A checkout lasts from the request for a connection until it is handed
+    out, i.e. the wait for a free connection plus the connect of a new one.
+
+    Attributes:
+        checked_out (set): Connections currently handed out.
+        waiting (int): Number of checkouts in progress.
+        checkouts (int): Total of connections handed out.
+        failures (int): Total of failed checkouts, e.g. the pool stayed full
+            for longer than its timeout, or Redis could not be reached.
+        wait_times (collections.deque): Recent checkout durations in seconds.
+        created (int): Number of connections made since the pool was (re)set,
+            e.g. after a fork.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.created = 0
+        self.checked_out = set()
+        self.waiting = 0
+        self.checkouts = 0
+        self.failures = 0
+        self.wait_times = deque(maxlen=1024)
+        super().__init__(*args, **kwargs)
+
+    async def get_connection(self, command_name, *keys, **options):
+        started_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.waiting -= 1
+            self.wait_times.append(time.perf_counter() - started_at)
+
+        self.checked_out.add(connection)
+        self.checkouts += 1
+        return connection
+
+    async def release(self, connection):
+        self.checked_out.discard(connection)
+        await super().release(connection)
+
+    def reset(self):
+        super().reset()
+        self.created = 0
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.created += 1
+        return connection
+
+    def created_connections(self):
+        return self.created
+
+    def stats(self):
+        """Summarize the pool usage.
+
+        Returns:
+            dict: Connection counts and checkout time percentiles in milliseconds.
+
+        """
+        created_connections = self.created_connections()
+        in_use = len(self.checked_out)
+        wait_times = sorted(self.wait_times)
+        return {
+            "max_connections": self.max_connections,
+            "created": created_connections,
+            "in_use": in_use,
+            "idle": max(created_connections - in_use, 0),
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "failures": self.failures,
+            "wait_p50_ms": percentile_ms(wait_times, 0.50),
+            "wait_p95_ms": percentile_ms(wait_times, 0.95),
+            "wait_max_ms": percentile_ms(wait_times, 1.0),
+        }
+
+
+class InstrumentedBlockingConnectionPool(PoolStatsMixin, BlockingConnectionPool):
+    """Blocking connection pool, waiting for a free connection once full."""
+
+
+class InstrumentedSentinelConnectionPool(PoolStatsMixin, aioredis.sentinel.SentinelConnectionPool):
+    """Sentinel connection pool; it fails right away once full."""
 
 
 class RedisClient(object):
@@ -15,14 +118,22 @@ class RedisClient(object):
 
     Attributes:
         redis_client (aioredis.Redis, optional): Redis client object instance.
+        replica_client (aioredis.Redis, optional): Client reading from the
+            Sentinel replicas, None without Sentinel.
+        replica_counters (dict): Total of reads sent to a replica, and of
+            those retried on the master.
         log (logging.Logger): Logging handler for this class.
         base_redis_init_kwargs (dict): Common kwargs regardless other Redis
             configuration
         connection_kwargs (dict, optional): Extra kwargs for Redis object init.
+        scripts (dict): Registered Lua scripts by source, see `run_script`.
 
     """
 
     redis_client: aioredis.Redis = None
+    replica_client: aioredis.Redis = None
+    replica_counters: dict = {"reads": 0, "fallbacks": 0}
+    scripts: dict = {}
     log: logging.Logger = logging.getLogger("uvicorn.error")
     base_redis_init_kwargs: dict = {
         "encoding": "utf-8",
@@ -42,40 +153,53 @@ class RedisClient(object):
         """
         if cls.redis_client is None:
             cls.log.debug("Initialize Redis client.")
-            if redis_conf.REDIS_USERNAME and redis_conf.REDIS_PASSWORD:
-                cls.connection_kwargs = {
-                    "username": redis_conf.REDIS_USERNAME,
-                    "password": redis_conf.REDIS_PASSWORD,
-                }
+            cls.connection_kwargs = {
+                "db": int(redis_conf.REDIS_DB),
+                "username": redis_conf.REDIS_USERNAME or None,
+                "password": redis_conf.REDIS_PASSWORD or None,
+                "socket_timeout": redis_conf.REDIS_SOCKET_TIMEOUT,
+                "socket_connect_timeout": redis_conf.REDIS_SOCKET_CONNECT_TIMEOUT,
+                "retry_on_timeout": redis_conf.REDIS_RETRY_ON_TIMEOUT,
+                "health_check_interval": redis_conf.REDIS_HEALTH_CHECK_INTERVAL,
+            }
 
             if redis_conf.REDIS_USE_SENTINEL:
+                sentinel_kwargs = {
+                    "socket_timeout": redis_conf.REDIS_SOCKET_TIMEOUT,
+                    "socket_connect_timeout": redis_conf.REDIS_SOCKET_CONNECT_TIMEOUT,
+                }
+                if redis_conf.REDIS_USERNAME and redis_conf.REDIS_PASSWORD:
+                    sentinel_kwargs.update({
+                        "username": redis_conf.REDIS_USERNAME,
+                        "password": redis_conf.REDIS_PASSWORD,
+                    })
+
                 sentinel = aioredis.sentinel.Sentinel(
                     [(redis_conf.REDIS_HOST, redis_conf.REDIS_PORT)],
-                    sentinel_kwargs=cls.connection_kwargs,
+                    sentinel_kwargs=sentinel_kwargs,
+                    **cls.base_redis_init_kwargs,
+                    **cls.connection_kwargs,
                 )
-                cls.redis_client = sentinel.master_for("mymaster")
-            else:
-                cls.base_redis_init_kwargs.update(cls.connection_kwargs)
-
-                # password exists
-                if len(redis_conf.REDIS_PASSWORD) > 0:
-                    # build redis URL
-                    redis_url = "redis://{}:{}@{}:{}/{}".format(
-                        redis_conf.REDIS_USERNAME, redis_conf.REDIS_PASSWORD, redis_conf.REDIS_HOST, redis_conf.REDIS_PORT,
-                        redis_conf.REDIS_DB
-                    )
-
-                    cls.redis_client = aioredis.from_url(
-                        redis_url,
-                        **cls.base_redis_init_kwargs,
-                    )
-
-                # password does not exist
-                else:
-                    cls.redis_client = aioredis.from_url(
-                        "redis://{0:s}".format(redis_conf.REDIS_HOST),
-                        **cls.base_redis_init_kwargs,
+                cls.redis_client = sentinel.master_for(
+                    redis_conf.REDIS_SENTINEL_SERVICE_NAME,
+                    connection_pool_class=InstrumentedSentinelConnectionPool,
+                    max_connections=redis_conf.REDIS_MAX_CONNECTIONS,
+                )
+                if redis_conf.REDIS_READ_FROM_REPLICAS:
+                    cls.replica_client = sentinel.slave_for(
+                        redis_conf.REDIS_SENTINEL_SERVICE_NAME,
+                        connection_pool_class=InstrumentedSentinelConnectionPool,
+                        max_connections=redis_conf.REDIS_MAX_CONNECTIONS,
                     )
+            else:
+                connection_pool = InstrumentedBlockingConnectionPool(
+                    host=redis_conf.REDIS_HOST,
+                    max_connections=redis_conf.REDIS_MAX_CONNECTIONS,
+                    timeout=redis_conf.REDIS_POOL_TIMEOUT,
+                    **cls.base_redis_init_kwargs,
+                    **cls.connection_kwargs,
+                )
+                cls.redis_client = aioredis.Redis(connection_pool=connection_pool)
 
         return cls.redis_client
 
@@ -85,6 +209,60 @@ class RedisClient(object):
         if cls.redis_client:
             cls.log.debug("Closing Redis client")
             await cls.redis_client.close()
+            await cls.redis_client.connection_pool.disconnect()
+            cls.redis_client = None
+
+        if cls.replica_client:
+            await cls.replica_client.close()
+            await cls.replica_client.connection_pool.disconnect()
+            cls.replica_client = None
+
+    @classmethod
+    def pool_stats(cls):
+        """Summarize the connection pool usage of this worker.
+
+        Returns:
+            dict: Pool stats of the master and of the replicas, see
+                `PoolStatsMixin.stats`; empty while not opened.
+
+        """
+        return {
+            "master": cls.redis_client.connection_pool.stats() if cls.redis_client else {},
+            "replica": cls.replica_client.connection_pool.stats() if cls.replica_client else {},
+            "replica_counters": dict(cls.replica_counters),
+        }
+
+    @classmethod
+    async def _read(cls, command, *args, replica=False):
+        """Run a read-only command, on a replica if asked for and available.
+
+        Replicas lag behind the master: callers for which a missing key is
+        significant have to confirm it on the master.
+
+        Args:
+            command (str): Name of the aioredis.Redis method to call.
+            *args: Command arguments.
+            replica (bool): Read from a replica, falling back to the master
+                whenever the replica fails.
+
+        Returns:
+            response: Command reply.
+
+        Raises:
+            aioredis.RedisError: If the master failed while executing command.
+
+        """
+        if replica and cls.replica_client is not None:
+            cls.replica_counters["reads"] += 1
+            try:
+                return await getattr(cls.replica_client, command)(*args)
+            except Exception as ex:
+                cls.replica_counters["fallbacks"] += 1
+                cls.log.warning(
+                    "Redis {} command failed on replica ({}), retry on master".format(command.upper(), ex)
+                )
+
+        return await getattr(cls.redis_client, command)(*args)
 
     @classmethod
     async def ping(cls):
@@ -119,7 +297,7 @@ class RedisClient(object):
             return False
 
     @classmethod
-    async def set(cls, key, value, expired=None):
+    async def set(cls, key, value, expired=None, nx=False):
         """Execute Redis SET command.
 
         Set key to hold the string value. If key already holds a value, it is
@@ -128,10 +306,12 @@ class RedisClient(object):
         Args:
             key (str): Redis db key.
             value (str): Value to be set.
+            expired (int, optional): Expiry time in seconds.
+            nx (bool): Only set the key if it does not already exist.
 
         Returns:
-            response: Redis SET command response, for more info
-                look: https://redis.io/commands/set#return-value
+            response: Whether the key has been set; False when `nx` is given
+                and the key already exists, or when the command failed.
 
         Raises:
             aioredis.RedisError: If Redis client failed while executing command.
@@ -144,7 +324,7 @@ class RedisClient(object):
         )
 
         try:
-            await redis_client.set(key, value, expired)
+            result = await redis_client.set(key, value, expired, nx=nx)
         except RedisError as ex:
             cls.log.exception(
                 "Redis SET command finished with exception",
@@ -158,7 +338,49 @@ class RedisClient(object):
             )
             return False
 
-        return True
+        return bool(result)
+
+    @classmethod
+    async def set_many(cls, items):
+        """Execute several Redis SET commands in one transaction.
+
+        Every key gets its own expiry time; the commands are sent as a single
+        MULTI/EXEC pipeline, i.e. one round-trip, and applied atomically.
+
+        Args:
+            items (dict): Values and expiry times (in seconds, or None) by key,
+                as {key: (value, expired)}.
+
+        Returns:
+            response: Whether all keys have been set, False if the command
+                failed.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis SET pipeline, keys: {}".format(list(items)))
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                for key, (value, expired) in items.items():
+                    pipe.set(key, value, expired)
+                results = await pipe.execute()
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis SET pipeline finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+        except Exception as ex:
+            cls.log.exception(
+                "Redis SET pipeline finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+
+        return all(results)
 
     @classmethod
     async def rpush(cls, key, value):
@@ -186,7 +408,7 @@ class RedisClient(object):
             "Preform Redis RPUSH command, key: {}, value: {}".format(key, value)
         )
         try:
-            await redis_client.rpush(key, value)
+            return await redis_client.rpush(key, value)
         except RedisError as ex:
             cls.log.exception(
                 "Redis RPUSH command finished with exception",
@@ -195,13 +417,14 @@ class RedisClient(object):
             raise ex
 
     @classmethod
-    async def exists(cls, key):
+    async def exists(cls, key, replica=False):
         """Execute Redis EXISTS command.
 
         Returns if key exists.
 
         Args:
             key (str): Redis db key.
+            replica (bool): Read from a replica, see `_read`.
 
         Returns:
             response: Boolean whether key exists in Redis db.
@@ -210,13 +433,11 @@ class RedisClient(object):
             aioredis.RedisError: If Redis client failed while executing command.
 
         """
-        redis_client = cls.redis_client
-
         cls.log.debug(
             "Preform Redis EXISTS command, key: {}, exists".format(key)
         )
         try:
-            return await redis_client.exists(key)
+            return await cls._read("exists", key, replica=replica)
         except RedisError as ex:
             cls.log.exception(
                 "Redis EXISTS command finished with exception",
@@ -225,7 +446,7 @@ class RedisClient(object):
             raise ex
 
     @classmethod
-    async def get(cls, key):
+    async def get(cls, key, replica=False):
         """Execute Redis GET command.
 
         Get the value of key. If the key does not exist the special value None
@@ -234,6 +455,7 @@ class RedisClient(object):
 
         Args:
             key (str): Redis db key.
+            replica (bool): Read from a replica, see `_read`.
 
         Returns:
             response: Value of key.
@@ -242,11 +464,9 @@ class RedisClient(object):
             aioredis.RedisError: If Redis client failed while executing command.
 
         """
-        redis_client = cls.redis_client
-
         cls.log.debug("Preform Redis GET command, key: {}".format(key))
         try:
-            return await redis_client.get(key)
+            return await cls._read("get", key, replica=replica)
         except RedisError as ex:
             cls.log.exception(
                 "Redis GET command finished with exception",
@@ -262,16 +482,53 @@ class RedisClient(object):
             return False
 
     @classmethod
-    async def delete(cls, key):
-        """Execute Redis DELETE command.
+    async def mget(cls, *keys, replica=False):
+        """Execute Redis MGET command.
+
+        Get the values of all the given keys in one round-trip. For every key
+        that does not exist, the special value None is returned.
+
+        Args:
+            *keys (str): Redis db keys.
+            replica (bool): Read from a replica, see `_read`.
+
+        Returns:
+            response: List of values in the order of `keys`, or False if the
+                command failed.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        cls.log.debug("Preform Redis MGET command, keys: {}".format(keys))
+        try:
+            return await cls._read("mget", *keys, replica=replica)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis MGET command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+        except Exception as ex:
+            cls.log.exception(
+                "Redis MGET command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+
+    @classmethod
+    async def getdel(cls, key):
+        """Execute Redis GET and DELETE commands in one transaction.
 
-        Delete the value of key.
+        Get the value of key and delete the key, atomically and in one
+        round-trip. Sent as MULTI/EXEC rather than GETDEL, which needs Redis 6.2.
 
         Args:
             key (str): Redis db key.
 
         Returns:
-            response: Boolean.
+            response: Value of key, None if the key does not exist, or False if
+                the command failed.
 
         Raises:
             aioredis.RedisError: If Redis client failed while executing command.
@@ -279,9 +536,47 @@ class RedisClient(object):
         """
         redis_client = cls.redis_client
 
-        cls.log.debug("Preform Redis DELETE command, key: {}".format(key))
+        cls.log.debug("Preform Redis GET/DELETE transaction, key: {}".format(key))
         try:
-            return await redis_client.delete(key)
+            async with redis_client.pipeline(transaction=True) as pipe:
+                value, _ = await pipe.get(key).delete(key).execute()
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis GET/DELETE transaction finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+        except Exception as ex:
+            cls.log.exception(
+                "Redis GET/DELETE transaction finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+
+        return value
+
+    @classmethod
+    async def delete(cls, *keys):
+        """Execute Redis DELETE command.
+
+        Delete the value of the given keys.
+
+        Args:
+            *keys (str): Redis db keys.
+
+        Returns:
+            response: Number of keys that were removed, or False if the command
+                failed.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis DELETE command, keys: {}".format(keys))
+        try:
+            return await redis_client.delete(*keys)
         except RedisError as ex:
             cls.log.exception(
                 "Redis DELETE command finished with exception",
@@ -296,6 +591,67 @@ class RedisClient(object):
             )
             return False
 
+    @classmethod
+    async def run_script(cls, source, keys=(), args=()):
+        """Execute a Lua script with Redis EVALSHA command.
+
+        The script runs atomically on the server, so a read-modify-write over
+        several keys costs one round-trip. It is registered once per source,
+        and loaded again whenever the server does not know it (yet).
+
+        Args:
+            source (str): Lua script source.
+            keys (list): Redis db keys, available as KEYS in the script.
+            args (list): Extra arguments, available as ARGV in the script.
+
+        Returns:
+            response: Value returned by the script, or False if the command
+                failed.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis EVALSHA command, keys: {}".format(keys))
+        try:
+            script = cls.scripts.get(source)
+            if script is None:
+                script = cls.scripts[source] = redis_client.register_script(source)
+            return await script(keys=keys, args=args, client=redis_client)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis EVALSHA command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+        except Exception as ex:
+            cls.log.exception(
+                "Redis EVALSHA command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+
+    @classmethod
+    async def release_lock(cls, key, token):
+        """Release a lock taken with `set(key, token, expired, nx=True)`.
+
+        The lock is only deleted while it still holds `token`: once it has
+        expired, another owner may hold it, and keeps it.
+
+        Args:
+            key (str): Redis db key of the lock.
+            token (str): Unique token of the owner, set as the lock value.
+
+        Returns:
+            response: Whether the lock has been released, False if it is held
+                by another owner, gone, or the command failed.
+
+        """
+        cls.log.debug("Preform Redis lock release, key: {}".format(key))
+        return await cls.run_script(RELEASE_LOCK_SCRIPT, keys=(key,), args=(token,)) == 1
+
     @classmethod
     async def lrange(cls, key, start, end):
         """Execute Redis LRANGE command.
@@ -336,3 +692,73 @@ class RedisClient(object):
                 exc_info=(type(ex), ex, ex.__traceback__),
             )
             raise ex
+
+    @classmethod
+    async def publish(cls, channel, message):
+        """Execute Redis PUBLISH command.
+
+        Post a message to the given channel.
+
+        Args:
+            channel (str): Redis pub/sub channel.
+            message (str): Message to be posted.
+
+        Returns:
+            response: Number of clients that received the message, or False
+                if the command failed.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug(
+            "Preform Redis PUBLISH command, channel: {}, message: {}".format(channel, message)
+        )
+        try:
+            return await redis_client.publish(channel, message)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis PUBLISH command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+        except Exception as ex:
+            cls.log.exception(
+                "Redis PUBLISH command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            return False
+
+    @classmethod
+    async def subscribe(cls, *channels):
+        """Execute Redis SUBSCRIBE command.
+
+        Subscribe to the given channels on a dedicated connection.
+
+        Args:
+            *channels (str): Redis pub/sub channels.
+
+        Returns:
+            response: aioredis.client.PubSub object to read the messages from.
+
+        Raises:
+            aioredis.RedisError: If Redis client failed while executing command.
+
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug("Preform Redis SUBSCRIBE command, channels: {}".format(channels))
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(*channels)
+        except RedisError as ex:
+            cls.log.exception(
+                "Redis SUBSCRIBE command finished with exception",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            await pubsub.reset()
+            raise ex
+
+        return pubsub
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""SMTP connection pool utility."""
+import asyncio
+import logging
+import time
+from collections import deque
+
+import aiosmtplib
+from aiosmtplib.errors import SMTPServerDisconnected
+
+
+class SMTPPool(object):
+    """Pool of authenticated SMTP connections, reused across messages.
+
+    Opening a connection costs a TCP and TLS handshake, then EHLO and AUTH,
+    i.e. several round-trips before the first message; a pooled connection
+    only sends the envelope and the message. Up to `size` messages are sent
+    at a time, each one on its own connection.
+
+    SMTP servers drop the connections idle for a while: a connection idle
+    for longer than `idle_timeout` is closed instead of reused, and a message
+    whose connection was dropped anyway is sent again on a new connection.
+
+    Attributes:
+        hostname (str): SMTP server.
+        port (int): SMTP port.
+        username (str, optional): Login, if any.
+        password (str, optional): Password of the login.
+        use_tls (bool): Connect over TLS (SMTPS).
+        timeout (float): Connection and command timeout in seconds.
+        size (int): Maximum number of connections.
+        idle_timeout (float): Seconds after which an idle connection is
+            closed rather than reused.
+        idle (collections.deque): Idle connections, with the time they were
+            released, most recently used last.
+        counters (dict): Totals of connections opened, reused, recycled
+            after their idle timeout and reopened after being dropped, and of
+            messages sent and failed.
+        log (logging.Logger): Logging handler for this class.
+
+    """
+
+    log: logging.Logger = logging.getLogger("uvicorn.error")
+
+    def __init__(self, hostname, port, username=None, password=None, use_tls=True, timeout=30, size=4,
+                 idle_timeout=60):
+        self.hostname = hostname
+        self.port = port
+        self.username = username or None
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.idle = deque()
+        self.in_use = 0
+        self.slots = None
+        self.counters = {"connects": 0, "reuses": 0, "recycled": 0, "reconnects": 0, "sent": 0, "failures": 0}
+
+    async def send_message(self, message):
+        """Send a message on a pooled connection.
+
+        Args:
+            message (email.message.Message): Message to send; the sender and
+                the recipients are taken from its headers.
+
+        Raises:
+            aiosmtplib.SMTPException: If the server refused the message, or
+                could not be reached.
+
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.size)
+
+        async with self.slots:
+            self.in_use += 1
+            client = None
+            try:
+                client = await self._acquire()
+                try:
+                    await client.send_message(message)
+                except SMTPServerDisconnected:
+                    # dropped by the server since its last use: try once more on a new connection
+                    client.close()
+                    self.counters["reconnects"] += 1
+                    client = await self._connect()
+                    await client.send_message(message)
+            except Exception:
+                if client is not None:
+                    client.close()
+                self.counters["failures"] += 1
+                raise
+            finally:
+                self.in_use -= 1
+
+            self.idle.append((client, time.monotonic()))
+            self.counters["sent"] += 1
+
+    async def close(self):
+        """Say QUIT on the idle connections, and close them."""
+        while self.idle:
+            client, _ = self.idle.pop()
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+
+    def stats(self):
+        """Summarize the pool usage.
+
+        Returns:
+            dict: Connection counts and the counters of the pool.
+
+        """
+        return {"size": self.size, "in_use": self.in_use, "idle": len(self.idle), **self.counters}
+
+    async def _acquire(self):
+        while self.idle:
+            client, released_at = self.idle.pop()
+            if not client.is_connected:
+                client.close()
+            elif time.monotonic() - released_at > self.idle_timeout:
+                self.counters["recycled"] += 1
+                client.close()
+            else:
+                self.counters["reuses"] += 1
+                return client
+
+        return await self._connect()
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            timeout=self.timeout,
+        )
+        # connects, then logs in if there is a username
+        await client.connect()
+        self.counters["connects"] += 1
+        return client
@@ -1,15 +1,39 @@
 from app.core.config import facebook as fb_conf
 from app.utils.common import get_root_url
+from app.utils.social_login.http_client import PooledOAuth2Client
 from typing import Dict, Optional
 
-import requests_oauthlib
-from requests_oauthlib.compliance_fixes import facebook_compliance_fix
+import httpx
+from authlib.common.urls import url_decode
+from authlib.integrations.base_client import OAuthError
+from authlib.oauth2 import OAuth2Error
 
 import logging
 
 L = logging.getLogger("uvicorn.error")
 
 
+def facebook_compliance_fix(client: PooledOAuth2Client) -> PooledOAuth2Client:
+    """ Facebook may answer the token request with an URL-encoded body rather than JSON
+
+    :param client:
+    :return:
+    """
+    def _compliance_fix(response: httpx.Response) -> httpx.Response:
+        if "application/json" in response.headers.get("content-type", ""):
+            return response
+
+        token = dict(url_decode(response.text))
+        expires = token.pop("expires", None)
+        if expires is not None:
+            token["expires_in"] = expires
+        token.setdefault("token_type", "Bearer")
+        return httpx.Response(response.status_code, json=token, request=response.request)
+
+    client.register_compliance_hook("access_token_response", _compliance_fix)
+    return client
+
+
 class FacebookLogin(object):
     """
     An asynchronous class to support the execution of facebook login
@@ -42,11 +66,12 @@ class FacebookLogin(object):
         # `/fb-callback` is the callback for facebook which is defined in `auth/route.py` under login_facebook_callback()
         redirect_uri = get_root_url(self.request.url._url) + "/fb-callback"
 
-        # initialize facebook session
-        self.fb = requests_oauthlib.OAuth2Session(
+        # initialize facebook session; its requests go through the connections shared by all logins
+        self.fb = PooledOAuth2Client(
             fb_conf.FB_CLIENT_ID,
+            fb_conf.FB_CLIENT_SECRET,
             redirect_uri=redirect_uri,
-            scope=fb_conf.FB_SCOPE
+            scope=fb_conf.FB_SCOPE,
         )
 
         # apply a fix for Facebook if enabled
@@ -58,26 +83,38 @@ class FacebookLogin(object):
 
         :return:
         """
-        authorization_url, _ = self.fb.authorization_url(fb_conf.FB_AUTHORIZATION_BASE_URL)
+        authorization_url, _ = self.fb.create_authorization_url(fb_conf.FB_AUTHORIZATION_BASE_URL)
 
         L.info(f"Facebook auth URL={authorization_url}")
 
         return authorization_url
 
     async def get_token_and_wait(self) -> Optional[Dict]:
-        # fetch token
-        self.fb.fetch_token(
-            fb_conf.FB_TOKEN_URL,
-            client_secret=fb_conf.FB_CLIENT_SECRET,
-
-            # Sample value: https://<domain>>/fb-callback?code=<the_code_from_facebook>
-            authorization_response=self.request.url._url,
-        )
+        """ Exchange the authorization code for a token, then get the user information
 
-        # get facebook user information
-        user_info = self.fb.get(
-            "https://graph.facebook.com/me?fields=id,name,email,picture{url}"
-        ).json()
+        :return: None if Facebook could not be reached, or refused the code
+        """
+        try:
+            # fetch token
+            await self.fb.fetch_token(
+                fb_conf.FB_TOKEN_URL,
+
+                # Sample value: https://<domain>>/fb-callback?code=<the_code_from_facebook>
+                authorization_response=self.request.url._url,
+            )
+
+            # get facebook user information
+            response = await self.fb.get(
+                "https://graph.facebook.com/me?fields=id,name,email,picture{url}"
+            )
+            response.raise_for_status()
+            user_info = response.json()
+        except (httpx.HTTPError, OAuthError, OAuth2Error, ValueError) as err:
+            L.error(f"Facebook login failed: {err!r}")
+            return None
+        finally:
+            # leaves the shared connections open
+            await self.fb.aclose()
 
         """
         Sample:
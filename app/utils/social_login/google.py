@@ -1,17 +1,130 @@
 from app.core.config import google as google_conf
+from app.utils.social_login.http_client import PooledOAuth2Client
+from typing import Optional
 
-from authlib.integrations.starlette_client import OAuth
+from authlib.integrations.starlette_client import OAuth, StarletteRemoteApp, StartletteIntegration
+import httpx
 
+import asyncio
 import logging
+import time
 
 L = logging.getLogger("uvicorn.error")
 
+# `refresh_server_metadata` caller that always fetches, e.g. the background refresher
+REFRESH_ALWAYS = object()
+
+
+class PooledStarletteIntegration(StartletteIntegration):
+    oauth2_client_cls = PooledOAuth2Client
+
+
+class CachedMetadataRemoteApp(StarletteRemoteApp):
+    """
+    Remote app reusing its discovery document and signing keys (JWKS) for `GOOGLE_METADATA_TTL_SECONDS`
+
+    authlib fetches them once, and only fetches the keys again when an ID token does not verify; here both are
+    fetched together, by a single caller at a time, once stale. The background refresher of `GoogleLogin` keeps
+    them fresh, so that a login does not wait for them. A failed refresh keeps the stale metadata in use, and is
+    not tried again by the logins for `failure_backoff` seconds.
+    """
+
+    refresh_lock: Optional[asyncio.Lock] = None
+    # refreshes attempted so far, successful or not
+    refresh_attempts: int = 0
+    failure_backoff: float = 30
+    retry_at: float = 0
+
+    async def load_server_metadata(self):
+        loaded_at = self.server_metadata.get("_loaded_at")
+        if not self._server_metadata_url or (
+                loaded_at is not None and time.time() - loaded_at < google_conf.GOOGLE_METADATA_TTL_SECONDS
+        ):
+            return self.server_metadata
+
+        if loaded_at is not None and time.time() < self.retry_at:
+            return self.server_metadata
+
+        try:
+            await self.refresh_server_metadata(self.refresh_attempts)
+        except (httpx.HTTPError, ValueError) as err:
+            if loaded_at is None:
+                raise
+            L.warning(f"Google metadata refresh failed, the stale one is still used: {err!r}")
+
+        if "_loaded_at" not in self.server_metadata:
+            # another caller's refresh failed meanwhile
+            raise ValueError("The Google openid configuration could not be loaded")
+        return self.server_metadata
+
+    async def refresh_server_metadata(self, attempts=REFRESH_ALWAYS) -> None:
+        """ Fetch the discovery document and its signing keys, then replace the metadata in use
+
+        :param attempts: `refresh_attempts` read by the caller: nothing is fetched if another caller has attempted a
+            refresh meanwhile, whether it succeeded or not
+        :return:
+        """
+        if self.refresh_lock is None:
+            self.refresh_lock = asyncio.Lock()
+
+        async with self.refresh_lock:
+            if attempts is not REFRESH_ALWAYS and attempts != self.refresh_attempts:
+                return
+
+            self.refresh_attempts += 1
+            try:
+                metadata = await self._fetch_server_metadata(self._server_metadata_url)
+                if "jwks_uri" not in metadata:
+                    raise ValueError("No jwks_uri in the Google openid configuration")
+
+                jwks = await self._fetch_server_metadata(metadata["jwks_uri"])
+                if not jwks.get("keys"):
+                    raise ValueError("No keys in the Google signing keys")
+            except Exception:
+                self.retry_at = time.time() + self.failure_backoff
+                raise
+
+            metadata["jwks"] = jwks
+            metadata["_loaded_at"] = time.time()
+            self.server_metadata.update(metadata)
+
+    async def _fetch_server_metadata(self, url):
+        # authlib takes any JSON answer, an error included, as the metadata
+        async with self._get_oauth_client() as client:
+            resp = await client.request('GET', url, withhold_token=True)
+            resp.raise_for_status()
+            metadata = resp.json()
+
+        if not isinstance(metadata, dict):
+            raise ValueError(f"Unexpected Google metadata from {url}")
+        return metadata
+
+
+class SharedOAuth(OAuth):
+    framework_client_cls = CachedMetadataRemoteApp
+    framework_integration_cls = PooledStarletteIntegration
+
+
+# registry of the whole application
+oauth = SharedOAuth()
+oauth.register(
+    name='google',
+    client_id=google_conf.GOOGLE_CLIENT_ID,
+    client_secret=google_conf.GOOGLE_CLIENT_SECRET,
+    server_metadata_url=google_conf.GOOGLE_CONF_URL,
+    client_kwargs={
+        'scope': 'openid email profile'
+    },
+)
+
 
 class GoogleLogin(object):
     """
     An asynchronous class to support the execution of google login
     """
 
+    refresher_task: Optional[asyncio.Task] = None
+
     def __init__(self, request):
         self.request = request
 
@@ -31,23 +144,43 @@ class GoogleLogin(object):
         pass
 
     async def oauth2connect(self) -> None:
-        """ Create the Oauth2 session connection to Google API
+        """ Use the Oauth2 registry of the application, where Google is registered
 
         :return:
         """
-        # initialize
-        self.oauth = OAuth()
-
-        # register into google registry
-        self.oauth.register(
-            name='google',
-            client_id=google_conf.GOOGLE_CLIENT_ID,
-            client_secret=google_conf.GOOGLE_CLIENT_SECRET,
-            server_metadata_url=google_conf.GOOGLE_CONF_URL,
-            client_kwargs={
-                'scope': 'openid email profile'
-            },
-        )
+        self.oauth = oauth
+
+    @classmethod
+    def start_refresher(cls) -> None:
+        """ Load the Google metadata, then keep it fresh in the background """
+        if cls.refresher_task is None and google_conf.GOOGLE_CLIENT_ID and google_conf.GOOGLE_CONF_URL:
+            cls.refresher_task = asyncio.ensure_future(cls._run_refresher())
+
+    @classmethod
+    async def stop_refresher(cls) -> None:
+        if cls.refresher_task is None:
+            return
+
+        cls.refresher_task.cancel()
+        try:
+            await cls.refresher_task
+        except asyncio.CancelledError:
+            pass
+        cls.refresher_task = None
+
+    @classmethod
+    async def _run_refresher(cls) -> None:
+        # a little ahead of the TTL, so that the logins never find it stale
+        interval = max(google_conf.GOOGLE_METADATA_TTL_SECONDS * 0.9, 1)
+        while True:
+            try:
+                await oauth.google.refresh_server_metadata()
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                # the metadata in use stays, and is fetched again by the next login once stale
+                L.warning(f"Google metadata refresh failed: {err!r}")
+            await asyncio.sleep(interval)
 
     async def get_authorized_and_redirected(self, redirect_uri):
         """ Get the Google's authorization URL and get redirected
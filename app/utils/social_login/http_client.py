@@ -0,0 +1,127 @@
+"""
+HTTP client shared by the social logins.
+
+Each login flow gets its own OAuth2 client, holding its own token, but all of them send their requests through one
+transport per worker, i.e. one pool of keep-alive connections to the providers, with connect/read timeouts and
+retries. Closing a client leaves the shared transport open; it is closed on shutdown.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import httpx
+from authlib.integrations.httpx_client import AsyncOAuth2Client
+
+from app.core.config import settings
+
+L = logging.getLogger("uvicorn.error")
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+RETRY_STATUS_CODES = (502, 503, 504)
+# failures once connected; the connection failures (`ConnectError`, `ConnectTimeout`) are retried by the wrapped
+# transport already
+RETRY_ERRORS = (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport of many clients: closing a client does not close it. Retries the idempotent requests failing once
+    connected (e.g. a read timeout) or with a 502/503/504 response; the connection failures of any request are
+    retried by the wrapped transport only, so that no request is tried more than `retries` + 1 times.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int = 0, backoff: float = 0.1):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+        self.counters = {"requests": 0, "retries": 0, "failures": 0}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        retries = self.retries if request.method in IDEMPOTENT_METHODS else 0
+        self.counters["requests"] += 1
+        for attempt in range(retries + 1):
+            if attempt:
+                self.counters["retries"] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as err:
+                if attempt == retries or not isinstance(err, RETRY_ERRORS):
+                    self.counters["failures"] += 1
+                    raise
+                L.warning(f"{request.method} {request.url.host} failed ({err!r}), retrying")
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                await response.aclose()
+                continue
+            return response
+
+    async def aclose(self) -> None:
+        # shared: see `SocialLoginHTTP.close_transport`
+        pass
+
+
+class PooledOAuth2Client(AsyncOAuth2Client):
+    """
+    OAuth2 client sending its requests through the shared transport (with its timeouts), unless told otherwise
+    """
+
+    # authlib drops the httpx kwargs it does not know of (`transport` among them)
+    SESSION_REQUEST_PARAMS = AsyncOAuth2Client.SESSION_REQUEST_PARAMS + ["transport"]
+
+    def __init__(self, *args, **kwargs):
+        for key, value in SocialLoginHTTP.client_kwargs().items():
+            kwargs.setdefault(key, value)
+        super().__init__(*args, **kwargs)
+
+
+class SocialLoginHTTP(object):
+    """
+    Shared transport of the social logins, opened at the first call
+    """
+
+    transport: Optional[SharedTransport] = None
+
+    @classmethod
+    def open_transport(cls, transport: Optional[httpx.AsyncBaseTransport] = None) -> SharedTransport:
+        """ Open the shared transport
+
+        :param transport: transport to wrap (e.g. a mock one); a pool of connections to the providers by default
+        :return:
+        """
+        if cls.transport is None:
+            if transport is None:
+                transport = httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(max_connections=settings.SOCIAL_LOGIN_HTTP_MAX_CONNECTIONS),
+                    retries=settings.SOCIAL_LOGIN_HTTP_RETRIES,
+                )
+            cls.transport = SharedTransport(transport, retries=settings.SOCIAL_LOGIN_HTTP_RETRIES)
+
+        return cls.transport
+
+    @classmethod
+    async def close_transport(cls) -> None:
+        if cls.transport is not None:
+            await cls.transport.transport.aclose()
+            cls.transport = None
+
+    @classmethod
+    def client_kwargs(cls) -> Dict:
+        """ httpx kwargs of the OAuth2 clients
+
+        :return:
+        """
+        return {
+            "transport": cls.open_transport(),
+            "timeout": httpx.Timeout(
+                settings.SOCIAL_LOGIN_HTTP_READ_TIMEOUT_SECONDS,
+                connect=settings.SOCIAL_LOGIN_HTTP_CONNECT_TIMEOUT_SECONDS,
+            ),
+        }
+
+    @classmethod
+    def stats(cls) -> Dict:
+        return dict(cls.transport.counters) if cls.transport is not None else {}
@@ -16,7 +16,7 @@ from starlette.responses import RedirectResponse
 from app.utils.social_login.facebook import FacebookLogin
 from app.utils.social_login.google import GoogleLogin
 from app.core.config import settings
-from app.utils.email_publisher import epub
+from app.utils.email_queue import EmailQueue
 import logging
 
 L = logging.getLogger("uvicorn.error")
@@ -66,7 +66,7 @@ async def login_web_post(
 
     # validate login input
     # may get error message only or with a link to trigger email validation sending
-    err_msg, evlink = await validate_login(user, password, request)
+    err_msg, evlink = await validate_login(session, user, password, request)
 
     # if invalid, send an error to the login page
     if err_msg is not None:
@@ -138,8 +138,8 @@ async def signup_web_post(
     # build payload to send an email
     email_payload = await build_email_payload(full_name, email, email_ver_link)
 
-    # Compose an email via Email Publisher Service
-    await epub.compose_and_wait(email_payload)
+    # Queue the email; the email worker sends it
+    await EmailQueue.enqueue(email_payload)
 
     success_msg = f"Registration success. We have sent a verification account link into your email. " \
                   f"(REMEMBER: The link will valid ONLY for {settings.EMAIL_VERIFICATION_EXPIRE_MINUTES} minutes)"
@@ -173,8 +173,8 @@ async def request_verification_email(
     # build payload to send an email
     email_payload = await build_email_payload(user.full_name, user.email, email_ver_link)
 
-    # Compose an email via Email Publisher Service
-    await epub.compose_and_wait(email_payload)
+    # Queue the email; the email worker sends it
+    await EmailQueue.enqueue(email_payload)
 
     return templates.TemplateResponse("auth/login.html", context={"request": request, "success_msg": success_msg})
 
@@ -260,9 +260,10 @@ async def login_facebook_callback(
 
     user_info = await facebook.get_token_and_wait()
 
-    # TODO: What happen when there is no response from facebook?
+    # Facebook could not be reached (after the retries), or refused the code
     if user_info is None:
-        pass
+        err_msg = "Facebook login failed, please try again."
+        return templates.TemplateResponse("auth/login.html", context={"request": request, "err_msg": err_msg})
 
     social_login_id = user_info["id"]  # use it as an identifier; for now, use it as the password
     email = user_info["email"]
@@ -1,17 +1,18 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.adapters.user.user import get_user_by_email, update_activation_status
+from app.db.adapters.user.user import get_user_by_email, load_hashed_password, update_activation_status
 from app.webapps.user.service import get_user
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 from typing import Optional, Dict
+from functools import partial
 from app.db.models import user as models
 from app.db.models.user import SignupBy, User
 from app.db.adapters.user.user import insert
-from app.core.security import verify_password, create_email_verification_token
-from app.db.adapters.user.user import update_session_login
+from app.core.security import create_email_verification_token, password_needs_rehash
+from app.db.adapters.user.user import update_session_login, save_rehashed_password
 from app.utils.common import get_root_url
 from app.utils.password_validator import PasswordValidator
-from app.core.security import get_password_hash
+from app.utils import PasswordHasher
 import logging
 
 L = logging.getLogger("uvicorn.error")
@@ -19,9 +20,10 @@ L = logging.getLogger("uvicorn.error")
 templates = Jinja2Templates(directory="app/templates")
 
 
-async def validate_login(user: User, password: str, request: Request) -> (str, str):
+async def validate_login(session: AsyncSession, user: User, password: str, request: Request) -> (str, str):
     """ Validate login data
 
+    :param session:
     :param user:
     :param password:
     :param request:
@@ -45,10 +47,15 @@ async def validate_login(user: User, password: str, request: Request) -> (str, s
         return (err_msg, None)
 
     # finally, check if password match? if not, inform that password is incorrect
-    if not verify_password(password, user.hashed_password):
+    hashed_password = await load_hashed_password(session, user.id)
+    if hashed_password is None or not await PasswordHasher.verify(password, hashed_password):
         err_msg = "Incorrect password."
         return (err_msg, None)
 
+    # move an outdated hash to the current cost, without delaying this login
+    if password_needs_rehash(hashed_password):
+        PasswordHasher.rehash_in_background(password, hashed_password, partial(save_rehashed_password, user))
+
     # otherwise, everything is OK.
     return None, None
 
@@ -146,7 +153,7 @@ async def save_new_user(session: AsyncSession, full_name: str, email: str, passw
     :return:
     """
     # hash password
-    hashed_password = get_password_hash(password)
+    hashed_password = await PasswordHasher.hash(password)
 
     # build user model
     new_user = models.User(
@@ -165,7 +172,7 @@ async def save_and_load_user(session: AsyncSession, email: str, full_name: str,
     # if not found, create user whis this credentials
     if user is None:
         # create a hash password
-        hashed_password = get_password_hash(social_login_id)  # use this social login ID as a password
+        hashed_password = await PasswordHasher.hash(social_login_id)  # use this social login ID as a password
 
         # build user model
         new_user = models.User(
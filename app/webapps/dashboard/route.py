@@ -3,7 +3,7 @@ from fastapi import Request, Depends, APIRouter, status
 from fastapi.templating import Jinja2Templates
 from starlette.responses import FileResponse, RedirectResponse
 from app.webapps import deps
-from app.webapps.dashboard.service import load_user_data, get_statistics
+from app.webapps.dashboard.service import load_user_data, StatisticsSnapshot
 from sqlalchemy.ext.asyncio import AsyncSession
 
 templates = Jinja2Templates(directory="app/templates")
@@ -30,22 +30,18 @@ async def dashboard(
 
     # TODO: create a dummy data
 
-    # Get user data from database
-    users = await load_user_data(session, order_desc=True)
+    # Get the latest 5 users from database
+    users = await load_user_data(session, limit=5, order_desc=True)
 
-    # get the total users before being limited
-    total_registered_users = len(users)
-
-    users = users[:5]  # limit only take the first 5 users
-
-    # get dashboard statistics
-    statistics = await get_statistics(session, total_registered_users)
+    # get dashboard statistics, from the shared snapshot
+    snapshot = await StatisticsSnapshot.get()
 
     return templates.TemplateResponse("general_pages/dashboard.html", {
         "request": request,
         "session": current_session,
         "users": users,
-        "statistics": statistics,
+        "statistics": snapshot["statistics"],
+        "statistics_as_of": snapshot["as_of"],
     })
 
 
@@ -1,66 +1,210 @@
-from typing import Dict, List
-from app.db.adapters.user.user import get_users, get_session_today, get_sessions_last_7days, get_unverified_users
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.db.adapters.user.user import get_users, get_user_statistics
+from app.db.adapters.activity.activity import get_daily_activity
+from app.db.session import async_session
+from app.utils import RedisClient
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime
+from datetime import datetime, timedelta
 from math import ceil
+import asyncio
+import json
+import logging
+import uuid
 
+L = logging.getLogger("uvicorn.error")
 
-async def load_user_data(session: AsyncSession, order_desc: bool = False) -> List:
-    """ Load user data with an optional parameter to order the results
-
-    :param session:
-    :param order_desc:
-    :return:
-    """
-    return await get_users(session, order_desc=order_desc)
 
-
-async def load_unverified_users_by_month(session: AsyncSession) -> List:
-    """ Load unverified list of users filtered by month
+async def load_user_data(session: AsyncSession, limit: Optional[int] = None, order_desc: bool = False) -> List:
+    """ Load user data with an optional parameter to limit and to order the results
 
     :param session:
+    :param limit:
+    :param order_desc:
     :return:
     """
-    # get this month
-    this_month = datetime.utcnow().month
+    return await get_users(session, limit=limit, order_desc=order_desc)
 
-    return await get_unverified_users(session, month=this_month)
 
+async def get_statistics(session: AsyncSession) -> Dict:
+    """ Load the summary of the statistic user data
 
-async def get_7days_total_avg_session(session: AsyncSession) -> int:
-    """ Extract 7 days backwards and count total number of active users each day, then get the average value
+    The user counts come from one aggregate query, the session counts from the daily activity rollup, which sees
+    every login rather than the latest session of each user. Read-only: the rollup is kept up to date in the
+    background by `ActivityRollup`.
 
     :param session:
     :return:
     """
-    # get the data
-    session_7days = await get_sessions_last_7days(session)
+    today = datetime.utcnow().date()
+    counts = await get_user_statistics(session, today=today)
 
-    # convert into a list
-    data_list = []
-    for data in session_7days:
-        data_list.append(data["total"])
+    activity = await get_daily_activity(session, start=today - timedelta(days=6), end=today)
+    active_users = {day["day"]: day["active_users"] for day in activity}
 
-    # calc average value and return
-    avg_session_users = sum(data_list) / len(data_list)
-    return int(ceil(avg_session_users))
+    statistics = {
+        "total_users": counts["total_users"],
+        "total_session_today": active_users.get(today, 0),
+        # average of active users per day, over the 7 days backwards
+        "total_session_7days": int(ceil(sum(active_users.values()) / 7)),
+        "total_unver_acc_tmonth": counts["total_unver_acc_tmonth"],
+    }
 
+    return statistics
 
-async def get_statistics(session: AsyncSession, total_users: int) -> Dict:
-    """ Load the summary of the statistic user data
 
-    :param session:
-    :param total_users:
-    :return:
+class StatisticsSnapshot(object):
     """
-    statistics = {
-        "total_users": total_users,
-        "total_session_today": len(await get_session_today(session)),
-        "total_session_7days": await get_7days_total_avg_session(session),
-        "total_unver_acc_tmonth": len(await load_unverified_users_by_month(session)),
-    }
+    Dashboard statistics, computed at most once per `DASHBOARD_STATS_TTL_SECONDS` by all workers together
 
-    return statistics
+    The snapshot is shared through Redis and kept in memory by every worker. Once older than the TTL, it is
+    still served for `DASHBOARD_STATS_STALE_SECONDS` while a single refresh runs in the background
+    (stale-while-revalidate); a Redis lock elects the worker running it, and the other requests of that worker
+    join the same refresh. A background refresher keeps it fresh, so dashboard loads barely ever wait for it.
+    """
+
+    key: str = "dashboard:statistics"
+    lock_key: str = "dashboard:statistics:lock"
+    snapshot: Optional[Dict] = None
+    refresh_task: Optional[asyncio.Task] = None
+    refresher_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def get(cls) -> Dict:
+        """ Get the statistics snapshot
+
+        :return: `statistics`, and `as_of`, the (UTC) datetime it has been computed at
+        """
+        if settings.DASHBOARD_STATS_TTL_SECONDS <= 0:
+            return await cls._compute()
+
+        snapshot = await cls._load()
+        if snapshot is None or cls._age(snapshot) >= cls._max_age():
+            # nothing servable yet: wait for the refresh
+            return await cls.refresh()
+
+        if cls._age(snapshot) >= settings.DASHBOARD_STATS_TTL_SECONDS:
+            # serve the stale snapshot, and refresh it for the next requests
+            cls._start_refresh()
+
+        return snapshot
+
+    @classmethod
+    async def refresh(cls) -> Dict:
+        """ Refresh the snapshot; concurrent calls within a worker share the same refresh
+
+        :return:
+        """
+        # shielded: a cancelled request does not cancel the refresh the other requests are waiting for
+        return await asyncio.shield(cls._start_refresh())
+
+    @classmethod
+    def start_refresher(cls) -> None:
+        """ Start refreshing the snapshot ahead of its expiry """
+        if cls.refresher_task is None and settings.DASHBOARD_STATS_TTL_SECONDS > 0:
+            cls.refresher_task = asyncio.ensure_future(cls._run_refresher())
+
+    @classmethod
+    async def stop_refresher(cls) -> None:
+        """ Stop the background refresher """
+        if cls.refresher_task is not None:
+            cls.refresher_task.cancel()
+            try:
+                await cls.refresher_task
+            except asyncio.CancelledError:
+                pass
+            cls.refresher_task = None
+
+    @classmethod
+    async def _run_refresher(cls) -> None:
+        interval = max(settings.DASHBOARD_STATS_TTL_SECONDS / 2, 1)
+        while True:
+            try:
+                snapshot = await cls._load()
+                if snapshot is None or cls._age(snapshot) >= settings.DASHBOARD_STATS_TTL_SECONDS:
+                    await cls.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # a failed refresh is logged by `_log_failure`; retry at the next tick
+                pass
+
+            await asyncio.sleep(interval)
+
+    @classmethod
+    def _start_refresh(cls) -> asyncio.Task:
+        if cls.refresh_task is None or cls.refresh_task.done():
+            cls.refresh_task = asyncio.ensure_future(cls._refresh())
+            cls.refresh_task.add_done_callback(cls._log_failure)
+
+        return cls.refresh_task
+
+    @classmethod
+    def _log_failure(cls, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            L.warning(f"Dashboard statistics refresh failed: {task.exception()}")
+
+    @classmethod
+    async def _refresh(cls) -> Dict:
+        lock_ttl = max(settings.DASHBOARD_STATS_TTL_SECONDS, 1)
+        token = uuid.uuid4().hex
+        locked = await RedisClient.set(cls.lock_key, token, lock_ttl, nx=True)
+
+        # another worker is already on it (rather than Redis being unreachable): keep serving what we have,
+        # as long as it is servable
+        if not locked and cls.snapshot is not None and cls._age(cls.snapshot) < cls._max_age():
+            if await RedisClient.get(cls.lock_key):
+                return cls.snapshot
+
+        try:
+            snapshot = await cls._compute()
+            cls.snapshot = snapshot
+            await RedisClient.set(cls.key, cls._dump(snapshot), cls._max_age())
+        finally:
+            # only our own lock: it may have expired during a long computation, and been taken by another worker
+            if locked:
+                await RedisClient.release_lock(cls.lock_key, token)
+
+        return snapshot
+
+    @classmethod
+    async def _compute(cls) -> Dict:
+        # own session: a background refresh outlives the request that triggered it
+        async with async_session() as session:
+            statistics = await get_statistics(session)
+
+        return {"statistics": statistics, "as_of": datetime.utcnow()}
+
+    @classmethod
+    async def _load(cls) -> Optional[Dict]:
+        # the snapshot in memory is enough while fresh; otherwise another worker may have refreshed it
+        if cls.snapshot is not None and cls._age(cls.snapshot) < settings.DASHBOARD_STATS_TTL_SECONDS:
+            return cls.snapshot
+
+        data = await RedisClient.get(cls.key)
+        if data:
+            snapshot = cls._parse(data)
+            if cls.snapshot is None or snapshot["as_of"] > cls.snapshot["as_of"]:
+                cls.snapshot = snapshot
+
+        return cls.snapshot
+
+    @classmethod
+    def _age(cls, snapshot: Dict) -> float:
+        return (datetime.utcnow() - snapshot["as_of"]).total_seconds()
+
+    @classmethod
+    def _max_age(cls) -> int:
+        return settings.DASHBOARD_STATS_TTL_SECONDS + settings.DASHBOARD_STATS_STALE_SECONDS
+
+    @classmethod
+    def _dump(cls, snapshot: Dict) -> str:
+        return json.dumps({"statistics": snapshot["statistics"], "as_of": snapshot["as_of"].isoformat()})
+
+    @classmethod
+    def _parse(cls, data: str) -> Dict:
+        snapshot = json.loads(data)
+        return {"statistics": snapshot["statistics"], "as_of": datetime.fromisoformat(snapshot["as_of"])}
 
 
 async def dummy_traffic_data() -> Dict:
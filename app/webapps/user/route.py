@@ -1,12 +1,13 @@
 from typing import Optional
 from fastapi import Request, Depends, APIRouter, status, Form
 from fastapi.templating import Jinja2Templates
-from starlette.responses import RedirectResponse
+from starlette.responses import JSONResponse, RedirectResponse
 from app.webapps import deps
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.webapps.user.service import get_user, validate_ch_passwd, update_password, update_full_name
+from app.webapps.user.service import (
+    get_user, validate_ch_passwd, update_password, update_full_name, load_users_datatable
+)
 from app.db.models.user import SignupBy
-from app.db.adapters.user.user import get_users
 
 templates = Jinja2Templates(directory="app/templates")
 router = APIRouter(include_in_schema=False)
@@ -16,13 +17,12 @@ router = APIRouter(include_in_schema=False)
 async def users(
         request: Request,
         current_session: Optional[dict] = Depends(deps.get_current_session),  # prevent to access without active session
-        session: AsyncSession = Depends(deps.get_session),
 ):
     """ Show list of all registered users if the session found, otherwise redirected into a login page
+        The rows are loaded page by page from `users_datatable`
 
     :param request:
     :param current_session:
-    :param session:
     :return:
     """
     if current_session is None:
@@ -30,12 +30,28 @@ async def users(
 
         return RedirectResponse(url=redirect_uri, status_code=status.HTTP_302_FOUND)
 
-    # Get user data from database
-    users = await get_users(session)
-
     return templates.TemplateResponse("user/datatable.html", {"request": request,
-                                                              "session": current_session,
-                                                              "users": users})
+                                                              "session": current_session})
+
+
+@router.get("/users/datatable")
+async def users_datatable(
+        request: Request,
+        current_session: Optional[dict] = Depends(deps.get_current_session),  # prevent to access without active session
+        session: AsyncSession = Depends(deps.get_session),
+):
+    """ One page of registered users for the DataTables server-side processing of `user/datatable.html`
+
+    :param request:
+    :param current_session:
+    :param session:
+    :return:
+    """
+    if current_session is None:
+        return JSONResponse({"error": "Your session has expired, please login again."},
+                            status_code=status.HTTP_401_UNAUTHORIZED)
+
+    return await load_users_datatable(session, request.query_params)
 
 
 @router.get("/ch-passwd")
@@ -91,7 +107,7 @@ async def changed_passwd_post(
     user = await get_user(session, current_session["email"])
 
     # start validating email
-    err_msg = await validate_ch_passwd(user, old_password, new_password, new_password_again)
+    err_msg = await validate_ch_passwd(session, user, old_password, new_password, new_password_again)
 
     # if invalid, send an error to the login page
     if err_msg is not None:
@@ -1,15 +1,21 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Request
-from app.db.adapters.user.user import get_user_by_email
-from typing import Optional, Dict
+from app.db.adapters.user.user import (
+    get_user_by_email, load_hashed_password, count_all_users, count_users, search_users,
+)
+from typing import Optional, Dict, Mapping
 from app.db.models.user import User, SignupBy
 from app.db.adapters.user.user import update_current_password, update_current_full_name
 from app.utils.password_validator import PasswordValidator
-from app.core.security import get_password_hash, verify_password
+from app.utils import PasswordHasher
 import logging
 
 L = logging.getLogger("uvicorn.error")
 
+# columns of `user/datatable.html`, in their order
+DATATABLE_COLUMNS = ("id", "full_name", "email", "signup_by", "total_login", "session_at", "activated")
+DATATABLE_MAX_LENGTH = 100
+
 
 async def get_user(session: AsyncSession, email: str) -> Optional[User]:
     """ Get one user record by a given mail
@@ -22,10 +28,13 @@ async def get_user(session: AsyncSession, email: str) -> Optional[User]:
     return await get_user_by_email(session, email)
 
 
-async def validate_ch_passwd(user: User, pass_old: str, pass_new: str, pass_new_again: str) -> Optional[str]:
+async def validate_ch_passwd(
+        session: AsyncSession, user: User, pass_old: str, pass_new: str, pass_new_again: str
+) -> Optional[str]:
     """ Validate Change password data
 
     :param session:
+    :param user:
     :param pass_old:
     :param pass_new:
     :param pass_new_again:
@@ -36,7 +45,8 @@ async def validate_ch_passwd(user: User, pass_old: str, pass_new: str, pass_new_
         return f"You cannot change the password when you registered with {user.signup_by}."
 
     # if old password did not match
-    if not verify_password(pass_old, user.hashed_password):
+    hashed_password = await load_hashed_password(session, user.id)
+    if hashed_password is None or not await PasswordHasher.verify(pass_old, hashed_password):
         return "Incorrect old password."
 
     # validate NEW password quality
@@ -57,7 +67,7 @@ async def validate_ch_passwd(user: User, pass_old: str, pass_new: str, pass_new_
 
 async def update_password(session: AsyncSession, user: User, new_password: str) -> None:
     # hash password
-    hash_password = get_password_hash(new_password)
+    hash_password = await PasswordHasher.hash(new_password)
 
     await update_current_password(session, user, hash_password)
 
@@ -75,3 +85,45 @@ async def update_full_name(session: AsyncSession, user: User, full_name: str,
     await update_current_full_name(session, user, full_name)
 
     return current_session
+
+
+async def load_users_datatable(session: AsyncSession, params: Mapping[str, str]) -> Dict:
+    """ Load one page of users, following the DataTables server-side processing protocol
+
+    See https://datatables.net/manual/server-side; only the first ordering column is applied, and the search
+    matches a prefix of the full name or the email. `recordsTotal` (and `recordsFiltered` without a search) is the
+    query planner estimate on PostgreSQL; the search matches are counted exactly.
+
+    :param session:
+    :param params: query parameters sent by DataTables
+    :return:
+    """
+    draw = _to_int(params.get("draw"), 0)
+    offset = max(_to_int(params.get("start"), 0), 0)
+    length = _to_int(params.get("length"), 20)
+    if length <= 0 or length > DATATABLE_MAX_LENGTH:  # -1 stands for "all" in DataTables
+        length = DATATABLE_MAX_LENGTH
+
+    column_index = _to_int(params.get("order[0][column]"), 0)
+    order_by = DATATABLE_COLUMNS[column_index] if 0 <= column_index < len(DATATABLE_COLUMNS) else "id"
+    order_desc = params.get("order[0][dir]") == "desc"
+    search = (params.get("search[value]") or "").strip() or None
+
+    # the table total, on every draw, is the planner estimate on PostgreSQL: no full table count for a page turn
+    total, _ = await count_all_users(session, [], "estimated")
+    filtered = total if search is None else await count_users(session, search)
+    users = await search_users(session, offset, length, order_by=order_by, order_desc=order_desc, search=search)
+
+    return {
+        "draw": draw,
+        "recordsTotal": total,
+        "recordsFiltered": filtered,
+        "data": [dict(user) for user in users],
+    }
+
+
+def _to_int(value: Optional[str], default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default